@@ -0,0 +1,26 @@
+"""short code block sequence
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '002'
+down_revision: Union[str, None] = '001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Each value is one block of SHORT_CODE_BLOCK_SIZE ids leased by a worker
+    op.execute(sa.schema.CreateSequence(sa.Sequence('short_code_block_seq', start=1)))
+
+
+def downgrade() -> None:
+    op.execute(sa.schema.DropSequence(sa.Sequence('short_code_block_seq')))
@@ -0,0 +1,36 @@
+"""url click count
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '003'
+down_revision: Union[str, None] = '002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'urls',
+        sa.Column('click_count', sa.BigInteger(), server_default='0', nullable=False)
+    )
+    # Backfill from the raw clicks once; from here on counters are drained in
+    op.execute(
+        """
+        UPDATE urls SET click_count = c.total
+        FROM (SELECT url_id, count(*) AS total FROM clicks GROUP BY url_id) AS c
+        WHERE urls.id = c.url_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('urls', 'click_count')
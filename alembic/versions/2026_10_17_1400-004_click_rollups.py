@@ -0,0 +1,58 @@
+"""click rollups
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '004'
+down_revision: Union[str, None] = '003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Buckets are UTC without a zone, like the click records that feed them
+    op.create_table(
+        'click_rollups_hourly',
+        sa.Column('url_id', sa.Integer(), nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('clicks', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.ForeignKeyConstraint(['url_id'], ['urls.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('url_id', 'bucket')
+    )
+    op.create_table(
+        'click_rollups_daily',
+        sa.Column('url_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('clicks', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.ForeignKeyConstraint(['url_id'], ['urls.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('url_id', 'day')
+    )
+
+    # Backfill from the raw clicks once; from here on ingestion keeps them current
+    op.execute(
+        """
+        INSERT INTO click_rollups_hourly (url_id, bucket, clicks)
+        SELECT url_id, date_trunc('hour', clicked_at AT TIME ZONE 'UTC'), count(*)
+        FROM clicks GROUP BY 1, 2
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO click_rollups_daily (url_id, day, clicks)
+        SELECT url_id, bucket::date, sum(clicks)
+        FROM click_rollups_hourly GROUP BY 1, 2
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('click_rollups_daily')
+    op.drop_table('click_rollups_hourly')
@@ -0,0 +1,64 @@
+"""owner stats
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '005'
+down_revision: Union[str, None] = '004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'owner_click_rollups_daily',
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('clicks', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('owner_id', 'day')
+    )
+    op.create_table(
+        'owner_stats',
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('total_urls', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('active_urls', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_clicks', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('owner_id')
+    )
+
+    # Backfill from the URL rollups; from here on writes keep them current
+    op.execute(
+        """
+        INSERT INTO owner_click_rollups_daily (owner_id, day, clicks)
+        SELECT urls.owner_id, r.day, sum(r.clicks)
+        FROM click_rollups_daily r JOIN urls ON urls.id = r.url_id
+        GROUP BY 1, 2
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO owner_stats (owner_id, total_urls, active_urls, total_clicks)
+        SELECT urls.owner_id, count(*), count(*) FILTER (WHERE urls.is_active IS TRUE),
+               coalesce(sum(r.clicks), 0)
+        FROM urls
+        LEFT JOIN (
+            SELECT url_id, sum(clicks) AS clicks FROM click_rollups_daily GROUP BY url_id
+        ) AS r ON r.url_id = urls.id
+        GROUP BY urls.owner_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('owner_stats')
+    op.drop_table('owner_click_rollups_daily')
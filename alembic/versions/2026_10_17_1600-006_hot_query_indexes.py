@@ -0,0 +1,49 @@
+"""hot query indexes
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '006'
+down_revision: Union[str, None] = '005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY can't run in a transaction, but it keeps the tables writable
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_clicks_url_id_clicked_at', 'clicks', ['url_id', 'clicked_at', 'id'],
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_urls_owner_id_created_at', 'urls', ['owner_id', 'created_at', 'id'],
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_urls_owner_id_click_count', 'urls', ['owner_id', 'click_count'],
+            postgresql_concurrently=True
+        )
+        # original_url is varchar(2048), well inside the btree tuple limit
+        op.create_index(
+            'ix_urls_active_short_code', 'urls', ['short_code'],
+            postgresql_include=['id', 'owner_id', 'expires_at', 'is_active', 'original_url'],
+            postgresql_where=sa.text('is_active IS TRUE'),
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_urls_active_short_code', table_name='urls', postgresql_concurrently=True)
+        op.drop_index('ix_urls_owner_id_click_count', table_name='urls', postgresql_concurrently=True)
+        op.drop_index('ix_urls_owner_id_created_at', table_name='urls', postgresql_concurrently=True)
+        op.drop_index('ix_clicks_url_id_clicked_at', table_name='clicks', postgresql_concurrently=True)
@@ -0,0 +1,111 @@
+"""partition clicks by month
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-17 17:00:00.000000
+
+Rebuilds clicks as a table range-partitioned on clicked_at, one partition
+per UTC month, and copies the existing rows across in one statement. The
+copy holds a lock on the old table for its duration, so run it in a
+maintenance window if clicks is large. From here on app.partitions keeps
+future months created.
+"""
+from datetime import date, datetime
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '007'
+down_revision: Union[str, None] = '006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+
+COLUMNS = "id, url_id, ip_address, user_agent, referrer, country, clicked_at"
+
+
+def _add_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE clicks RENAME TO clicks_unpartitioned")
+    op.execute("ALTER INDEX clicks_pkey RENAME TO clicks_unpartitioned_pkey")
+    op.execute("ALTER INDEX ix_clicks_id RENAME TO ix_clicks_unpartitioned_id")
+    op.execute("ALTER INDEX ix_clicks_url_id_clicked_at RENAME TO ix_clicks_unpartitioned_url_id_clicked_at")
+    # Keep the id sequence when the old table is dropped
+    op.execute("ALTER SEQUENCE clicks_id_seq OWNED BY NONE")
+
+    op.execute(
+        """
+        CREATE TABLE clicks (
+            id INTEGER NOT NULL DEFAULT nextval('clicks_id_seq'),
+            url_id INTEGER NOT NULL REFERENCES urls (id) ON DELETE CASCADE,
+            ip_address VARCHAR(45),
+            user_agent VARCHAR(512),
+            referrer VARCHAR(512),
+            country VARCHAR(2),
+            clicked_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, clicked_at)
+        ) PARTITION BY RANGE (clicked_at)
+        """
+    )
+    op.execute("ALTER SEQUENCE clicks_id_seq OWNED BY clicks.id")
+    op.create_index('ix_clicks_id', 'clicks', ['id'])
+    op.create_index('ix_clicks_url_id_clicked_at', 'clicks', ['url_id', 'clicked_at', 'id'])
+
+    # One partition per month from the oldest click to a few months ahead
+    oldest = op.get_bind().execute(sa.text(
+        "SELECT min(clicked_at AT TIME ZONE 'UTC') FROM clicks_unpartitioned"
+    )).scalar()
+    today = datetime.utcnow().date()
+    month = (oldest.date() if oldest else today).replace(day=1)
+    last = today.replace(day=1)
+    for _ in range(MONTHS_AHEAD):
+        last = _add_month(last)
+    while month <= last:
+        upper = _add_month(month)
+        op.execute(
+            f"CREATE TABLE clicks_p{month:%Y%m} PARTITION OF clicks "
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{upper.isoformat()} 00:00:00+00')"
+        )
+        month = upper
+
+    op.execute(
+        f"INSERT INTO clicks ({COLUMNS}) "
+        f"SELECT id, url_id, ip_address, user_agent, referrer, country, coalesce(clicked_at, now()) "
+        f"FROM clicks_unpartitioned"
+    )
+    op.execute("DROP TABLE clicks_unpartitioned")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE clicks RENAME TO clicks_partitioned")
+    op.execute("ALTER INDEX clicks_pkey RENAME TO clicks_partitioned_pkey")
+    op.execute("ALTER INDEX ix_clicks_id RENAME TO ix_clicks_partitioned_id")
+    op.execute("ALTER INDEX ix_clicks_url_id_clicked_at RENAME TO ix_clicks_partitioned_url_id_clicked_at")
+    op.execute("ALTER SEQUENCE clicks_id_seq OWNED BY NONE")
+
+    op.execute(
+        """
+        CREATE TABLE clicks (
+            id INTEGER NOT NULL DEFAULT nextval('clicks_id_seq') PRIMARY KEY,
+            url_id INTEGER NOT NULL REFERENCES urls (id) ON DELETE CASCADE,
+            ip_address VARCHAR(45),
+            user_agent VARCHAR(512),
+            referrer VARCHAR(512),
+            country VARCHAR(2),
+            clicked_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+        )
+        """
+    )
+    op.execute("ALTER SEQUENCE clicks_id_seq OWNED BY clicks.id")
+    op.create_index('ix_clicks_id', 'clicks', ['id'])
+    op.create_index('ix_clicks_url_id_clicked_at', 'clicks', ['url_id', 'clicked_at', 'id'])
+
+    op.execute(f"INSERT INTO clicks ({COLUMNS}) SELECT {COLUMNS} FROM clicks_partitioned")
+    # Drops every partition with it
+    op.execute("DROP TABLE clicks_partitioned")
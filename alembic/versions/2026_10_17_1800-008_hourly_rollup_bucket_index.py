@@ -0,0 +1,31 @@
+"""hourly rollup bucket index
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-17 18:00:00.000000
+
+Lets the retention job find expired hourly buckets without scanning the
+whole table on every batch.
+"""
+from typing import Sequence, Union
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '008'
+down_revision: Union[str, None] = '007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_click_rollups_hourly_bucket', 'click_rollups_hourly', ['bucket'],
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_click_rollups_hourly_bucket', table_name='click_rollups_hourly', postgresql_concurrently=True)
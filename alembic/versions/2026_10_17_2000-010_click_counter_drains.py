@@ -0,0 +1,30 @@
+"""click counter drains
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '010'
+down_revision: Union[str, None] = '009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'click_counter_drains',
+        sa.Column('drain_id', sa.String(length=64), nullable=False),
+        sa.Column('applied_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.PrimaryKeyConstraint('drain_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('click_counter_drains')
@@ -0,0 +1,36 @@
+"""import jobs
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-17 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '011'
+down_revision: Union[str, None] = '010'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'import_jobs',
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('job_id', sa.String(length=64), nullable=False),
+        sa.Column('rows', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('imported', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('failed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('status', sa.String(length=16), nullable=False, server_default='running'),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('owner_id', 'job_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('import_jobs')
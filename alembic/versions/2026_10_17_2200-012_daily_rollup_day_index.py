@@ -0,0 +1,31 @@
+"""daily rollup day index
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-17 22:00:00.000000
+
+Lets the click count reconcile find the URLs clicked since its last pass
+without scanning the whole table.
+"""
+from typing import Sequence, Union
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '012'
+down_revision: Union[str, None] = '011'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_click_rollups_daily_day', 'click_rollups_daily', ['day'],
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_click_rollups_daily_day', table_name='click_rollups_daily', postgresql_concurrently=True)
@@ -0,0 +1,29 @@
+"""clicks default partition
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-17 23:00:00.000000
+
+Catches clicks whose month has no partition, such as late or replayed
+clicks for a month retention already dropped, so they no longer fail the
+whole batch they arrive in. Retention deletes them like any other expired
+click.
+"""
+from typing import Sequence, Union
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '013'
+down_revision: Union[str, None] = '012'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE TABLE IF NOT EXISTS clicks_default PARTITION OF clicks DEFAULT")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE clicks DETACH PARTITION clicks_default")
+    op.execute("DROP TABLE clicks_default")
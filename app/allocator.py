@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import string
+from sqlalchemy import text
+
+from app.cache import cache
+from app.database import AsyncSessionLocal
+from app.utils import generate_short_code
+from app.config import settings
+
+ALPHABET = string.ascii_letters + string.digits
+BLOCK_SEQUENCE = "short_code_block_seq"
+BLOCK_COUNTER_KEY = "short_code:id_counter"
+
+
+def encode_base62(number: int, length: int) -> str:
+    """Fixed-length base62 encoding using the short code alphabet"""
+    chars = []
+    for _ in range(length):
+        number, rem = divmod(number, len(ALPHABET))
+        chars.append(ALPHABET[rem])
+    return "".join(reversed(chars))
+
+
+class FeistelPermutation:
+    """Keyed bijection over [0, domain)
+
+    A balanced Feistel network permutes the smallest even-width bit space
+    covering the domain; values that land outside it are fed through again
+    (cycle walking), which keeps the mapping a bijection on the domain.
+    """
+
+    def __init__(self, key: bytes, domain: int, rounds: int = 8):
+        self.key = key
+        self.domain = domain
+        self.rounds = rounds
+        self.half_bits = ((domain - 1).bit_length() + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+
+    def _round(self, i: int, value: int) -> int:
+        digest = hashlib.blake2b(
+            bytes([i]) + value.to_bytes(8, "big"), key=self.key, digest_size=8
+        ).digest()
+        return int.from_bytes(digest, "big") & self.half_mask
+
+    def _forward(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.half_mask
+        for i in range(self.rounds):
+            left, right = right, left ^ self._round(i, right)
+        return (left << self.half_bits) | right
+
+    def _backward(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.half_mask
+        for i in reversed(range(self.rounds)):
+            left, right = right ^ self._round(i, left), left
+        return (left << self.half_bits) | right
+
+    def permute(self, value: int) -> int:
+        value = self._forward(value)
+        while value >= self.domain:
+            value = self._forward(value)
+        return value
+
+    def invert(self, value: int) -> int:
+        value = self._backward(value)
+        while value >= self.domain:
+            value = self._backward(value)
+        return value
+
+
+class ShortCodeAllocator:
+    """Hands out collision-free short codes from leased blocks of IDs
+
+    Each worker leases a block of sequential IDs at a time, from a Postgres
+    sequence or a Redis counter, and maps every ID through a keyed Feistel
+    permutation of the SHORT_CODE_LENGTH base62 space. Distinct IDs always
+    give distinct codes, and consecutive IDs give unrelated-looking ones.
+    The permutation key must never change once codes have been issued.
+    """
+
+    def __init__(self, length: int, key: bytes, block_size: int, source: str):
+        self.length = length
+        self.block_size = block_size
+        self.source = source
+        self.permutation = FeistelPermutation(key, len(ALPHABET) ** length)
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+        self.blocks_leased = 0
+
+    async def _lease_block(self) -> int:
+        if self.source == "redis":
+            if not cache.redis_client:
+                await cache.connect()
+            end = await cache.redis_client.incrby(BLOCK_COUNTER_KEY, self.block_size)
+            return end - self.block_size
+
+        async with AsyncSessionLocal() as session:
+            block = await session.scalar(text(f"SELECT nextval('{BLOCK_SEQUENCE}')"))
+        return block * self.block_size
+
+    async def next_id(self) -> int:
+        async with self._lock:
+            if self._next >= self._end:
+                self._next = await self._lease_block()
+                self._end = self._next + self.block_size
+                self.blocks_leased += 1
+            value = self._next
+            self._next += 1
+
+        if value >= self.permutation.domain:
+            raise RuntimeError("Short code space exhausted; increase SHORT_CODE_LENGTH")
+        return value
+
+    async def next_code(self) -> str:
+        return encode_base62(self.permutation.permute(await self.next_id()), self.length)
+
+    def get_stats(self) -> dict:
+        return {
+            "source": self.source,
+            "blocks_leased": self.blocks_leased,
+            "remaining_in_block": max(0, self._end - self._next),
+        }
+
+
+# Global short code allocator
+short_code_allocator = ShortCodeAllocator(
+    length=settings.SHORT_CODE_LENGTH,
+    key=hashlib.sha256(
+        (settings.SHORT_CODE_PERMUTATION_KEY or settings.SECRET_KEY).encode("utf-8")
+    ).digest()[:32],
+    block_size=settings.SHORT_CODE_BLOCK_SIZE,
+    source=settings.SHORT_CODE_ID_SOURCE,
+)
+
+
+async def allocate_short_code() -> str:
+    """Next candidate short code from the configured strategy"""
+    if settings.SHORT_CODE_STRATEGY == "random":
+        return generate_short_code()
+    return await short_code_allocator.next_code()
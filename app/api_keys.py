@@ -0,0 +1,140 @@
+"""API keys for machine clients
+
+A key looks like usk_<prefix>_<secret>. The prefix is stored in the clear
+under a unique index, so a key is found with one indexed query; the secret
+never is. What is stored is HMAC-SHA256 of the whole key under a server
+side key, compared in constant time. Keys carry 256 bits of randomness, so
+a fast keyed hash is as safe as bcrypt for them and costs microseconds.
+
+Verified keys are cached by their hash (local cache, then Redis) as the
+owner's username; the principal itself comes from the principal cache, so
+deactivating a user locks out their keys as well as their tokens.
+"""
+import hashlib
+import hmac
+import secrets
+import string
+from typing import NamedTuple, Optional
+from sqlalchemy import select
+
+from app.cache import cache, ENTRY_OVERHEAD_BYTES
+from app.models import ApiKey, User
+from app.config import settings
+
+KEY_SCHEME = "usk"
+PREFIX_LENGTH = 12
+PREFIX_ALPHABET = string.ascii_lowercase + string.digits
+
+HMAC_KEY = hashlib.sha256(
+    b"api-key:" + (settings.API_KEY_HMAC_KEY or settings.SECRET_KEY).encode("utf-8")
+).digest()
+
+
+class NewKey(NamedTuple):
+    key: str
+    prefix: str
+    key_hash: str
+
+
+def generate_key() -> NewKey:
+    prefix = "".join(secrets.choice(PREFIX_ALPHABET) for _ in range(PREFIX_LENGTH))
+    key = f"{KEY_SCHEME}_{prefix}_{secrets.token_urlsafe(32)}"
+    return NewKey(key, prefix, hash_key(key))
+
+
+def hash_key(key: str) -> str:
+    return hmac.new(HMAC_KEY, key.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def key_prefix(key: str) -> Optional[str]:
+    """The lookup prefix of a well-formed key, None for anything else"""
+    parts = key.split("_", 2)
+    if len(parts) != 3 or parts[0] != KEY_SCHEME or len(parts[1]) != PREFIX_LENGTH or not parts[2]:
+        return None
+    return parts[1]
+
+
+def is_api_key(credential: str) -> bool:
+    return credential.startswith(f"{KEY_SCHEME}_")
+
+
+def api_key_cache_key(key_hash: str) -> str:
+    return f"apikey:{key_hash}"
+
+
+class ApiKeyVerifier:
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.db_lookups = 0
+        self.failures = 0
+
+    async def verify(self, db, key: str) -> Optional[str]:
+        """Username owning an active key, or None"""
+        prefix = key_prefix(key)
+        if prefix is None:
+            self.failures += 1
+            return None
+
+        key_hash = hash_key(key)
+        cache_key = api_key_cache_key(key_hash)
+        username = cache.local.get(cache_key)
+        if isinstance(username, str):
+            self.local_hits += 1
+            return username
+
+        if not cache.redis_client:
+            await cache.connect()
+
+        try:
+            username = await cache.redis_client.get(cache_key)
+        except Exception as e:
+            print(f"Redis GET api key error: {e}")
+            username = None
+
+        if username:
+            self.redis_hits += 1
+        else:
+            self.db_lookups += 1
+            row = (await db.execute(
+                select(ApiKey.key_hash, User.username)
+                .join(User, User.id == ApiKey.user_id)
+                .where(ApiKey.prefix == prefix, ApiKey.is_active.is_(True))
+            )).first()
+            if row is None or not hmac.compare_digest(row.key_hash, key_hash):
+                self.failures += 1
+                return None
+
+            username = row.username
+            try:
+                await cache.redis_client.setex(cache_key, self.ttl, username)
+            except Exception as e:
+                print(f"Redis SET api key error: {e}")
+
+        cache.local.set(cache_key, username, size=len(cache_key) + len(username) + ENTRY_OVERHEAD_BYTES, ttl=self.ttl)
+        return username
+
+    async def revoke(self, key_hash: str):
+        """Forget a verified key on every worker"""
+        if not cache.redis_client:
+            await cache.connect()
+
+        try:
+            await cache.redis_client.delete(api_key_cache_key(key_hash))
+        except Exception as e:
+            print(f"Redis DELETE api key error: {e}")
+
+        await cache.invalidate_local(api_key_cache_key(key_hash))
+
+    def get_stats(self) -> dict:
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "db_lookups": self.db_lookups,
+            "failures": self.failures,
+        }
+
+
+# Global API key verifier
+api_key_verifier = ApiKeyVerifier(ttl=settings.API_KEY_CACHE_TTL_SECONDS)
@@ -0,0 +1,330 @@
+import asyncio
+import hashlib
+import math
+from typing import Optional
+from sqlalchemy import select
+
+from app.cache import cache
+from app.database import AsyncSessionLocal
+from app.models import URL
+from app.config import settings
+
+# Each layer holds twice the codes of the one before at half the error
+# rate, so the combined false positive rate stays under twice the first
+# layer's however many layers are added.
+GROWTH = 2
+TIGHTENING = 0.5
+BUILD_LOCK_MS = 600000
+BUILD_POLL_SECONDS = 1
+# Codes a layer must have been open for before its key has to exist; workers
+# whose count lags the shared one are still writing to the layer below
+LAYER_SLACK = 1000
+
+
+def code_hashes(short_code: str) -> tuple[int, int]:
+    digest = hashlib.blake2b(short_code.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big") | 1
+
+
+class BloomLayer:
+    """One fixed-size Bloom filter, laid out like SETBIT/GETBIT see it"""
+
+    def __init__(self, prefix: str, index: int, capacity: int, error_rate: float):
+        bits = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.size = (bits + 7) // 8 * 8
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.key = f"{prefix}:{index}:{self.size}:{self.hashes}"
+        self.bits = bytearray(self.size // 8)
+
+    def positions(self, hashes: tuple[int, int]) -> list[int]:
+        h1, h2 = hashes
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def contains(self, hashes: tuple[int, int]) -> bool:
+        for pos in self.positions(hashes):
+            if not self.bits[pos >> 3] & (0x80 >> (pos & 7)):
+                return False
+        return True
+
+    def set(self, bits: bytearray, hashes: tuple[int, int]):
+        for pos in self.positions(hashes):
+            bits[pos >> 3] |= 0x80 >> (pos & 7)
+
+    def merge(self, data: bytes):
+        # Keep bits added by the invalidation listener while we were loading
+        data = data.ljust(len(self.bits), b"\x00")[:len(self.bits)]
+        merged = int.from_bytes(data, "big") | int.from_bytes(self.bits, "big")
+        self.bits = bytearray(merged.to_bytes(len(self.bits), "big"))
+
+
+class ShortCodeBloom:
+    """Scalable Bloom filter of every existing short code
+
+    The canonical bitmaps live in Redis, one key per layer, and each worker
+    keeps a local mirror so membership checks never leave the process. New
+    codes go into the newest layer; once the shared count of codes passes
+    the layers' combined capacity a larger layer is started, so the false
+    positive rate holds as the table grows. New codes are set in Redis and
+    announced on the cache invalidation channel, which every worker already
+    listens to.
+
+    A code missing from the filter would 404 for good, so nothing may drop
+    one: Redis writes that fail are retried in the background until they
+    land, and the mirror is reloaded from Redis whenever the invalidation
+    listener reconnects, since announcements sent meanwhile are lost. The
+    filter is built from the DB by one worker at a time, and rebuilt if a
+    layer key it implies has gone missing from Redis.
+
+    Bloom filters cannot forget: deleted codes keep their bits and only add
+    false positives, which callers resolve with a normal lookup. Changing the
+    capacity or error rate in Settings gives new keys, rebuilt from the DB.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.key = f"bloom:short_codes:{capacity}:{error_rate}"
+        self.layers: list[BloomLayer] = []
+        self.count = 0
+        self.ready = False
+        self.rejections = 0
+        self.write_failures = 0
+        self.reloads = 0
+        self._unsaved: set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._retry_task: Optional[asyncio.Task] = None
+        self._layer(0)
+
+    def _layer(self, index: int) -> BloomLayer:
+        while len(self.layers) <= index:
+            n = len(self.layers)
+            self.layers.append(BloomLayer(
+                self.key, n, self.capacity * GROWTH ** n, self.error_rate * (1 - TIGHTENING) * TIGHTENING ** n
+            ))
+        return self.layers[index]
+
+    def layer_start(self, index: int) -> int:
+        """Count at which the layer starts taking codes"""
+        return sum(self.capacity * GROWTH ** i for i in range(index))
+
+    def layer_for(self, count: int) -> int:
+        """Layer the count-th code goes into"""
+        index, total = 0, self.capacity
+        while count >= total:
+            index += 1
+            total += self.capacity * GROWTH ** index
+        return index
+
+    def might_contain(self, short_code: str) -> bool:
+        """False means the code definitely does not exist"""
+        if not self.ready:
+            return True
+
+        hashes = code_hashes(short_code)
+        return any(layer.contains(hashes) for layer in self.layers)
+
+    def reject(self, short_code: str) -> bool:
+        """Like not might_contain, but counted for metrics"""
+        if self.might_contain(short_code):
+            return False
+        self.rejections += 1
+        return True
+
+    def _top(self) -> BloomLayer:
+        return self._layer(self.layer_for(self.count))
+
+    def add_local(self, short_code: str):
+        # Every worker, the creator included, sees each announcement once
+        layer = self._top()
+        layer.set(layer.bits, code_hashes(short_code))
+        self.count += 1
+
+    def queue_add(self, pipe, short_code: str):
+        """Set a new code's bits here and queue them for Redis on a pipeline"""
+        layer = self._top()
+        hashes = code_hashes(short_code)
+        layer.set(layer.bits, hashes)
+        for pos in layer.positions(hashes):
+            pipe.setbit(layer.key, pos, 1)
+        pipe.incr(f"{self.key}:count")
+
+    async def _write(self, short_codes):
+        pipe = cache.binary_client.pipeline(transaction=False)
+        for short_code in short_codes:
+            self.queue_add(pipe, short_code)
+            pipe.publish(settings.CACHE_INVALIDATION_CHANNEL, short_code)
+        await pipe.execute()
+
+    async def add(self, short_codes):
+        """Add and announce new codes, retrying in the background on failure"""
+        if not cache.redis_client:
+            await cache.connect()
+
+        try:
+            await self._write(short_codes)
+        except Exception as e:
+            print(f"Short code filter write error: {e}")
+            self.retry_later(short_codes)
+
+    def retry_later(self, short_codes):
+        """Keep codes whose Redis write failed and retry until it succeeds"""
+        self.write_failures += 1
+        self._unsaved.update(short_codes)
+        if self._retry_task is None or self._retry_task.done():
+            self._retry_task = asyncio.create_task(self._retry_unsaved())
+
+    async def _retry_unsaved(self):
+        delay = 1
+        while self._unsaved:
+            await asyncio.sleep(delay)
+            codes = list(self._unsaved)
+            try:
+                await self._write(codes)
+                self._unsaved.difference_update(codes)
+                delay = 1
+            except Exception as e:
+                print(f"Short code filter write error: {e}")
+                delay = min(delay * 2, 60)
+
+    async def start(self):
+        """Load or build the filter in the background; lookups pass until ready"""
+        cache.invalidation_hooks.append(self.add_local)
+        cache.reconnect_hooks.append(self.resync)
+        if self._task is None:
+            self._task = asyncio.create_task(self._load())
+
+    def resync(self):
+        """Reload from Redis; announcements may have been missed"""
+        if self._task is not None and not self._task.done():
+            return
+        self.ready = False
+        self.reloads += 1
+        self._task = asyncio.create_task(self._load())
+
+    async def stop(self):
+        for task in (self._task, self._retry_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._retry_task = None
+
+    async def _load(self):
+        try:
+            # One worker builds; the others wait for it and then fetch
+            while not await self._complete():
+                token = await cache.try_lock(f"{self.key}:build", BUILD_LOCK_MS)
+                if token is None:
+                    await asyncio.sleep(BUILD_POLL_SECONDS)
+                    continue
+                try:
+                    if not await self._complete():
+                        await self._build()
+                finally:
+                    await cache.release_lock(f"{self.key}:build", token)
+
+            await self._fetch()
+            self.ready = True
+            print(
+                f"✅ Short code filter ready ({len(self.layers)} layers, "
+                f"{sum(layer.size for layer in self.layers) // 8} bytes)"
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Short code filter load error: {e}")
+
+    async def _complete(self) -> bool:
+        """Whether Redis holds a finished build and every layer it implies
+
+        A layer key lost to eviction or a flush would leave codes out of
+        every mirror, so it counts as no build at all.
+        """
+        pipe = cache.binary_client.pipeline(transaction=False)
+        pipe.exists(f"{self.key}:built")
+        pipe.get(f"{self.key}:count")
+        built, count = await pipe.execute()
+        if not built:
+            return False
+
+        count = int(count or 0)
+        keys = [
+            self._layer(index).key
+            for index in range(self.layer_for(count) + 1)
+            if count and (index == 0 or self.layer_start(index) + LAYER_SLACK <= count)
+        ]
+        if not keys:
+            return True
+        if await cache.binary_client.exists(*keys) == len(keys):
+            return True
+
+        print("Short code filter is missing layers, rebuilding")
+        return False
+
+    async def _fetch(self):
+        """Merge every layer in Redis into the local mirror"""
+        count = int(await cache.binary_client.get(f"{self.key}:count") or 0)
+        self.count = max(self.count, count)
+        # One spare: a worker may already have started the next layer
+        for index in range(self.layer_for(self.count) + 2):
+            self._layer(index)
+
+        pipe = cache.binary_client.pipeline(transaction=False)
+        for layer in self.layers:
+            pipe.get(layer.key)
+        for layer, data in zip(self.layers, await pipe.execute()):
+            if data:
+                layer.merge(data)
+
+    async def _build(self):
+        """Stream every short code from the DB and publish the layers to Redis;
+        caller holds the build lock"""
+        bits = [bytearray(len(layer.bits)) for layer in self.layers]
+        count = 0
+
+        async with AsyncSessionLocal() as session:
+            codes = await session.stream_scalars(
+                select(URL.short_code).execution_options(yield_per=10000)
+            )
+            async for short_code in codes:
+                index = self.layer_for(count)
+                layer = self._layer(index)
+                while len(bits) <= index:
+                    bits.append(bytearray(len(self.layers[len(bits)].bits)))
+                layer.set(bits[index], code_hashes(short_code))
+                count += 1
+
+        # OR into the live keys so bits set by concurrent creates survive
+        pipe = cache.binary_client.pipeline(transaction=True)
+        for layer, layer_bits in zip(self.layers, bits):
+            tmp_key = f"{layer.key}:tmp"
+            pipe.set(tmp_key, bytes(layer_bits))
+            pipe.bitop("OR", layer.key, layer.key, tmp_key)
+            pipe.delete(tmp_key)
+        # Set, not added to, so a rebuild never inflates the count
+        pipe.set(f"{self.key}:count", count)
+        pipe.set(f"{self.key}:built", 1)
+        await pipe.execute()
+
+    def get_stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "layers": len(self.layers),
+            "count": self.count,
+            "capacity": sum(layer.capacity for layer in self.layers),
+            "bytes": sum(layer.size for layer in self.layers) // 8,
+            "rejections": self.rejections,
+            "write_failures": self.write_failures,
+            "unsaved": len(self._unsaved),
+            "reloads": self.reloads,
+        }
+
+
+# Global short code filter
+short_code_bloom = ShortCodeBloom(
+    capacity=settings.SHORT_CODE_BLOOM_CAPACITY,
+    error_rate=settings.SHORT_CODE_BLOOM_ERROR_RATE,
+)
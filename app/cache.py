@@ -1,13 +1,218 @@
+import asyncio
+import struct
+import time
+import uuid
 import redis.asyncio as redis
-from typing import Optional
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Iterable, NamedTuple, Optional, Union
 import json
 from app.config import settings
 
+# Bump when the packed layout changes; old keys are simply never read again
+# and age out on their TTL, so no flush is needed.
+URL_ENTRY_VERSION = 2
+URL_ENTRY_HEADER = struct.Struct(">BIIqB")  # version, url_id, owner_id, expires_at, flags
+FLAG_ACTIVE = 0x01
+ENTRY_OVERHEAD_BYTES = 64
+
+# Negative entries share the URL key so a single GET answers both cases
+TOMBSTONE_MARKER = 0xFF
+# Live disabled links need no tombstone: their full record carries the flag.
+# An expired link that is also disabled keeps reporting "disabled".
+TOMBSTONE_REASONS = {"missing": 1, "disabled": 2, "expired": 3}
+
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def url_key(short_code: str) -> str:
+    return f"url:v{URL_ENTRY_VERSION}:{short_code}"
+
+
+def _to_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class CachedURL(NamedTuple):
+    """What the redirect path needs to know about a link, without the DB"""
+    url_id: int
+    original_url: str
+    expires_at: Optional[datetime]
+    is_active: bool
+    owner_id: int
+
+    @classmethod
+    def from_model(cls, url) -> "CachedURL":
+        return cls(
+            url_id=url.id,
+            original_url=url.original_url,
+            expires_at=_to_utc(url.expires_at),
+            is_active=bool(url.is_active),
+            owner_id=url.owner_id,
+        )
+
+    def is_expired(self) -> bool:
+        return self.expires_at is not None and self.expires_at <= datetime.now(timezone.utc)
+
+    def is_servable(self) -> bool:
+        return self.is_active and not self.is_expired()
+
+    def ttl(self, default: int = 86400) -> int:
+        """Seconds to cache for, clamped so the entry dies with the link"""
+        if self.expires_at is None:
+            return default
+        remaining = (self.expires_at - datetime.now(timezone.utc)).total_seconds()
+        return max(0, min(default, int(remaining)))
+
+    def gone_reason(self) -> str:
+        """Tombstone reason once the record itself can no longer be cached"""
+        return "expired" if self.is_active else "disabled"
+
+
+class Tombstone(NamedTuple):
+    """Cached answer for a code that must not redirect"""
+    reason: str
+
+    def is_servable(self) -> bool:
+        return False
+
+
+def encode_url_entry(entry: CachedURL) -> bytes:
+    """Pack a URL record into the compact binary cache format"""
+    expires_at = entry.expires_at
+    header = URL_ENTRY_HEADER.pack(
+        URL_ENTRY_VERSION,
+        entry.url_id,
+        entry.owner_id,
+        int(expires_at.timestamp()) if expires_at else 0,
+        FLAG_ACTIVE if entry.is_active else 0,
+    )
+    return header + entry.original_url.encode("utf-8")
+
+
+def encode_tombstone(reason: str) -> bytes:
+    return bytes([TOMBSTONE_MARKER, TOMBSTONE_REASONS[reason]])
+
+
+def decode_url_entry(data: bytes) -> Union[CachedURL, Tombstone, None]:
+    """Unpack a cached URL record or tombstone; unknown versions read as a miss"""
+    if len(data) == 2 and data[0] == TOMBSTONE_MARKER:
+        for reason, code in TOMBSTONE_REASONS.items():
+            if code == data[1]:
+                return Tombstone(reason)
+        return None
+
+    if len(data) < URL_ENTRY_HEADER.size or data[0] != URL_ENTRY_VERSION:
+        return None
+
+    _, url_id, owner_id, expires_at, flags = URL_ENTRY_HEADER.unpack_from(data)
+    return CachedURL(
+        url_id=url_id,
+        original_url=data[URL_ENTRY_HEADER.size:].decode("utf-8"),
+        expires_at=datetime.fromtimestamp(expires_at, timezone.utc) if expires_at else None,
+        is_active=bool(flags & FLAG_ACTIVE),
+        owner_id=owner_id,
+    )
+
+
+class LocalCache:
+    """Bounded in-process LRU cache with per-entry TTL"""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple[float, Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return a live entry and mark it as recently used"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, size: int, ttl: Optional[int] = None):
+        """Store an entry, evicting least recently used ones to stay in bounds"""
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+
+        self._remove(key)
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._entries[key] = (time.monotonic() + ttl, value, size)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def delete(self, key: str):
+        """Drop an entry if present"""
+        self._remove(key)
+
+    def clear(self):
+        """Drop every entry"""
+        self._entries.clear()
+        self._bytes = 0
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def get_stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
 
 class RedisCache:
     def __init__(self):
         self.redis_client: Optional[redis.Redis] = None
-    
+        self.binary_client: Optional[redis.Redis] = None
+        self.local = LocalCache(
+            max_entries=settings.L1_CACHE_MAX_ENTRIES,
+            max_bytes=settings.L1_CACHE_MAX_BYTES,
+            ttl=settings.L1_CACHE_TTL_SECONDS,
+        )
+        self.hits = 0
+        self.misses = 0
+        self.tombstone_hits = 0
+        self.tombstone_writes = 0
+        self._listener_task: Optional[asyncio.Task] = None
+        # Called with each short code announced on the invalidation channel
+        self.invalidation_hooks: list = []
+        # Called with each namespaced key (principal:...) announced there
+        self.key_invalidation_hooks: list = []
+        # Called whenever the listener (re)subscribes, having missed messages
+        self.reconnect_hooks: list = []
+
     async def connect(self):
         """Initialize Redis connection"""
         if not self.redis_client:
@@ -16,86 +221,324 @@ class RedisCache:
                 decode_responses=True,
                 encoding="utf-8"
             )
-    
+            # URL records are packed binary, so they need undecoded replies
+            self.binary_client = redis.Redis(
+                connection_pool=redis.ConnectionPool.from_url(settings.REDIS_URL)
+            )
+
     async def disconnect(self):
         """Close Redis connection"""
+        await self.stop_invalidation_listener()
         if self.redis_client:
             await self.redis_client.close()
-    
-    async def get_url(self, short_code: str) -> Optional[str]:
-        """Get original URL from cache"""
+        if self.binary_client:
+            await self.binary_client.close()
+
+    async def start_invalidation_listener(self):
+        """Subscribe to cross-worker invalidations for the local cache"""
+        if self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._listen_for_invalidations())
+
+    async def stop_invalidation_listener(self):
+        """Cancel the invalidation subscriber"""
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+
+    async def _listen_for_invalidations(self):
+        while True:
+            try:
+                if not self.redis_client:
+                    await self.connect()
+                pubsub = self.redis_client.pubsub()
+                await pubsub.subscribe(settings.CACHE_INVALIDATION_CHANNEL)
+                # Anything published while we were not subscribed is lost
+                self.local.clear()
+                for hook in self.reconnect_hooks:
+                    hook()
+                try:
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.local.delete(message["data"])
+                            # Namespaced keys (principal:...) are not short codes
+                            hooks = self.key_invalidation_hooks if ":" in message["data"] else self.invalidation_hooks
+                            for hook in hooks:
+                                hook(message["data"])
+                finally:
+                    await pubsub.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Redis invalidation listener error: {e}")
+                self.local.clear()
+                await asyncio.sleep(1)
+
+    async def invalidate_local(self, short_code: str):
+        """Drop a code, or another local cache key, from every worker's local cache"""
+        self.local.delete(short_code)
+        try:
+            await self.redis_client.publish(settings.CACHE_INVALIDATION_CHANNEL, short_code)
+        except Exception as e:
+            print(f"Redis PUBLISH error: {e}")
+
+    def _cache_local(self, short_code: str, entry: Union[CachedURL, Tombstone]):
+        if isinstance(entry, Tombstone):
+            self.local.set(
+                short_code,
+                entry,
+                size=len(short_code) + ENTRY_OVERHEAD_BYTES,
+                ttl=settings.NEGATIVE_CACHE_TTL_SECONDS
+            )
+            return
+
+        self.local.set(
+            short_code,
+            entry,
+            size=len(short_code) + len(entry.original_url) + ENTRY_OVERHEAD_BYTES,
+            ttl=entry.ttl()
+        )
+
+    def _get_local(self, short_code: str) -> Union[CachedURL, Tombstone, None]:
+        entry = self.local.get(short_code)
+        if isinstance(entry, Tombstone):
+            self.tombstone_hits += 1
+        return entry
+
+    async def get_url(self, short_code: str) -> Union[CachedURL, Tombstone, None]:
+        """Get cached URL record, or a tombstone for codes known not to redirect"""
+        entry = self._get_local(short_code)
+        if entry is not None:
+            return entry
+
         if not self.redis_client:
             await self.connect()
-        
+
         try:
-            cached_url = await self.redis_client.get(f"url:{short_code}")
-            return cached_url
+            data = await self.binary_client.get(url_key(short_code))
         except Exception as e:
             print(f"Redis GET error: {e}")
             return None
-    
-    async def set_url(self, short_code: str, original_url: str, expire: int = 3600):
-        """Cache URL mapping"""
+
+        return self._load_entry(short_code, data)
+
+    async def get_urls(
+        self, short_codes: Iterable[str], local: bool = True
+    ) -> dict[str, Union[CachedURL, Tombstone, None]]:
+        """Batch get_url: local hits first, then a single MGET for the rest
+
+        Pass local=False from processes that don't run the invalidation
+        listener, so they never act on a stale local copy.
+        """
+        entries = {}
+        remote = []
+        for short_code in dict.fromkeys(short_codes):
+            entry = self._get_local(short_code) if local else None
+            if entry is not None:
+                entries[short_code] = entry
+            else:
+                remote.append(short_code)
+
+        if not remote:
+            return entries
+        if not self.redis_client:
+            await self.connect()
+
+        try:
+            values = await self.binary_client.mget([url_key(code) for code in remote])
+        except Exception as e:
+            print(f"Redis MGET error: {e}")
+            values = [None] * len(remote)
+
+        for short_code, data in zip(remote, values):
+            entries[short_code] = self._load_entry(short_code, data)
+        return entries
+
+    def _load_entry(self, short_code: str, data: Optional[bytes]) -> Union[CachedURL, Tombstone, None]:
+        entry = decode_url_entry(data) if data else None
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if isinstance(entry, Tombstone):
+            self.tombstone_hits += 1
+        self._cache_local(short_code, entry)
+        return entry
+
+    async def add_click(self, fields: dict):
+        """Append a click record to the durable click stream"""
+        if not self.redis_client:
+            await self.connect()
+
+        try:
+            await self.redis_client.xadd(
+                settings.CLICK_STREAM_KEY,
+                fields,
+                maxlen=settings.CLICK_STREAM_MAXLEN,
+                approximate=True
+            )
+        except Exception as e:
+            print(f"Redis XADD error: {e}")
+
+    async def get_url_and_add_click(
+        self, short_code: str, fields: dict
+    ) -> Union[CachedURL, Tombstone, None]:
+        """Look up a URL record and append its click record in one round trip"""
+        entry = self._get_local(short_code)
+        if entry is not None:
+            if entry.is_servable():
+                await self.add_click({**fields, "u": str(entry.url_id)})
+            return entry
+
         if not self.redis_client:
             await self.connect()
-        
+
         try:
-            await self.redis_client.setex(
-                f"url:{short_code}",
-                expire,
-                original_url
+            pipe = self.binary_client.pipeline(transaction=False)
+            pipe.get(url_key(short_code))
+            pipe.xadd(
+                settings.CLICK_STREAM_KEY,
+                fields,
+                maxlen=settings.CLICK_STREAM_MAXLEN,
+                approximate=True
+            )
+            data, _ = await pipe.execute()
+        except Exception as e:
+            print(f"Redis pipeline error: {e}")
+            return None
+
+        return self._load_entry(short_code, data)
+
+    async def set_url(self, short_code: str, entry: CachedURL, expire: int = 86400):
+        """Cache URL record, never past the link's own expiry"""
+        if not self.redis_client:
+            await self.connect()
+
+        ttl = entry.ttl(expire)
+        if ttl <= 0:
+            await self.set_tombstone(short_code, entry.gone_reason())
+            return
+
+        try:
+            await self.binary_client.setex(
+                url_key(short_code),
+                ttl,
+                encode_url_entry(entry)
             )
         except Exception as e:
             print(f"Redis SET error: {e}")
-    
-    async def delete_url(self, short_code: str):
-        """Remove URL from cache"""
+
+    async def store_new_urls(self, items: list, bloom=None):
+        """Cache freshly created URLs in one round trip
+
+        Writes each record, sets its bits in the short code filter if one is
+        given, and announces the codes so other workers drop stale tombstones
+        and update their filters. Filter writes that fail are retried by the
+        filter, since a code missing from it would 404.
+        """
         if not self.redis_client:
             await self.connect()
-        
+
         try:
-            await self.redis_client.delete(f"url:{short_code}")
+            pipe = self.binary_client.pipeline(transaction=False)
+            for short_code, entry in items:
+                self.local.delete(short_code)
+                if bloom is not None:
+                    bloom.queue_add(pipe, short_code)
+                ttl = entry.ttl()
+                if ttl > 0:
+                    pipe.setex(url_key(short_code), ttl, encode_url_entry(entry))
+                else:
+                    pipe.setex(
+                        url_key(short_code),
+                        settings.NEGATIVE_CACHE_TTL_SECONDS,
+                        encode_tombstone(entry.gone_reason())
+                    )
+                pipe.publish(settings.CACHE_INVALIDATION_CHANNEL, short_code)
+            await pipe.execute()
         except Exception as e:
-            print(f"Redis DELETE error: {e}")
-    
-    # ✅ Renamed method to match router call
-    async def increment_clicks(self, short_code: str) -> int:
-        """Increment click count in cache"""
+            print(f"Redis pipeline error: {e}")
+            if bloom is not None:
+                bloom.retry_later([short_code for short_code, _ in items])
+
+    async def try_lock(self, name: str, ttl_ms: int) -> Optional[str]:
+        """Take a short-lived Redis lock; returns the token needed to release it"""
         if not self.redis_client:
             await self.connect()
-        
+
+        token = uuid.uuid4().hex
         try:
-            key = f"clicks:{short_code}"
-            count = await self.redis_client.incr(key)
-            # Set expiry on first increment
-            if count == 1:
-                await self.redis_client.expire(key, 300)  # 5 minutes
-            return count
+            if await self.redis_client.set(f"lock:{name}", token, nx=True, px=ttl_ms):
+                return token
         except Exception as e:
-            print(f"Redis INCR error: {e}")
-            return 0
-    
-    async def get_click_count(self, short_code: str) -> int:
-        """Get cached click count"""
+            print(f"Redis lock error: {e}")
+            # Without Redis there is nobody to coordinate with; proceed alone
+            return token
+        return None
+
+    async def release_lock(self, name: str, token: str):
+        """Release a lock only if we still hold it"""
+        try:
+            await self.redis_client.eval(RELEASE_LOCK_SCRIPT, 1, f"lock:{name}", token)
+        except Exception as e:
+            print(f"Redis unlock error: {e}")
+
+    async def wait_for_url(self, short_code: str, timeout_ms: int, interval_ms: int):
+        """Poll the cache until another worker fills an entry, or give up"""
+        deadline = time.monotonic() + timeout_ms / 1000
+        while time.monotonic() < deadline:
+            await asyncio.sleep(interval_ms / 1000)
+            entry = await self.get_url(short_code)
+            if entry is not None:
+                return entry
+        return None
+
+    async def set_tombstone(self, short_code: str, reason: str):
+        """Remember briefly that a code is missing, expired or disabled"""
         if not self.redis_client:
             await self.connect()
-        
+
+        self._cache_local(short_code, Tombstone(reason))
         try:
-            count = await self.redis_client.get(f"clicks:{short_code}")
-            return int(count) if count else 0
+            await self.binary_client.setex(
+                url_key(short_code),
+                settings.NEGATIVE_CACHE_TTL_SECONDS,
+                encode_tombstone(reason)
+            )
+            self.tombstone_writes += 1
         except Exception as e:
-            print(f"Redis GET clicks error: {e}")
-            return 0
-    
-    async def reset_click_count(self, short_code: str):
-        """Reset click count cache"""
+            print(f"Redis SET tombstone error: {e}")
+
+    async def delete_url(self, short_code: str):
+        """Remove URL from cache on every worker"""
         if not self.redis_client:
             await self.connect()
-        
+
         try:
-            await self.redis_client.delete(f"clicks:{short_code}")
+            await self.redis_client.delete(url_key(short_code))
         except Exception as e:
-            print(f"Redis DELETE clicks error: {e}")
+            print(f"Redis DELETE error: {e}")
+
+        await self.invalidate_local(short_code)
+
+    def get_stats(self) -> dict:
+        """Hit/miss/eviction counters for each cache tier"""
+        return {
+            "l1": self.local.get_stats(),
+            "l2": {"hits": self.hits, "misses": self.misses},
+            "tombstones": {
+                "hits": self.tombstone_hits,
+                "writes": self.tombstone_writes,
+                "hit_rate": round(
+                    self.tombstone_hits / max(self.local.hits + self.hits + self.misses, 1), 4
+                ),
+                "ttl_seconds": settings.NEGATIVE_CACHE_TTL_SECONDS,
+            },
+        }
 
 
 # Global cache instance
@@ -0,0 +1,283 @@
+import asyncio
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy import insert, select, or_
+
+from app.cache import cache
+from app.database import AsyncSessionLocal
+from app.models import URL, Click
+from app.counters import click_counters
+from app.uniques import unique_visitors
+from app.topk import top_urls
+from app.rollups import apply_rollups
+from app.config import settings
+
+CLICK_COLUMNS = ["url_id", "ip_address", "user_agent", "referrer", "clicked_at"]
+# clicks.user_agent and clicks.referrer are VARCHAR(512) (migrations 001, 007)
+HEADER_MAX_LENGTH = 512
+
+# Compact field names used for Redis Stream entries
+STREAM_FIELDS = {
+    "short_code": "c",
+    "url_id": "u",
+    "ip_address": "ip",
+    "user_agent": "ua",
+    "referrer": "r",
+}
+
+
+def truncate(value: Optional[str], length: int = HEADER_MAX_LENGTH) -> Optional[str]:
+    return value[:length] if value is not None else None
+
+
+def build_click_record(short_code: str, request, url_id: Optional[int] = None) -> dict:
+    """Build the compact click record queued by the redirect handler"""
+    return {
+        "short_code": short_code,
+        "url_id": url_id,
+        "owner_id": None,
+        "ip_address": request.client.host if request.client else None,
+        "user_agent": truncate(request.headers.get("user-agent")),
+        "referrer": truncate(request.headers.get("referer")),
+        "clicked_at": datetime.utcnow(),
+    }
+
+
+def encode_stream_fields(record: dict) -> dict:
+    """Encode a click record as a compact Redis Stream entry"""
+    fields = {
+        short: str(record[name])
+        for name, short in STREAM_FIELDS.items()
+        if record.get(name) is not None
+    }
+    fields["t"] = f"{record['clicked_at'].replace(tzinfo=timezone.utc).timestamp():.3f}"
+    return fields
+
+
+def decode_stream_fields(fields: dict) -> dict:
+    """Decode a Redis Stream entry back into a click record"""
+    record = {name: fields.get(short) for name, short in STREAM_FIELDS.items()}
+    record["url_id"] = int(record["url_id"]) if record["url_id"] else None
+    # Entries queued before truncation was added may still be too long
+    record["user_agent"] = truncate(record["user_agent"])
+    record["referrer"] = truncate(record["referrer"])
+    record["clicked_at"] = datetime.utcfromtimestamp(float(fields["t"]))
+    return record
+
+
+def servable_urls_query(short_codes, now: datetime):
+    """(short_code, id, owner_id) of the codes that are live at `now`"""
+    return select(URL.short_code, URL.id, URL.owner_id).where(
+        URL.short_code.in_(short_codes),
+        URL.is_active.is_(True),
+        or_(URL.expires_at.is_(None), URL.expires_at > now)
+    )
+
+
+async def resolve_url_ids(session, records: list[dict]) -> list[dict]:
+    """Fill in url_id and owner_id for records queued before they were known,
+    dropping codes that do not resolve to a servable link"""
+    missing = {r["short_code"] for r in records if r.get("url_id") is None or r.get("owner_id") is None}
+    ids = {}
+    if missing:
+        # One MGET for the whole batch; only cache misses go to the DB
+        cached = await cache.get_urls(missing, local=False)
+        for short_code, entry in cached.items():
+            if entry is not None:
+                ids[short_code] = (entry.url_id, entry.owner_id) if entry.is_servable() else None
+        missing -= ids.keys()
+
+    if missing:
+        result = await session.execute(servable_urls_query(missing, datetime.now(timezone.utc)))
+        ids.update((short_code, (url_id, owner_id)) for short_code, url_id, owner_id in result)
+
+    for record in records:
+        if record.get("url_id") is None or record.get("owner_id") is None:
+            record["url_id"], record["owner_id"] = ids.get(record["short_code"]) or (None, None)
+
+    # Ids from the redirect path or the cache may belong to links deleted
+    # since; their rows would fail the foreign key and the whole batch
+    url_ids = {r["url_id"] for r in records if r.get("url_id") is not None}
+    if url_ids:
+        existing = set(await session.scalars(select(URL.id).where(URL.id.in_(url_ids))))
+        url_ids &= existing
+
+    return [r for r in records if r.get("url_id") in url_ids]
+
+
+def count_by_url(records: list[dict]) -> dict[int, int]:
+    return dict(Counter(r["url_id"] for r in records))
+
+
+async def insert_clicks(session, records: list[dict]):
+    """Write click rows with COPY on asyncpg, otherwise a multi-row INSERT"""
+    if not records:
+        return
+
+    if settings.CLICK_INGEST_USE_COPY and session.bind.dialect.driver == "asyncpg":
+        connection = await session.connection()
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            Click.__tablename__,
+            records=[tuple(r[c] for c in CLICK_COLUMNS) for r in records],
+            columns=CLICK_COLUMNS,
+        )
+    else:
+        await session.execute(
+            insert(Click),
+            [{c: r[c] for c in CLICK_COLUMNS} for r in records]
+        )
+
+
+async def write_clicks(batch: list[dict]) -> tuple[list[dict], list[dict]]:
+    """Resolve, insert and roll up a batch in one transaction
+
+    If the batch fails it is retried row by row, each row in its own
+    savepoint, so one bad row can't take the rest of the batch down.
+    Returns (written, failed); codes that don't resolve are in neither.
+    Errors that hit every row, such as the DB being down, still raise.
+    """
+    try:
+        async with AsyncSessionLocal() as session:
+            records = await resolve_url_ids(session, batch)
+            await insert_clicks(session, records)
+            await apply_rollups(session, records)
+            await session.commit()
+        return records, []
+    except Exception as e:
+        print(f"Click batch error, retrying row by row: {e}")
+
+    written, failed = [], []
+    async with AsyncSessionLocal() as session:
+        for record in await resolve_url_ids(session, batch):
+            try:
+                async with session.begin_nested():
+                    await insert_clicks(session, [record])
+                    await apply_rollups(session, [record])
+                written.append(record)
+            except Exception as e:
+                print(f"Click row error: {e}")
+                failed.append(record)
+        await session.commit()
+    return written, failed
+
+
+class ClickPipeline:
+    """Buffers redirect clicks in memory and flushes them to the DB in batches"""
+
+    def __init__(self, max_queue: int, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Optional[asyncio.Future] = None
+        self._pending: list[dict] = []
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+
+    def enqueue(self, record: dict) -> bool:
+        """Queue a click without waiting; drops it when the buffer is full"""
+        try:
+            self.queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the worker and flush whatever is still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        # A batch being written is shielded from cancellation; wait for it
+        if self._inflight is not None:
+            await self._inflight
+            self._inflight = None
+
+        if self._pending:
+            await self._flush(self._pending)
+            self._pending = []
+
+        while not self.queue.empty():
+            await self._flush(self._drain(self.batch_size))
+
+    def _drain(self, limit: int) -> list[dict]:
+        batch = []
+        while len(batch) < limit and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        while True:
+            self._pending = [await self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+
+            # Flush on whichever comes first: a full batch or the interval
+            while len(self._pending) < self.batch_size:
+                self._pending.extend(self._drain(self.batch_size - len(self._pending)))
+                remaining = deadline - time.monotonic()
+                if len(self._pending) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    self._pending.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            batch, self._pending = self._pending, []
+            self._inflight = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._inflight)
+            self._inflight = None
+
+    async def _flush(self, batch: list[dict]):
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        try:
+            records, _ = await write_clicks(batch)
+            await click_counters.add(count_by_url(records))
+            await unique_visitors.add(records)
+            await top_urls.add(records)
+            self.flushed += len(records)
+            self.failed += len(batch) - len(records)
+            self.batches += 1
+        except Exception as e:
+            print(f"Click flush error: {e}")
+            self.failed += len(batch)
+        finally:
+            self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    def get_stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+# Global click pipeline
+click_pipeline = ClickPipeline(
+    max_queue=settings.CLICK_QUEUE_MAX_SIZE,
+    batch_size=settings.CLICK_BATCH_SIZE,
+    flush_interval=settings.CLICK_FLUSH_INTERVAL_SECONDS,
+)
@@ -12,6 +12,14 @@ class Settings(BaseSettings):
     ENVIRONMENT: str = "development"
     BASE_URL: str = "http://localhost:8000"
     SHORT_CODE_LENGTH: int = 6
+    SHORT_CODE_STRATEGY: str = "permuted"  # "permuted" or "random"
+    SHORT_CODE_ID_SOURCE: str = "postgres"  # "postgres" or "redis"
+    SHORT_CODE_BLOCK_SIZE: int = 1000
+    # Must never change once codes are issued; defaults to one derived from SECRET_KEY
+    SHORT_CODE_PERMUTATION_KEY: str = ""
+    URL_BATCH_MAX_ITEMS: int = 1000
+    IMPORT_CHUNK_SIZE: int = 5000
+    IMPORT_MAX_REPORTED_ERRORS: int = 1000
 
     # Database
     DATABASE_URL: str
@@ -20,13 +28,90 @@ class Settings(BaseSettings):
     # Redis
     REDIS_URL: str = "redis://localhost:6379/0"
 
+    # /metrics is served only to requests sending this in X-Metrics-Token; empty disables it
+    METRICS_TOKEN: str = ""
+
+    # Local (in-process) cache in front of Redis
+    L1_CACHE_MAX_ENTRIES: int = 10000
+    L1_CACHE_MAX_BYTES: int = 16 * 1024 * 1024
+    L1_CACHE_TTL_SECONDS: int = 60
+    CACHE_INVALIDATION_CHANNEL: str = "cache:invalidate"
+    NEGATIVE_CACHE_TTL_SECONDS: int = 30
+    # Coordinate cache fills across workers, not just within one
+    SINGLE_FLIGHT_REDIS_LOCK: bool = False
+    SINGLE_FLIGHT_LOCK_TTL_MS: int = 2000
+    SINGLE_FLIGHT_POLL_MS: int = 25
+
+    # Bloom filter of existing short codes; capacity is the first layer's,
+    # later layers double it
+    SHORT_CODE_BLOOM_ENABLED: bool = True
+    SHORT_CODE_BLOOM_CAPACITY: int = 1000000
+    SHORT_CODE_BLOOM_ERROR_RATE: float = 0.001
+
+    # Click ingestion
+    CLICK_QUEUE_MAX_SIZE: int = 10000
+    CLICK_BATCH_SIZE: int = 500
+    CLICK_FLUSH_INTERVAL_SECONDS: float = 1.0
+    CLICK_INGEST_USE_COPY: bool = True
+    CLICK_INGEST_MODE: str = "memory"  # "memory" or "stream"
+    CLICK_STREAM_KEY: str = "clicks:stream"
+    CLICK_STREAM_GROUP: str = "click-writers"
+    CLICK_STREAM_MAXLEN: int = 1000000
+    CLICK_STREAM_CLAIM_IDLE_MS: int = 60000
+    # Entries delivered this many times without being written are parked here
+    CLICK_STREAM_DEAD_LETTER_KEY: str = "clicks:dead"
+    CLICK_STREAM_MAX_DELIVERIES: int = 10
+    CLICK_COUNTER_DRAIN_INTERVAL_SECONDS: float = 10.0
+    CLICK_COUNTER_DRAIN_BATCH: int = 1000
+    # Corrects urls.click_count from the daily rollups if counter deltas were lost
+    CLICK_COUNTER_RECONCILE_INTERVAL_SECONDS: float = 3600.0
+
+    # Click partitions (monthly)
+    CLICK_PARTITION_MONTHS_AHEAD: int = 3
+    CLICK_PARTITION_CHECK_INTERVAL_SECONDS: int = 3600
+
+    # Retention; 0 keeps forever. Daily rollups are always kept.
+    CLICK_RETENTION_DAYS: int = 0
+    HOURLY_ROLLUP_RETENTION_DAYS: int = 0
+    RETENTION_INTERVAL_SECONDS: int = 3600
+    RETENTION_BATCH_SIZE: int = 5000
+    RETENTION_BATCH_PAUSE_SECONDS: float = 0.1
+    RETENTION_DRY_RUN: bool = False
+
+    # Analytics
+    DASHBOARD_CACHE_TTL_SECONDS: int = 30
+
     # Security
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Password hashing; changing BCRYPT_ROUNDS rehashes each user at next login
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 32
+    PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS: float = 2.0
+
+    # Authenticated principals, cached by token subject
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 60
+    PRINCIPAL_LOCAL_TTL_SECONDS: int = 10
+    PRINCIPAL_LOCAL_MAX_ENTRIES: int = 10000
+    PRINCIPAL_LOCAL_MAX_BYTES: int = 2 * 1024 * 1024
+
+    # API keys; the HMAC key defaults to one derived from SECRET_KEY
+    API_KEY_HMAC_KEY: str = ""
+    API_KEY_CACHE_TTL_SECONDS: int = 60
+    API_KEY_MAX_PER_USER: int = 20
 
-    # Rate Limiting
+    # Rate Limiting (per user for API calls, per IP otherwise)
+    RATE_LIMIT_ENABLED: bool = True
     RATE_LIMIT_PER_MINUTE: int = 60
+    RATE_LIMIT_BURST: int = 20
+    RATE_LIMIT_REDIRECT_PER_MINUTE: int = 600
+    RATE_LIMIT_REDIRECT_BURST: int = 100
+    RATE_LIMIT_LOGIN_PER_MINUTE: int = 10
+    RATE_LIMIT_LOGIN_BURST: int = 5
+    RATE_LIMIT_LOCAL_PRECHECK: bool = True
+    RATE_LIMIT_LOCAL_MAX_KEYS: int = 100000
 
     class Config:
         env_file = ".env"
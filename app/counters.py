@@ -0,0 +1,317 @@
+import asyncio
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional
+from sqlalchemy import select, update, delete, bindparam, text, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.cache import cache
+from app.database import AsyncSessionLocal
+from app.models import URL, ClickCounterDrain
+from app.config import settings
+
+COUNTER_PREFIX = "clicks:url:"
+DIRTY_KEY = "clicks:dirty"
+DRAINING_KEY = "clicks:draining"
+DRAIN_SEQUENCE_KEY = "clicks:drain:seq"
+# First day the next reconcile has to look at
+RECONCILE_SINCE_KEY = "clicks:reconcile:since"
+DRAIN_LOCK_MS = 300000
+APPLIED_DRAINS_RETENTION = timedelta(days=1)
+
+# Moves up to ARGV[1] dirty counters into the draining hash atomically, so a
+# crash between here and the DB commit leaves the counts in Redis, not nowhere.
+# A leftover hash from a failed drain is returned unchanged, under the same
+# drain_id, so the DB can tell whether it was already applied.
+DRAIN_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    local ids = redis.call('SPOP', KEYS[1], ARGV[1])
+    for _, id in ipairs(ids) do
+        local value = redis.call('GETDEL', ARGV[2] .. id)
+        if value then
+            redis.call('HINCRBY', KEYS[2], id, value)
+        end
+    end
+end
+if redis.call('EXISTS', KEYS[2]) == 1 and redis.call('HEXISTS', KEYS[2], 'drain_id') == 0 then
+    local now = redis.call('TIME')
+    redis.call('HSET', KEYS[2], 'drain_id', now[1] .. '.' .. now[2] .. '-' .. redis.call('INCR', KEYS[3]))
+end
+return redis.call('HGETALL', KEYS[2])
+"""
+
+# URLs clicked since :since, or still under watch, whose click_count differs
+# from their daily rollups, which commit with the clicks themselves
+DRIFT_SQL = text("""
+WITH touched AS (
+    SELECT url_id FROM click_rollups_daily WHERE day >= :since
+    UNION
+    SELECT unnest(:ids)
+)
+SELECT u.id, COALESCE(SUM(r.clicks), 0) - u.click_count AS drift
+FROM touched t
+JOIN urls u ON u.id = t.url_id
+LEFT JOIN click_rollups_daily r ON r.url_id = u.id
+GROUP BY u.id, u.click_count
+HAVING COALESCE(SUM(r.clicks), 0) <> u.click_count
+""").bindparams(bindparam("ids", type_=ARRAY(Integer)))
+
+
+class ClickCounters:
+    """Authoritative per-URL click totals
+
+    Ingestion bumps a Redis counter per URL after its clicks are committed.
+    A periodic drain folds those deltas into urls.click_count, and readers
+    add whatever has not been drained yet.
+
+    Each drain is recorded in the DB under its drain_id in the same
+    transaction as the UPDATE, so a drain retried after a crash is applied
+    once. Deltas Redis refuses are kept and resent; anything lost anyway,
+    say with the process, is put back by a periodic reconcile against the
+    daily rollups.
+    """
+
+    def __init__(self, drain_interval: float, drain_batch: int, reconcile_interval: float):
+        self.drain_interval = drain_interval
+        self.drain_batch = drain_batch
+        self.reconcile_interval = reconcile_interval
+        self._task: Optional[asyncio.Task] = None
+        self._unsent: Counter = Counter()
+        # Gaps seen by the last reconcile, by URL id
+        self._gaps: dict[int, int] = {}
+        self.drained = 0
+        self.drains = 0
+        self.duplicate_drains = 0
+        self.reconciled = 0
+        self.send_failures = 0
+
+    async def add(self, counts: dict[int, int]):
+        """Record committed clicks, one pipelined INCRBY per URL"""
+        counts = Counter(counts)
+        counts.update(self._unsent)
+        self._unsent = Counter()
+        if not counts:
+            return
+        if not cache.redis_client:
+            await cache.connect()
+
+        try:
+            pipe = cache.redis_client.pipeline(transaction=False)
+            for url_id, count in counts.items():
+                pipe.incrby(f"{COUNTER_PREFIX}{url_id}", count)
+            pipe.sadd(DIRTY_KEY, *counts.keys())
+            await pipe.execute()
+        except Exception as e:
+            print(f"Redis INCRBY clicks error: {e}")
+            # Resent with the next add or drain tick
+            self.send_failures += 1
+            self._unsent.update(counts)
+
+    async def _read_pending(self, url_ids: list[int]) -> dict[int, int]:
+        if not cache.redis_client:
+            await cache.connect()
+
+        # MULTI so a concurrent drain can't move a delta between the two reads
+        pipe = cache.redis_client.pipeline(transaction=True)
+        pipe.mget([f"{COUNTER_PREFIX}{url_id}" for url_id in url_ids])
+        pipe.hmget(DRAINING_KEY, url_ids)
+        pipe.hget(DRAINING_KEY, "drain_id")
+        counters, draining, drain_id = await pipe.execute()
+
+        # Between its commit and clearing the hash, a drain is already in click_count
+        if drain_id is not None and any(draining) and await self._drain_applied(drain_id):
+            draining = [None] * len(url_ids)
+
+        return {
+            url_id: int(counter or 0) + int(drain or 0) + self._unsent[url_id]
+            for url_id, counter, drain in zip(url_ids, counters, draining)
+        }
+
+    async def _drain_applied(self, drain_id: str) -> bool:
+        async with AsyncSessionLocal() as session:
+            return await session.scalar(
+                select(ClickCounterDrain.drain_id).where(ClickCounterDrain.drain_id == drain_id)
+            ) is not None
+
+    async def pending(self, url_ids: Iterable[int]) -> dict[int, int]:
+        """Clicks not yet drained into urls.click_count, for many URLs at once"""
+        url_ids = list(url_ids)
+        if not url_ids:
+            return {}
+
+        try:
+            return await self._read_pending(url_ids)
+        except Exception as e:
+            print(f"Redis GET clicks error: {e}")
+            return {}
+
+    async def discard(self, url_id: int):
+        """Forget undrained clicks of a deleted URL"""
+        if not cache.redis_client:
+            await cache.connect()
+
+        try:
+            pipe = cache.redis_client.pipeline(transaction=False)
+            pipe.delete(f"{COUNTER_PREFIX}{url_id}")
+            pipe.srem(DIRTY_KEY, url_id)
+            pipe.hdel(DRAINING_KEY, url_id)
+            await pipe.execute()
+        except Exception as e:
+            print(f"Redis DELETE clicks error: {e}")
+        self._unsent.pop(url_id, None)
+        self._gaps.pop(url_id, None)
+
+    async def drain(self) -> int:
+        """Fold pending Redis deltas into urls.click_count; one drainer at a time"""
+        token = await cache.try_lock("clicks:drain", DRAIN_LOCK_MS)
+        if token is None:
+            return 0
+
+        try:
+            if self._unsent:
+                await self.add({})
+
+            flat = await cache.redis_client.eval(
+                DRAIN_SCRIPT, 3, DIRTY_KEY, DRAINING_KEY, DRAIN_SEQUENCE_KEY, self.drain_batch, COUNTER_PREFIX
+            )
+            snapshot = {flat[i]: flat[i + 1] for i in range(0, len(flat), 2)}
+            drain_id = snapshot.pop("drain_id", None)
+            if drain_id is None:
+                return 0
+            deltas = {int(url_id): int(delta) for url_id, delta in snapshot.items()}
+
+            applied = False
+            if deltas:
+                urls = URL.__table__
+                drains = ClickCounterDrain.__table__
+                async with AsyncSessionLocal() as session:
+                    connection = await session.connection()
+                    applied = await connection.scalar(
+                        pg_insert(drains)
+                        .values(drain_id=drain_id)
+                        .on_conflict_do_nothing()
+                        .returning(drains.c.drain_id)
+                    ) is not None
+                    if applied:
+                        # Core executemany: one prepared UPDATE, every delta in one go
+                        await connection.execute(
+                            update(urls)
+                            .where(urls.c.id == bindparam("url_id"))
+                            .values(click_count=urls.c.click_count + bindparam("delta")),
+                            [{"url_id": url_id, "delta": delta} for url_id, delta in deltas.items()]
+                        )
+                        await connection.execute(
+                            delete(drains).where(drains.c.applied_at < datetime.utcnow() - APPLIED_DRAINS_RETENTION)
+                        )
+                    await session.commit()
+
+            # Crashing before this line retries the same drain_id, which is then skipped
+            await cache.redis_client.delete(DRAINING_KEY)
+            if applied:
+                self.drained += sum(deltas.values())
+                self.drains += 1
+            elif deltas:
+                self.duplicate_drains += 1
+            return len(deltas)
+        finally:
+            await cache.release_lock("clicks:drain", token)
+
+    async def reconcile(self) -> int:
+        """Put back clicks whose deltas never reached urls.click_count
+
+        click_count plus the undrained deltas should match the daily
+        rollups. Only URLs clicked since the previous pass are checked (all
+        of them on the very first pass), plus any whose gap is being
+        watched. A URL is only corrected when the same gap shows on two
+        passes in a row, so clicks caught between their commit and their
+        INCRBY are left alone.
+        """
+        token = await cache.try_lock("clicks:drain", DRAIN_LOCK_MS)
+        if token is None:
+            return 0
+
+        try:
+            today = datetime.utcnow().date()
+            since = await cache.redis_client.get(RECONCILE_SINCE_KEY)
+            since = date.fromisoformat(since) if since else date.min
+            async with AsyncSessionLocal() as session:
+                drifts = {
+                    row.id: int(row.drift)
+                    for row in await session.execute(DRIFT_SQL, {"since": since, "ids": list(self._gaps)})
+                }
+            pending = await self._read_pending(list(drifts)) if drifts else {}
+
+            gaps = {url_id: drift - pending[url_id] for url_id, drift in drifts.items()}
+            gaps = {url_id: gap for url_id, gap in gaps.items() if gap}
+            confirmed = {url_id: gap for url_id, gap in gaps.items() if self._gaps.get(url_id) == gap}
+            self._gaps = {url_id: gap for url_id, gap in gaps.items() if url_id not in confirmed}
+            if not confirmed:
+                await cache.redis_client.set(RECONCILE_SINCE_KEY, today.isoformat())
+                return 0
+
+            urls = URL.__table__
+            async with AsyncSessionLocal() as session:
+                connection = await session.connection()
+                await connection.execute(
+                    update(urls)
+                    .where(urls.c.id == bindparam("url_id"))
+                    .values(click_count=urls.c.click_count + bindparam("delta")),
+                    [{"url_id": url_id, "delta": gap} for url_id, gap in confirmed.items()]
+                )
+                await session.commit()
+            await cache.redis_client.set(RECONCILE_SINCE_KEY, today.isoformat())
+
+            self.reconciled += sum(abs(gap) for gap in confirmed.values())
+            print(f"✅ Reconciled click counts of {len(confirmed)} URLs")
+            return len(confirmed)
+        finally:
+            await cache.release_lock("clicks:drain", token)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        next_reconcile = time.monotonic() + self.reconcile_interval
+        while True:
+            try:
+                # Keep going while there is a backlog, then wait for the next tick
+                while await self.drain() >= self.drain_batch:
+                    pass
+                if time.monotonic() >= next_reconcile:
+                    next_reconcile = time.monotonic() + self.reconcile_interval
+                    await self.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Click counter drain error: {e}")
+            await asyncio.sleep(self.drain_interval)
+
+    def get_stats(self) -> dict:
+        return {
+            "drains": self.drains,
+            "drained_clicks": self.drained,
+            "duplicate_drains": self.duplicate_drains,
+            "reconciled_clicks": self.reconciled,
+            "send_failures": self.send_failures,
+            "unsent_clicks": sum(self._unsent.values()),
+        }
+
+
+# Global click counters
+click_counters = ClickCounters(
+    drain_interval=settings.CLICK_COUNTER_DRAIN_INTERVAL_SECONDS,
+    drain_batch=settings.CLICK_COUNTER_DRAIN_BATCH,
+    reconcile_interval=settings.CLICK_COUNTER_RECONCILE_INTERVAL_SECONDS,
+)
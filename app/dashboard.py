@@ -0,0 +1,74 @@
+"""Per-owner dashboard stats
+
+Everything is read from owner_stats and owner_click_rollups_daily, at most
+31 rows however many URLs and clicks the owner has, and the result is
+cached in Redis for DASHBOARD_CACHE_TTL_SECONDS. URL writes evict it so
+new links show up immediately; click totals may lag by the TTL.
+"""
+from datetime import datetime, timedelta
+
+from app.cache import cache
+from app.models import OwnerStats
+from app.rollups import owner_daily_clicks, daily_series
+from app.schemas import DashboardStats, DailyClickStats
+from app.config import settings
+
+DAILY_SERIES_DAYS = 30
+
+
+def dashboard_key(owner_id: int) -> str:
+    return f"dashboard:{owner_id}"
+
+
+async def build_dashboard(db, owner_id: int) -> DashboardStats:
+    stats = await db.get(OwnerStats, owner_id)
+    total_urls = stats.total_urls if stats else 0
+    total_clicks = stats.total_clicks if stats else 0
+
+    # Calendar days in UTC, today included
+    today = datetime.utcnow().date()
+    month_start = today - timedelta(days=DAILY_SERIES_DAYS - 1)
+    daily = await owner_daily_clicks(db, owner_id, month_start)
+
+    return DashboardStats(
+        total_urls=total_urls,
+        active_urls=stats.active_urls if stats else 0,
+        total_clicks=total_clicks,
+        clicks_today=daily.get(today, 0),
+        clicks_this_week=sum(c for day, c in daily.items() if day > today - timedelta(days=7)),
+        clicks_this_month=sum(daily.values()),
+        avg_clicks_per_url=round(total_clicks / max(total_urls, 1), 2),
+        daily_clicks=[DailyClickStats(**d) for d in daily_series(daily, month_start, today)],
+    )
+
+
+async def get_dashboard(db, owner_id: int) -> DashboardStats:
+    """Cached dashboard stats for an owner"""
+    if not cache.redis_client:
+        await cache.connect()
+
+    try:
+        cached = await cache.redis_client.get(dashboard_key(owner_id))
+        if cached:
+            return DashboardStats.model_validate_json(cached)
+    except Exception as e:
+        print(f"Redis GET dashboard error: {e}")
+
+    dashboard = await build_dashboard(db, owner_id)
+    try:
+        await cache.redis_client.setex(
+            dashboard_key(owner_id), settings.DASHBOARD_CACHE_TTL_SECONDS, dashboard.model_dump_json()
+        )
+    except Exception as e:
+        print(f"Redis SET dashboard error: {e}")
+    return dashboard
+
+
+async def invalidate_dashboard(owner_id: int):
+    if not cache.redis_client:
+        await cache.connect()
+
+    try:
+        await cache.redis_client.delete(dashboard_key(owner_id))
+    except Exception as e:
+        print(f"Redis DELETE dashboard error: {e}")
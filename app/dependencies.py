@@ -1,49 +1,100 @@
+from typing import Optional
 from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
+from fastapi.security import OAuth2PasswordBearer, APIKeyHeader
 from jose import JWTError, jwt
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.database import get_async_db
 from app.models import User
 from app.schemas import TokenData
+from app.principals import Principal, principal_cache
+from app.api_keys import api_key_verifier, is_api_key
 from app.config import settings
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login", auto_error=False)
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: AsyncSession = Depends(get_async_db)
-) -> User:
-    """Get the current authenticated user"""
-    credentials_exception = HTTPException(
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
+
+async def load_principal(db: AsyncSession, username: str) -> Principal:
+    """Principal for a verified subject, from the principal cache when possible"""
+    principal = await principal_cache.get(username)
+    if principal is not None:
+        return principal
+
+    result = await db.execute(select(User).where(User.username == username))
+    user = result.scalar_one_or_none()
+
+    if user is None:
+        raise credentials_exception()
+
+    principal = Principal.from_model(user)
+    await principal_cache.set(principal)
+    return principal
+
+
+def token_subject(token: str) -> str:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
-            raise credentials_exception
+            raise credentials_exception()
         token_data = TokenData(username=username)
     except JWTError:
-        raise credentials_exception
-    
-    result = await db.execute(select(User).where(User.username == token_data.username))
-    user = result.scalar_one_or_none()
-    
-    if user is None:
-        raise credentials_exception
-    
-    return user
+        raise credentials_exception()
+    return token_data.username
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    """Get the current authenticated user"""
+    return await load_principal(db, token_subject(token))
 
 
 async def get_current_active_user(
-    current_user: User = Depends(get_current_user)
-) -> User:
+    current_user: Principal = Depends(get_current_user)
+) -> Principal:
     """Ensure the current user is active"""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    return current_user
\ No newline at end of file
+    return current_user
+
+
+async def get_current_client(
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    api_key: Optional[str] = Depends(api_key_header),
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    """Like get_current_user, but also accepts an API key, either in X-API-Key
+    or as the Bearer credential"""
+    if api_key is None and token is not None and is_api_key(token):
+        api_key, token = token, None
+
+    if api_key is not None:
+        username = await api_key_verifier.verify(db, api_key)
+        if username is None:
+            raise credentials_exception()
+        return await load_principal(db, username)
+
+    if token is None:
+        raise credentials_exception()
+    return await load_principal(db, token_subject(token))
+
+
+async def get_current_active_client(
+    current_user: Principal = Depends(get_current_client)
+) -> Principal:
+    """Ensure the calling user, by token or API key, is active"""
+    if not current_user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return current_user
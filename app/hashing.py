@@ -0,0 +1,104 @@
+"""Password hashing off the event loop
+
+bcrypt takes 100-300ms of CPU per call. Run inline it stalls every request
+on the worker, redirects included, so register and login hand it to a small
+dedicated thread pool (bcrypt releases the GIL). At most
+PASSWORD_HASH_WORKERS hashes run at once and PASSWORD_HASH_MAX_PENDING may
+wait for a slot; past that, or after waiting PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS,
+callers get HashingBusy and the router answers 503 rather than letting a
+login spike queue up unbounded work.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from app.utils import pwd_context
+from app.config import settings
+
+
+class HashingBusy(Exception):
+    """The hashing pool is saturated"""
+
+
+class PasswordHasher:
+    def __init__(self, workers: int, max_pending: int, queue_timeout: float):
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        # Running plus waiting; the executor itself would queue without limit
+        self._slots = asyncio.Semaphore(workers + max_pending)
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.queue_ms_total = 0.0
+        self.queue_ms_max = 0.0
+        self.hash_ms_total = 0.0
+
+    async def _run(self, fn, *args):
+        if self._slots.locked():
+            self.rejected += 1
+            raise HashingBusy()
+
+        queued = time.perf_counter()
+        async with self._slots:
+            self.in_flight += 1
+            try:
+                started = None
+
+                def timed():
+                    nonlocal started
+                    started = time.perf_counter()
+                    return fn(*args)
+
+                future = asyncio.get_running_loop().run_in_executor(self._executor, timed)
+                try:
+                    result = await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+                except asyncio.TimeoutError:
+                    if started is None and future.cancel():
+                        self.rejected += 1
+                        raise HashingBusy()
+                    # Already hashing: it will finish shortly, so wait it out
+                    result = await future
+            finally:
+                self.in_flight -= 1
+
+        finished = time.perf_counter()
+        queue_ms = (started - queued) * 1000
+        self.completed += 1
+        self.queue_ms_total += queue_ms
+        self.queue_ms_max = max(self.queue_ms_max, queue_ms)
+        self.hash_ms_total += (finished - started) * 1000
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> tuple[bool, Optional[str]]:
+        """Check a password; also returns a new hash if the stored one uses an
+        outdated cost, so the caller can save it"""
+        valid, new_hash = await self._run(pwd_context.verify_and_update, password, hashed)
+        if new_hash is not None:
+            self.rehashed += 1
+        return valid, new_hash
+
+    def get_stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+            "avg_queue_ms": round(self.queue_ms_total / max(self.completed, 1), 2),
+            "max_queue_ms": round(self.queue_ms_max, 2),
+            "avg_hash_ms": round(self.hash_ms_total / max(self.completed, 1), 2),
+        }
+
+
+# Global password hasher
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+    queue_timeout=settings.PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS,
+)
@@ -0,0 +1,300 @@
+"""Streaming bulk import of URLs
+
+Rows are read incrementally from CSV (with an ``original_url`` column and
+optional ``custom_short_code``/``short_code``, ``title``, ``expires_at``) or
+NDJSON, validated with the same rules as the API, and loaded in chunks:
+COPY into a temporary staging table, then one INSERT ... SELECT ... ON
+CONFLICT into ``urls``. Progress is checkpointed in ``import_jobs`` in the
+same transaction as each chunk, so re-running a job with the same id resumes
+after the last committed row and never loads a row twice. Redis mirrors the
+progress and keeps the row errors. Also usable from the command line:
+
+    python -m app.importer links.csv --owner alice --job-id migration-1
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import uuid
+from datetime import datetime
+from typing import BinaryIO, Iterable, Iterator, Optional
+from pydantic import ValidationError
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.cache import cache, CachedURL
+from app.database import AsyncSessionLocal
+from app.models import User, URL, ImportJob
+from app.schemas import URLCreate
+from app.utils import is_valid_short_code
+from app.bloom import short_code_bloom
+from app.allocator import allocate_short_code
+from app.rollups import adjust_owner_urls
+from app.dashboard import invalidate_dashboard
+from app.config import settings
+
+STAGE_TABLE = "urls_import_stage"
+STAGE_COLUMNS = ["original_url", "short_code", "title", "owner_id", "expires_at", "created_at", "is_active"]
+MAX_ALLOCATION_ATTEMPTS = 10
+PROGRESS_TTL_SECONDS = 7 * 24 * 3600
+
+
+def read_rows(stream: BinaryIO, fmt: str) -> Iterator[tuple[int, object]]:
+    """Yield (row number, dict) pairs, or (row number, error message) for unparseable rows"""
+    # utf-8-sig drops the byte order mark spreadsheet exports start with
+    text_stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        for number, row in enumerate(csv.DictReader(text_stream), start=1):
+            yield number, row
+        return
+
+    for number, line in enumerate(text_stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield number, f"Invalid JSON: {e.msg}"
+            continue
+        yield number, row if isinstance(row, dict) else "Row must be a JSON object"
+
+
+def validate_row(row: dict) -> URLCreate:
+    """Apply the API's URLCreate and short code rules to an imported row"""
+    data = {k: v for k, v in row.items() if v not in (None, "")}
+    if "short_code" in data:
+        data.setdefault("custom_short_code", data.pop("short_code"))
+
+    url_data = URLCreate.model_validate(data)
+    if url_data.custom_short_code and not is_valid_short_code(url_data.custom_short_code):
+        raise ValueError("Invalid custom short code format")
+    return url_data
+
+
+class URLImporter:
+    def __init__(
+        self,
+        owner_id: int,
+        job_id: Optional[str] = None,
+        chunk_size: int = settings.IMPORT_CHUNK_SIZE,
+        warm_cache: bool = False,
+    ):
+        self.owner_id = owner_id
+        self.job_id = job_id or uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self.warm_cache = warm_cache
+        # Scoped to the owner, so one user can never read or resume another's job
+        self.key = f"import:{owner_id}:{self.job_id}"
+        self.rows_read = 0
+        self.imported = 0
+        self.failed = 0
+        self.resumed_from = 0
+        self.errors: list[dict] = []
+        self._chunk_errors: list[dict] = []
+
+    async def _load_progress(self):
+        if not cache.redis_client:
+            await cache.connect()
+
+        async with AsyncSessionLocal() as session:
+            job = await session.get(ImportJob, (self.owner_id, self.job_id))
+        if job is not None:
+            self.resumed_from = job.rows
+            self.imported = job.imported
+            self.failed = job.failed
+
+    def _error(self, number: int, message: str):
+        self.failed += 1
+        self._chunk_errors.append({"row": number, "error": message})
+
+    async def run(self, rows: Iterable[tuple[int, object]]) -> dict:
+        await self._load_progress()
+
+        chunk: list[tuple[int, URLCreate]] = []
+        for number, row in rows:
+            self.rows_read = number
+            if number <= self.resumed_from:
+                continue
+
+            if isinstance(row, str):
+                self._error(number, row)
+                continue
+            try:
+                chunk.append((number, validate_row(row)))
+            except ValidationError as e:
+                self._error(number, "; ".join(err["msg"] for err in e.errors()))
+            except ValueError as e:
+                self._error(number, str(e))
+
+            if len(chunk) >= self.chunk_size:
+                await self._flush(chunk)
+                chunk = []
+
+        await self._flush(chunk, status="done")
+        return self.report()
+
+    async def _checkpoint(self, session, imported: int, status: str):
+        values = {
+            "owner_id": self.owner_id,
+            "job_id": self.job_id,
+            "rows": self.rows_read,
+            "imported": imported,
+            "failed": self.failed,
+            "status": status,
+            "updated_at": datetime.utcnow(),
+        }
+        stmt = pg_insert(ImportJob).values(values)
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[ImportJob.owner_id, ImportJob.job_id],
+            set_={column: stmt.excluded[column] for column in ("rows", "imported", "failed", "status", "updated_at")}
+        ))
+
+    async def _flush(self, chunk: list[tuple[int, URLCreate]], status: str = "running"):
+        created = []
+        async with AsyncSessionLocal() as session:
+            if chunk:
+                created = await self._load_chunk(session, chunk)
+                await adjust_owner_urls(session, self.owner_id, total=len(created), active=len(created))
+            # Same transaction as the rows, so a resumed job neither skips nor repeats them
+            await self._checkpoint(session, self.imported + len(created), status)
+            await session.commit()
+        self.imported += len(created)
+
+        try:
+            pipe = cache.redis_client.pipeline(transaction=True)
+            pipe.hset(self.key, mapping={
+                "rows": self.rows_read,
+                "imported": self.imported,
+                "failed": self.failed,
+                "status": status,
+            })
+            if self._chunk_errors:
+                pipe.rpush(f"{self.key}:errors", *[json.dumps(e) for e in self._chunk_errors])
+            pipe.expire(self.key, PROGRESS_TTL_SECONDS)
+            pipe.expire(f"{self.key}:errors", PROGRESS_TTL_SECONDS)
+            await pipe.execute()
+        except Exception as e:
+            print(f"Redis import progress error: {e}")
+
+        remaining = settings.IMPORT_MAX_REPORTED_ERRORS - len(self.errors)
+        self.errors.extend(self._chunk_errors[:max(remaining, 0)])
+        self._chunk_errors = []
+
+        if created:
+            await invalidate_dashboard(self.owner_id)
+        if self.warm_cache and created:
+            await cache.store_new_urls(
+                [(row.short_code, CachedURL.from_model(row)) for row in created],
+                bloom=short_code_bloom
+            )
+        elif created:
+            # Still keep the filter exact, otherwise imported codes would 404
+            await short_code_bloom.add([row.short_code for row in created])
+
+    async def _load_chunk(self, session, chunk: list[tuple[int, URLCreate]]) -> list:
+        await session.execute(text(
+            f"CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} ON COMMIT DELETE ROWS AS "
+            f"SELECT {', '.join(STAGE_COLUMNS)} FROM {URL.__tablename__} WITH NO DATA"
+        ))
+        connection = await session.connection()
+        raw = (await connection.get_raw_connection()).driver_connection
+
+        now = datetime.utcnow()
+        custom = set()
+        pending = {}
+        for number, url_data in chunk:
+            code = url_data.custom_short_code
+            if code is None:
+                continue
+            if code in custom:
+                self._error(number, "Duplicate custom short code in import")
+            else:
+                custom.add(code)
+                pending[code] = (number, url_data)
+        for number, url_data in chunk:
+            if url_data.custom_short_code is None:
+                pending[await self._allocate(pending)] = (number, url_data)
+
+        created = []
+        for _ in range(MAX_ALLOCATION_ATTEMPTS):
+            await raw.copy_records_to_table(
+                STAGE_TABLE,
+                records=[
+                    (str(u.original_url), code, u.title, self.owner_id, u.expires_at, now, True)
+                    for code, (_, u) in pending.items()
+                ],
+                columns=STAGE_COLUMNS,
+            )
+            result = await session.execute(text(
+                f"INSERT INTO {URL.__tablename__} ({', '.join(STAGE_COLUMNS)}) "
+                f"SELECT {', '.join(STAGE_COLUMNS)} FROM {STAGE_TABLE} "
+                f"ON CONFLICT (short_code) DO NOTHING "
+                f"RETURNING id, original_url, short_code, expires_at, is_active, owner_id"
+            ))
+            inserted = {row.short_code: row for row in result}
+            created.extend(inserted.values())
+            await session.execute(text(f"DELETE FROM {STAGE_TABLE}"))
+
+            retry = {}
+            for code, (number, url_data) in pending.items():
+                if code in inserted:
+                    continue
+                if code in custom:
+                    self._error(number, "Custom short code already exists")
+                else:
+                    retry[await self._allocate(retry)] = (number, url_data)
+            pending = retry
+            if not pending:
+                break
+
+        for number, _ in pending.values():
+            self._error(number, "Could not allocate a short code")
+        return created
+
+    async def _allocate(self, taken: dict) -> str:
+        # Collisions with existing codes are left to ON CONFLICT
+        short_code = await allocate_short_code()
+        while short_code in taken:
+            short_code = await allocate_short_code()
+        return short_code
+
+    def report(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "rows_read": self.rows_read,
+            "resumed_from": self.resumed_from,
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+async def main(path: str, owner: str, fmt: str, job_id: Optional[str], warm_cache: bool):
+    await cache.connect()
+    try:
+        async with AsyncSessionLocal() as session:
+            owner_id = await session.scalar(select(User.id).where(User.username == owner))
+        if owner_id is None:
+            raise SystemExit(f"Unknown user: {owner}")
+
+        importer = URLImporter(owner_id, job_id=job_id, warm_cache=warm_cache)
+        print(f"✅ Import {importer.job_id} started")
+        with open(path, "rb") as stream:
+            report = await importer.run(read_rows(stream, fmt))
+        print(json.dumps(report, indent=2))
+    finally:
+        await cache.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import URLs from CSV or NDJSON")
+    parser.add_argument("path")
+    parser.add_argument("--owner", required=True, help="Username that will own the imported URLs")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="Defaults to the file extension")
+    parser.add_argument("--job-id", help="Reuse to resume an interrupted import")
+    parser.add_argument("--warm-cache", action="store_true", help="Pre-warm the redirect cache")
+    args = parser.parse_args()
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    asyncio.run(main(args.path, args.owner, fmt, args.job_id, args.warm_cache))
@@ -1,9 +1,23 @@
-from fastapi import FastAPI
+import hmac
+from typing import Optional
+from fastapi import FastAPI, Depends, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 from app.routers import auth, urls, analytics
 from app.cache import cache
+from app.clicks import click_pipeline
+from app.bloom import short_code_bloom
+from app.counters import click_counters
+from app.partitions import click_partitions
+from app.retention import retention_job
+from app.principals import principal_cache
+from app.hashing import password_hasher
+from app.api_keys import api_key_verifier
+from app.middleware.rate_limiter import RateLimiterMiddleware, rate_limiter
+from app.allocator import short_code_allocator
+from app.pagination import NEXT_CURSOR_HEADER
+from app.config import settings
 
 
 @asynccontextmanager
@@ -11,9 +25,22 @@ async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
     # Startup
     await cache.connect()
+    await cache.start_invalidation_listener()
     print("✅ Redis cache connected")
+    if settings.SHORT_CODE_BLOOM_ENABLED:
+        await short_code_bloom.start()
+    await click_pipeline.start()
+    await click_counters.start()
+    await click_partitions.start()
+    await retention_job.start()
     yield
     # Shutdown
+    await click_pipeline.stop()
+    await click_counters.stop()
+    await click_partitions.stop()
+    await retention_job.stop()
+    print("✅ Click buffer flushed")
+    await short_code_bloom.stop()
     await cache.disconnect()
     print("❌ Redis cache disconnected")
 
@@ -25,6 +52,10 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Added before CORS so CORS stays outermost and 429s still carry its headers
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimiterMiddleware, limiter=rate_limiter)
+
 # ✅ CORS Middleware - Allow both localhost and 127.0.0.1
 app.add_middleware(
     CORSMiddleware,
@@ -37,13 +68,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["*"],
+    # Listed explicitly too: browsers ignore "*" on credentialed requests
+    expose_headers=["*", NEXT_CURSOR_HEADER],
 )
 
 # ✅ Register routers
 app.include_router(auth.router)
 app.include_router(urls.api_router)       # API routes at /api/v1/urls/
-app.include_router(urls.redirect_router)  # Redirect at /{short_code}
 app.include_router(analytics.router)
 
 
@@ -78,4 +109,35 @@ async def health_check():
             "status": "degraded",
             "redis": "error",
             "error": str(e)
-        }
\ No newline at end of file
+        }
+
+
+def require_metrics_token(x_metrics_token: Optional[str] = Header(default=None)):
+    """Internal only: 404 unless METRICS_TOKEN is set and presented"""
+    if not settings.METRICS_TOKEN or not x_metrics_token or not hmac.compare_digest(
+        x_metrics_token.encode("utf-8"), settings.METRICS_TOKEN.encode("utf-8")
+    ):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@app.get("/metrics", dependencies=[Depends(require_metrics_token)], include_in_schema=False)
+async def metrics():
+    """Internal counters for tuning caches and background workers"""
+    return {
+        "cache": cache.get_stats(),
+        "clicks": click_pipeline.get_stats(),
+        "counters": click_counters.get_stats(),
+        "partitions": click_partitions.get_stats(),
+        "retention": retention_job.get_stats(),
+        "principals": principal_cache.get_stats(),
+        "password_hashing": password_hasher.get_stats(),
+        "api_keys": api_key_verifier.get_stats(),
+        "rate_limiter": rate_limiter.get_stats(),
+        "bloom": short_code_bloom.get_stats(),
+        "allocator": short_code_allocator.get_stats(),
+        "redirect_lookups": urls.url_lookups.get_stats()
+    }
+
+
+# ✅ Registered last: the catch-all /{short_code} would otherwise shadow /health and /metrics
+app.include_router(urls.redirect_router)  # Redirect at /{short_code}
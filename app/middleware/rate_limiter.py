@@ -1,57 +1,260 @@
-from fastapi import Request, HTTPException, status
-from starlette.middleware.base import BaseHTTPMiddleware
-from datetime import datetime, timedelta
-import redis.asyncio as redis
+"""Rate limiting as plain ASGI middleware
+
+Each request is matched to a policy (login, API, redirect) and a key: the
+user for API calls that carry a valid token or a recently verified API key,
+the client IP otherwise. Limits are enforced with GCRA, a token bucket
+stored as a single timestamp, in one atomic Lua call per request; the
+script reads Redis' own clock so workers never disagree about time.
+
+An optional local leaky bucket with the same rate runs first. One worker
+can never legitimately see more traffic for a key than the whole fleet is
+allowed, so when the local bucket overflows the request is refused without
+asking Redis; abusive bursts stay off the network. If Redis is unreachable,
+requests that pass the local check are allowed.
+"""
+import json
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+from jose import JWTError, jwt
+
+from app.cache import cache
+from app.api_keys import api_key_cache_key, hash_key, is_api_key
 from app.config import settings
 
+# Returns {allowed, remaining, retry_after_ms, reset_ms}
+GCRA_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local capacity = interval * tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+local allow_at = new_tat - capacity
+if allow_at > now then
+    return {0, 0, allow_at - now, tat - now}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', new_tat - now)
+return {1, math.floor((now - allow_at) / interval), 0, new_tat - now}
+"""
+
+# While Redis is down every request fails over; report it once per interval
+ERROR_LOG_INTERVAL_SECONDS = 60
+
+EXEMPT_PATHS = {"/", "/health", "/metrics", "/docs", "/redoc", "/openapi.json", "/favicon.ico"}
+LOGIN_PATHS = {"/api/v1/auth/login", "/api/v1/auth/register"}
+
+
+class Policy(NamedTuple):
+    name: str
+    per_minute: int
+    burst: int
+    by_user: bool
+
+    @property
+    def interval_ms(self) -> int:
+        return max(1, 60000 // self.per_minute)
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    remaining: int
+    retry_after_ms: int
+    reset_ms: int
+
+
+class LocalLeakyBucket:
+    """Per-worker pre-check; bounded LRU of bucket levels"""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._levels: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+
+    def allow(self, key: str, policy: Policy) -> Optional[Decision]:
+        """None if the request may go on to Redis, else a refusal"""
+        now = time.monotonic() * 1000
+        level, last = self._levels.get(key, (0.0, now))
+        # Drains one request per interval
+        level = max(0.0, level - (now - last) / policy.interval_ms)
+        if level + 1 > policy.burst:
+            self._levels[key] = (level, now)
+            self._levels.move_to_end(key)
+            retry_after = int((level + 1 - policy.burst) * policy.interval_ms)
+            return Decision(False, 0, retry_after, int(level * policy.interval_ms))
+
+        self._levels[key] = (level + 1, now)
+        self._levels.move_to_end(key)
+        while len(self._levels) > self.max_keys:
+            self._levels.popitem(last=False)
+        return None
+
+    def refund(self, key: str):
+        """Take back a request the fleet-wide limit refused, so the local
+        level never runs ahead of the shared one"""
+        entry = self._levels.get(key)
+        if entry is not None:
+            self._levels[key] = (max(0.0, entry[0] - 1), entry[1])
+
+
+def header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class RateLimiter:
+    def __init__(self, policies: dict, local_precheck: bool, local_max_keys: int):
+        self.policies = policies
+        self.local = LocalLeakyBucket(local_max_keys) if local_precheck else None
+        self._script = None
+        self.allowed = 0
+        self.limited = 0
+        self.local_limited = 0
+        self.errors = 0
+        self._error_logged_at: Optional[float] = None
+
+    def policy_for(self, method: str, path: str) -> Optional[Policy]:
+        if method == "OPTIONS" or path in EXEMPT_PATHS:
+            return None
+        if path in LOGIN_PATHS:
+            return self.policies["login"]
+        if path.startswith("/api/"):
+            return self.policies["api"]
+        return self.policies["redirect"]
+
+    def identity(self, scope, policy: Policy) -> str:
+        """Verified user if the request proves one cheaply, else client IP"""
+        if policy.by_user:
+            user = self._user(scope)
+            if user:
+                return f"user:{user}"
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    def _user(self, scope) -> Optional[str]:
+        credential = header(scope, b"x-api-key")
+        authorization = header(scope, b"authorization")
+        if credential is None and authorization and authorization[:7].lower() == "bearer ":
+            credential = authorization[7:]
+        if not credential:
+            return None
+
+        if is_api_key(credential):
+            # Only keys this worker has verified; anything else counts against the IP
+            username = cache.local.get(api_key_cache_key(hash_key(credential)))
+            return username if isinstance(username, str) else None
+        try:
+            return jwt.decode(credential, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]).get("sub")
+        except JWTError:
+            return None
+
+    async def check(self, key: str, policy: Policy) -> Decision:
+        if self.local is not None:
+            decision = self.local.allow(key, policy)
+            if decision is not None:
+                self.local_limited += 1
+                return decision
+
+        if not cache.redis_client:
+            await cache.connect()
+        if self._script is None:
+            self._script = cache.redis_client.register_script(GCRA_SCRIPT)
 
-class RateLimiterMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, redis_url: str = None):
-        super().__init__(app)
-        self.redis_url = redis_url or settings.REDIS_URL
-        self.redis_client = None
-        self.rate_limit = settings.RATE_LIMIT_PER_MINUTE
-    
-    async def dispatch(self, request: Request, call_next):
-        # Initialize Redis client if not already done
-        if self.redis_client is None:
-            self.redis_client = await redis.from_url(self.redis_url, decode_responses=True)
-        
-        # Get client IP
-        client_ip = request.client.host
-        
-        # Create rate limit key
-        now = datetime.utcnow()
-        minute_key = f"rate_limit:{client_ip}:{now.strftime('%Y%m%d%H%M')}"
-        
         try:
-            # Increment counter
-            current_count = await self.redis_client.incr(minute_key)
-            
-            # Set expiry on first request
-            if current_count == 1:
-                await self.redis_client.expire(minute_key, 60)
-            
-            # Check if rate limit exceeded
-            if current_count > self.rate_limit:
-                raise HTTPException(
-                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                    detail="Rate limit exceeded. Please try again later."
-                )
-            
-            # Process request
-            response = await call_next(request)
-            
-            # Add rate limit headers
-            response.headers["X-RateLimit-Limit"] = str(self.rate_limit)
-            response.headers["X-RateLimit-Remaining"] = str(max(0, self.rate_limit - current_count))
-            response.headers["X-RateLimit-Reset"] = str(int((now + timedelta(minutes=1)).timestamp()))
-            
-            return response
-            
-        except HTTPException:
-            raise
+            result = await self._script(keys=[f"rl:{key}"], args=[policy.interval_ms, policy.burst])
         except Exception as e:
-            # If Redis is down, allow the request
-            print(f"Rate limiter error: {e}")
-            return await call_next(request)
\ No newline at end of file
+            self.errors += 1
+            now = time.monotonic()
+            if self._error_logged_at is None or now - self._error_logged_at >= ERROR_LOG_INTERVAL_SECONDS:
+                self._error_logged_at = now
+                print(f"Redis rate limit error ({self.errors} so far, allowing requests): {e}")
+            return Decision(True, policy.burst, 0, 0)
+
+        decision = Decision(bool(result[0]), int(result[1]), int(result[2]), int(result[3]))
+        if decision.allowed:
+            self.allowed += 1
+        else:
+            self.limited += 1
+            if self.local is not None:
+                self.local.refund(key)
+        return decision
+
+    def get_stats(self) -> dict:
+        return {
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "local_limited": self.local_limited,
+            "errors": self.errors,
+            "policies": {name: policy._asdict() for name, policy in self.policies.items()},
+        }
+
+
+def rate_limit_headers(policy: Policy, decision: Decision) -> list:
+    headers = [
+        (b"x-ratelimit-limit", str(policy.burst).encode()),
+        (b"x-ratelimit-remaining", str(decision.remaining).encode()),
+        # When the bucket is full again, as a Unix timestamp
+        (b"x-ratelimit-reset", str(int(time.time() + decision.reset_ms / 1000)).encode()),
+    ]
+    if not decision.allowed:
+        headers.append((b"retry-after", str(max(1, -(-decision.retry_after_ms // 1000))).encode()))
+    return headers
+
+
+class RateLimiterMiddleware:
+    def __init__(self, app, limiter: "RateLimiter" = None):
+        self.app = app
+        self.limiter = limiter or rate_limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        policy = self.limiter.policy_for(scope["method"], scope["path"])
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = f"{policy.name}:{self.limiter.identity(scope, policy)}"
+        decision = await self.limiter.check(key, policy)
+        headers = rate_limit_headers(policy, decision)
+
+        if not decision.allowed:
+            body = json.dumps({"detail": "Rate limit exceeded. Please try again later."}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    *headers,
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), *headers]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+# Global rate limiter
+rate_limiter = RateLimiter(
+    policies={
+        "redirect": Policy(
+            "redirect", settings.RATE_LIMIT_REDIRECT_PER_MINUTE, settings.RATE_LIMIT_REDIRECT_BURST, by_user=False
+        ),
+        "api": Policy("api", settings.RATE_LIMIT_PER_MINUTE, settings.RATE_LIMIT_BURST, by_user=True),
+        "login": Policy("login", settings.RATE_LIMIT_LOGIN_PER_MINUTE, settings.RATE_LIMIT_LOGIN_BURST, by_user=False),
+    },
+    local_precheck=settings.RATE_LIMIT_LOCAL_PRECHECK,
+    local_max_keys=settings.RATE_LIMIT_LOCAL_MAX_KEYS,
+)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Boolean, ForeignKey, DateTime, Date, Index, Sequence, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -17,6 +17,20 @@ class User(Base):
     urls = relationship("URL", back_populates="owner", cascade="all, delete-orphan")
 
 
+class ApiKey(Base):
+    """Long-lived credential for machine clients, see app.api_keys"""
+    __tablename__ = "api_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    name = Column(String(100), nullable=False)
+    # Public part of the key, for the lookup; the secret is only ever stored hashed
+    prefix = Column(String(16), unique=True, index=True, nullable=False)
+    key_hash = Column(String(64), nullable=False)
+    is_active = Column(Boolean, default=True, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
 class URL(Base):
     __tablename__ = "urls"
 
@@ -31,21 +45,111 @@ class URL(Base):
     
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     expires_at = Column(DateTime, nullable=True)
+    # Drained from Redis counters by app.counters; add ClickCounters.pending() for live totals
+    click_count = Column(BigInteger, server_default="0", nullable=False)
 
     # ✅ FIX: Changed from 'owner' to match back_populates
     owner = relationship("User", back_populates="urls")
     clicks = relationship("Click", back_populates="url", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # URL listing, newest first with keyset pagination
+        Index("ix_urls_owner_id_created_at", "owner_id", "created_at", "id"),
+        # All-time top URLs
+        Index("ix_urls_owner_id_click_count", "owner_id", "click_count"),
+        # Redirect lookups of live links, answered without touching the heap
+        Index(
+            "ix_urls_active_short_code", "short_code",
+            postgresql_include=["id", "owner_id", "expires_at", "is_active", "original_url"],
+            postgresql_where=text("is_active IS TRUE"),
+        ),
+    )
+
 
 class Click(Base):
+    """Raw clicks, range-partitioned by month on clicked_at (see app.partitions)"""
     __tablename__ = "clicks"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, Sequence("clicks_id_seq"), primary_key=True, index=True)
     url_id = Column(Integer, ForeignKey("urls.id", ondelete="CASCADE"), nullable=False)
     ip_address = Column(String(45))
     user_agent = Column(Text)
     referrer = Column(Text)
     country = Column(String(2), nullable=True)
-    clicked_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Part of the key because a partitioned table's key must include the partition column
+    clicked_at = Column(DateTime, default=datetime.utcnow, nullable=False, primary_key=True)
+
+    url = relationship("URL", back_populates="clicks")
+
+    __table_args__ = (
+        # Per-URL click listing and time-range analytics
+        Index("ix_clicks_url_id_clicked_at", "url_id", "clicked_at", "id"),
+        {"postgresql_partition_by": "RANGE (clicked_at)"},
+    )
+
+
+class ClickRollupHourly(Base):
+    """Clicks per URL per hour, maintained by app.rollups"""
+    __tablename__ = "click_rollups_hourly"
+    __table_args__ = (
+        # Retention deletes expired buckets across every URL
+        Index("ix_click_rollups_hourly_bucket", "bucket"),
+    )
+
+    url_id = Column(Integer, ForeignKey("urls.id", ondelete="CASCADE"), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    clicks = Column(BigInteger, nullable=False, default=0)
+
+
+class ClickRollupDaily(Base):
+    """Clicks per URL per UTC day, maintained by app.rollups"""
+    __tablename__ = "click_rollups_daily"
+    __table_args__ = (
+        # Click count reconcile finds recently clicked URLs by day
+        Index("ix_click_rollups_daily_day", "day"),
+    )
+
+    url_id = Column(Integer, ForeignKey("urls.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    clicks = Column(BigInteger, nullable=False, default=0)
+
+
+class OwnerClickRollupDaily(Base):
+    """Clicks across all of an owner's URLs per UTC day, maintained by app.rollups"""
+    __tablename__ = "owner_click_rollups_daily"
+
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    clicks = Column(BigInteger, nullable=False, default=0)
+
+
+class OwnerStats(Base):
+    """Running per-owner totals behind the dashboard, maintained by app.rollups"""
+    __tablename__ = "owner_stats"
+
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    total_urls = Column(Integer, nullable=False, default=0)
+    active_urls = Column(Integer, nullable=False, default=0)
+    total_clicks = Column(BigInteger, nullable=False, default=0)
+
+
+class ClickCounterDrain(Base):
+    """Counter drains already folded into urls.click_count, see app.counters"""
+    __tablename__ = "click_counter_drains"
+
+    drain_id = Column(String(64), primary_key=True)
+    applied_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ImportJob(Base):
+    """Checkpoint of a bulk import, committed with each chunk; see app.importer"""
+    __tablename__ = "import_jobs"
 
-    url = relationship("URL", back_populates="clicks")
\ No newline at end of file
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    job_id = Column(String(64), primary_key=True)
+    # Last input row whose outcome is committed
+    rows = Column(Integer, nullable=False, default=0)
+    imported = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    status = Column(String(16), nullable=False, default="running")
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -0,0 +1,48 @@
+"""Keyset pagination helpers
+
+A cursor is the (timestamp, id) of the last row served, base64url encoded
+so clients treat it as opaque. The next page starts strictly after that
+key in descending order, which an index on (owner/url, timestamp, id)
+answers without reading any of the skipped rows.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(at: datetime, row_id: int) -> str:
+    raw = json.dumps([at.isoformat(), row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError for anything else"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        at, row_id = json.loads(raw)
+        return datetime.fromisoformat(at), int(row_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def paginate(query, time_column, id_column, cursor, skip: int, limit: int):
+    """Newest first; keyset when a cursor is given, otherwise the old offset"""
+    query = query.order_by(time_column.desc(), id_column.desc()).limit(limit)
+    if cursor:
+        at, row_id = decode_cursor(cursor)
+        # The plain bound is implied by the row comparison, but only it lets
+        # Postgres prune partitions of a time-partitioned table
+        return query.where(time_column <= at, tuple_(time_column, id_column) < (at, row_id))
+    return query.offset(skip)
+
+
+def next_cursor(rows: list, limit: int, time_attr: str) -> Optional[str]:
+    """Cursor after the last row, or None when this was the last page"""
+    if len(rows) < limit:
+        return None
+    return encode_cursor(getattr(rows[-1], time_attr), rows[-1].id)
@@ -0,0 +1,164 @@
+"""Monthly range partitions of the clicks table
+
+Partitions are named clicks_pYYYYMM and cover one UTC calendar month. A
+background task keeps CLICK_PARTITION_MONTHS_AHEAD future months created,
+so inserts never hit a missing range. Clicks outside every month, such as
+late ones for a month already dropped, land in the DEFAULT partition
+instead of failing their batch. Expired partitions are dropped by the
+retention job (app.retention) once their clicks are folded into rollups;
+dropping is a metadata operation, unlike DELETE.
+"""
+import asyncio
+import re
+import time
+from datetime import date, datetime
+from typing import Optional
+from sqlalchemy import text
+
+from app.cache import cache
+from app.database import AsyncSessionLocal
+from app.models import Click
+from app.config import settings
+
+PARTITION_NAME = re.compile(rf"^{Click.__tablename__}_p(\d{{4}})(\d{{2}})$")
+DEFAULT_PARTITION = f"{Click.__tablename__}_default"
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{Click.__tablename__}_p{month:%Y%m}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    """Month covered by a partition name, None for tables we don't manage"""
+    match = PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def partition_ranges(first: date, last: date) -> list[tuple[str, date, date]]:
+    """(name, from, to) for every month from first to last inclusive"""
+    ranges = []
+    month = month_start(first)
+    while month <= last:
+        upper = add_months(month, 1)
+        ranges.append((partition_name(month), month, upper))
+        month = upper
+    return ranges
+
+
+def expired_partitions(names: list[str], cutoff: date) -> list[str]:
+    """Partitions whose whole month is before cutoff"""
+    return [
+        name for name in names
+        if partition_month(name) is not None and add_months(partition_month(name), 1) <= cutoff
+    ]
+
+
+class ClickPartitionManager:
+    def __init__(self, months_ahead: int, interval: int):
+        self.months_ahead = months_ahead
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.created = 0
+        self.dropped = 0
+        self.partitions = 0
+        self.last_run: Optional[float] = None
+
+    async def existing(self, session) -> list[str]:
+        """Names of the partitions currently attached to clicks"""
+        result = await session.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :parent"
+        ), {"parent": Click.__tablename__})
+        return [name for name, in result]
+
+    async def maintain(self) -> list[str]:
+        """Create upcoming partitions; one worker at a time"""
+        token = await cache.try_lock("clicks:partitions", 300000)
+        if token is None:
+            return []
+
+        try:
+            today = datetime.utcnow().date()
+            created = []
+            async with AsyncSessionLocal() as session:
+                existing = set(await self.existing(session))
+                if DEFAULT_PARTITION not in existing:
+                    await session.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {Click.__tablename__} DEFAULT"
+                    ))
+                    created.append(DEFAULT_PARTITION)
+                for name, lower, upper in partition_ranges(today, add_months(today, self.months_ahead)):
+                    if name in existing:
+                        continue
+                    await session.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {Click.__tablename__} "
+                        f"FOR VALUES FROM ('{lower.isoformat()} 00:00:00+00') TO ('{upper.isoformat()} 00:00:00+00')"
+                    ))
+                    created.append(name)
+                await session.commit()
+
+            self.created += len(created)
+            self.partitions = len(existing) + len(created)
+            self.last_run = time.time()
+            for name in created:
+                print(f"✅ Created click partition {name}")
+            return created
+        finally:
+            await cache.release_lock("clicks:partitions", token)
+
+    async def drop(self, session, name: str):
+        """Detach and drop one partition; caller commits"""
+        await session.execute(text(f"ALTER TABLE {Click.__tablename__} DETACH PARTITION {name}"))
+        await session.execute(text(f"DROP TABLE {name}"))
+        self.dropped += 1
+        self.partitions -= 1
+        print(f"🗑️ Dropped click partition {name}")
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.maintain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Click partition maintenance error: {e}")
+            await asyncio.sleep(self.interval)
+
+    def get_stats(self) -> dict:
+        return {
+            "partitions": self.partitions,
+            "created": self.created,
+            "dropped": self.dropped,
+            "last_run": self.last_run,
+        }
+
+
+# Global click partition manager
+click_partitions = ClickPartitionManager(
+    months_ahead=settings.CLICK_PARTITION_MONTHS_AHEAD,
+    interval=settings.CLICK_PARTITION_CHECK_INTERVAL_SECONDS,
+)
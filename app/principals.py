@@ -0,0 +1,142 @@
+"""Cache of authenticated principals
+
+get_current_user used to load the User row on every authenticated call just
+to check is_active. The few fields endpoints actually read are now kept as
+an immutable Principal, keyed by the token subject, in a small LRU of its
+own for PRINCIPAL_LOCAL_TTL_SECONDS (so logins never evict cached URLs)
+and in Redis for PRINCIPAL_CACHE_TTL_SECONDS. Any change to a user, and
+registering a username that was freed, must call invalidate_principal,
+which drops the Redis copy and every worker's local copy through the cache
+invalidation channel.
+"""
+import json
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from app.cache import cache, LocalCache, ENTRY_OVERHEAD_BYTES
+from app.config import settings
+
+
+class Principal(NamedTuple):
+    """The authenticated user, detached from any session"""
+    id: int
+    username: str
+    email: str
+    is_active: bool
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_model(cls, user) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            is_active=bool(user.is_active),
+            created_at=user.created_at,
+        )
+
+
+def principal_key(subject: str) -> str:
+    # The colon keeps it apart from short codes, which are alphanumeric
+    return f"principal:{subject}"
+
+
+def encode_principal(principal: Principal) -> str:
+    return json.dumps({
+        **principal._asdict(),
+        "created_at": principal.created_at.isoformat() if principal.created_at else None,
+    })
+
+
+def decode_principal(data: str) -> Optional[Principal]:
+    try:
+        fields = json.loads(data)
+        created_at = fields.pop("created_at")
+        return Principal(**fields, created_at=datetime.fromisoformat(created_at) if created_at else None)
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+class PrincipalCache:
+    def __init__(self, ttl: int, local_ttl: int, local_max_entries: int, local_max_bytes: int):
+        self.ttl = ttl
+        self.local = LocalCache(max_entries=local_max_entries, max_bytes=local_max_bytes, ttl=local_ttl)
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        # Other workers' invalidations arrive through the URL cache's listener
+        cache.key_invalidation_hooks.append(self.local.delete)
+        cache.reconnect_hooks.append(self.local.clear)
+
+    def _cache_local(self, principal: Principal):
+        key = principal_key(principal.username)
+        self.local.set(key, principal, size=len(key) + len(principal.email) + ENTRY_OVERHEAD_BYTES)
+
+    async def get(self, subject: str) -> Optional[Principal]:
+        """Cached principal for a token subject, or None on a miss"""
+        principal = self.local.get(principal_key(subject))
+        if isinstance(principal, Principal):
+            self.local_hits += 1
+            return principal
+
+        if not cache.redis_client:
+            await cache.connect()
+
+        try:
+            data = await cache.redis_client.get(principal_key(subject))
+        except Exception as e:
+            print(f"Redis GET principal error: {e}")
+            data = None
+
+        principal = decode_principal(data) if data else None
+        if principal is None:
+            self.misses += 1
+            return None
+
+        self.redis_hits += 1
+        self._cache_local(principal)
+        return principal
+
+    async def set(self, principal: Principal):
+        self._cache_local(principal)
+        try:
+            await cache.redis_client.setex(principal_key(principal.username), self.ttl, encode_principal(principal))
+        except Exception as e:
+            print(f"Redis SET principal error: {e}")
+
+    async def invalidate(self, subject: str):
+        """Forget a principal on every worker"""
+        if not cache.redis_client:
+            await cache.connect()
+
+        try:
+            await cache.redis_client.delete(principal_key(subject))
+        except Exception as e:
+            print(f"Redis DELETE principal error: {e}")
+
+        self.local.delete(principal_key(subject))
+        await cache.invalidate_local(principal_key(subject))
+
+    def get_stats(self) -> dict:
+        lookups = self.local_hits + self.redis_hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.local_hits + self.redis_hits) / max(lookups, 1), 4),
+            "local": self.local.get_stats(),
+        }
+
+
+# Global principal cache
+principal_cache = PrincipalCache(
+    ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+    local_ttl=settings.PRINCIPAL_LOCAL_TTL_SECONDS,
+    local_max_entries=settings.PRINCIPAL_LOCAL_MAX_ENTRIES,
+    local_max_bytes=settings.PRINCIPAL_LOCAL_MAX_BYTES,
+)
+
+
+async def invalidate_principal(username: str):
+    """Call after changing or deleting a user, or reusing a freed username"""
+    await principal_cache.invalidate(username)
@@ -0,0 +1,266 @@
+"""Retention and downsampling of click data
+
+Raw clicks older than CLICK_RETENTION_DAYS and hourly rollups older than
+HOURLY_ROLLUP_RETENTION_DAYS are removed; daily rollups are kept forever.
+Before raw clicks go, their per-URL daily counts are folded into the daily
+rollups: wherever the raw count is higher, the difference is added to the
+URL's day, its owner's day and the owner's click total alike, so the
+dashboard stays in step with per-URL analytics. That repairs days the
+rollups missed (clicks that predate them, say) without double counting
+what ingestion already added, so re-running after a crash is harmless. Whole expired months are dropped
+as partitions; everything else is deleted in small batches, one
+transaction each with a pause in between, to bound lock time and WAL rate.
+Also runnable by hand:
+
+    python -m app.retention --dry-run
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Optional
+from sqlalchemy import select, func, text
+
+from app.cache import cache
+from app.database import AsyncSessionLocal
+from app.models import URL, Click, ClickRollupDaily, ClickRollupHourly
+from app.partitions import click_partitions, expired_partitions, add_months, month_start
+from app.rollups import apply_daily_rollups
+from app.config import settings
+
+FOLD_SQL = f"""
+SELECT counted.url_id, counted.owner_id, counted.day,
+       counted.clicks - coalesce(daily.clicks, 0) AS missing
+FROM (
+    SELECT c.url_id, u.owner_id, (c.clicked_at AT TIME ZONE 'UTC')::date AS day, count(*) AS clicks
+    FROM {Click.__tablename__} c
+    JOIN {URL.__tablename__} u ON u.id = c.url_id
+    WHERE c.clicked_at >= :lower AND c.clicked_at < :upper
+    GROUP BY 1, 2, 3
+) counted
+LEFT JOIN {ClickRollupDaily.__tablename__} daily
+    ON daily.url_id = counted.url_id AND daily.day = counted.day
+WHERE counted.clicks > coalesce(daily.clicks, 0)
+"""
+
+EXPIRE_CLICKS_SQL = (
+    f"DELETE FROM {Click.__tablename__} WHERE (id, clicked_at) IN ("
+    f"SELECT id, clicked_at FROM {Click.__tablename__} WHERE clicked_at < :cutoff LIMIT :batch)"
+)
+
+EXPIRE_HOURLY_SQL = (
+    f"DELETE FROM {ClickRollupHourly.__tablename__} WHERE (url_id, bucket) IN ("
+    f"SELECT url_id, bucket FROM {ClickRollupHourly.__tablename__} WHERE bucket < :cutoff LIMIT :batch)"
+)
+
+
+def fold_repairs(rows) -> tuple[Counter, Counter]:
+    """Clicks the daily rollups are missing, per (url_id, day) and per
+    (owner_id, day), from (url_id, owner_id, day, missing) rows"""
+    daily, owners = Counter(), Counter()
+    for url_id, owner_id, day, missing in rows:
+        daily[url_id, day] += missing
+        owners[owner_id, day] += missing
+    return daily, owners
+
+
+def fold_ranges(oldest: date, cutoff: date) -> list[tuple[date, date]]:
+    """[lower, upper) day ranges to fold, split on month boundaries so each
+    one reads a single partition"""
+    ranges = []
+    lower = oldest
+    while lower < cutoff:
+        upper = min(add_months(month_start(lower), 1), cutoff)
+        ranges.append((lower, upper))
+        lower = upper
+    return ranges
+
+
+def utc_midnight(day: date) -> str:
+    return f"{day.isoformat()} 00:00:00+00"
+
+
+class RetentionJob:
+    def __init__(
+        self,
+        click_days: int,
+        hourly_days: int,
+        interval: int,
+        batch_size: int,
+        pause: float,
+        dry_run: bool,
+    ):
+        self.click_days = click_days
+        self.hourly_days = hourly_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.dry_run = dry_run
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.folded_rows = 0
+        self.deleted_clicks = 0
+        self.deleted_hourly = 0
+        self.dropped_partitions = 0
+        self.current: Optional[str] = None
+        self.last_run: Optional[float] = None
+        self.last_duration_ms = 0.0
+        self.last_report: dict = {}
+
+    async def run_once(self, dry_run: Optional[bool] = None) -> dict:
+        """One full pass; one worker at a time"""
+        dry_run = self.dry_run if dry_run is None else dry_run
+        token = await cache.try_lock("clicks:retention", 3600000)
+        if token is None:
+            return {}
+
+        started = time.perf_counter()
+        today = datetime.utcnow().date()
+        report = {"dry_run": dry_run}
+        try:
+            if self.click_days > 0:
+                report["clicks"] = await self._expire_clicks(today - timedelta(days=self.click_days), dry_run)
+            if self.hourly_days > 0:
+                report["hourly_rollups"] = await self._expire_hourly(
+                    today - timedelta(days=self.hourly_days), dry_run
+                )
+        finally:
+            self.current = None
+            await cache.release_lock("clicks:retention", token)
+
+        self.runs += 1
+        self.last_run = time.time()
+        self.last_duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        self.last_report = report
+        return report
+
+    async def _expire_clicks(self, cutoff: date, dry_run: bool) -> dict:
+        async with AsyncSessionLocal() as session:
+            oldest = await session.scalar(select(func.min(Click.clicked_at)))
+            partitions = expired_partitions(sorted(await click_partitions.existing(session)), cutoff)
+            report = {"cutoff": cutoff.isoformat(), "partitions": partitions}
+            if oldest is None or oldest.date() >= cutoff:
+                return {**report, "rows": 0}
+
+            if dry_run:
+                rows = await session.scalar(
+                    select(func.count()).select_from(Click).where(Click.clicked_at < utc_midnight(cutoff))
+                )
+                return {**report, "rows": rows, "fold_ranges": len(fold_ranges(oldest.date(), cutoff))}
+
+        # Fold first: a crash after this point loses nothing
+        for lower, upper in fold_ranges(oldest.date(), cutoff):
+            self.current = f"fold {lower.isoformat()}"
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(
+                    text(FOLD_SQL), {"lower": utc_midnight(lower), "upper": utc_midnight(upper)}
+                )
+                daily, owners = fold_repairs(result.all())
+                # Owner rollups and totals move with the URL ones, in one transaction
+                await apply_daily_rollups(session, daily, owners)
+                await session.commit()
+            self.folded_rows += len(daily)
+
+        # Whole months go as partitions, the rest of the range in batches
+        async with AsyncSessionLocal() as session:
+            for name in partitions:
+                self.current = f"drop {name}"
+                await click_partitions.drop(session, name)
+            await session.commit()
+        self.dropped_partitions += len(partitions)
+
+        deleted = await self._delete_batches(EXPIRE_CLICKS_SQL, utc_midnight(cutoff), "deleted_clicks")
+        return {**report, "rows": deleted}
+
+    async def _expire_hourly(self, cutoff: date, dry_run: bool) -> dict:
+        bucket = datetime.combine(cutoff, datetime.min.time())
+        report = {"cutoff": cutoff.isoformat()}
+        if dry_run:
+            async with AsyncSessionLocal() as session:
+                rows = await session.scalar(
+                    select(func.count()).select_from(ClickRollupHourly).where(ClickRollupHourly.bucket < bucket)
+                )
+            return {**report, "rows": rows}
+
+        # Their totals already live on in the daily rollups
+        deleted = await self._delete_batches(EXPIRE_HOURLY_SQL, bucket, "deleted_hourly")
+        return {**report, "rows": deleted}
+
+    async def _delete_batches(self, sql: str, cutoff, counter: str) -> int:
+        deleted = 0
+        while True:
+            self.current = f"{counter} {deleted}"
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(text(sql), {"cutoff": cutoff, "batch": self.batch_size})
+                await session.commit()
+            deleted += result.rowcount
+            setattr(self, counter, getattr(self, counter) + result.rowcount)
+            if result.rowcount < self.batch_size:
+                return deleted
+            await asyncio.sleep(self.pause)
+
+    async def start(self):
+        if self._task is None and (self.click_days > 0 or self.hourly_days > 0):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Retention job error: {e}")
+            await asyncio.sleep(self.interval)
+
+    def get_stats(self) -> dict:
+        return {
+            "dry_run": self.dry_run,
+            "runs": self.runs,
+            "current": self.current,
+            "folded_rows": self.folded_rows,
+            "deleted_clicks": self.deleted_clicks,
+            "deleted_hourly_rollups": self.deleted_hourly,
+            "dropped_partitions": self.dropped_partitions,
+            "last_run": self.last_run,
+            "last_duration_ms": self.last_duration_ms,
+            "last_report": self.last_report,
+        }
+
+
+# Global retention job
+retention_job = RetentionJob(
+    click_days=settings.CLICK_RETENTION_DAYS,
+    hourly_days=settings.HOURLY_ROLLUP_RETENTION_DAYS,
+    interval=settings.RETENTION_INTERVAL_SECONDS,
+    batch_size=settings.RETENTION_BATCH_SIZE,
+    pause=settings.RETENTION_BATCH_PAUSE_SECONDS,
+    dry_run=settings.RETENTION_DRY_RUN,
+)
+
+
+async def main(dry_run: bool):
+    await cache.connect()
+    try:
+        report = await retention_job.run_once(dry_run=dry_run)
+        print(json.dumps(report or {"skipped": "another worker holds the retention lock"}, indent=2))
+    finally:
+        await cache.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fold and delete expired click data")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be removed, change nothing")
+    args = parser.parse_args()
+    asyncio.run(main(args.dry_run or settings.RETENTION_DRY_RUN))
@@ -0,0 +1,211 @@
+"""Hourly and daily click rollups, plus per-owner dashboard totals
+
+Every click batch upserts its per-bucket counts in the same transaction
+that inserts the raw rows, so rollups and clicks can never disagree and
+no separate aggregator or watermark is needed. Analytics then read a
+handful of buckets instead of scanning clicks. URL writes adjust the
+owner's URL totals in their own transaction the same way.
+"""
+from collections import Counter
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, func, update, bindparam
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.models import URL, ClickRollupHourly, ClickRollupDaily, OwnerClickRollupDaily, OwnerStats
+from app.config import settings
+
+
+def bucket_counts(records: list[dict]) -> tuple[Counter, Counter]:
+    """Count clicks per (url_id, hour) and per (url_id, day)"""
+    hourly, daily = Counter(), Counter()
+    for record in records:
+        clicked_at = record["clicked_at"]
+        hourly[record["url_id"], clicked_at.replace(minute=0, second=0, microsecond=0)] += 1
+        daily[record["url_id"], clicked_at.date()] += 1
+    return hourly, daily
+
+
+def owner_counts(records: list[dict]) -> Counter:
+    """Count clicks per (owner_id, day)"""
+    return Counter((record["owner_id"], record["clicked_at"].date()) for record in records)
+
+
+async def _upsert(session, model, keys: tuple[str, str], counts: Counter):
+    if not counts:
+        return
+
+    # Sorted so concurrent flushes lock rows in the same order and can't deadlock
+    stmt = pg_insert(model).values([
+        {keys[0]: key, keys[1]: bucket, "clicks": clicks}
+        for (key, bucket), clicks in sorted(counts.items())
+    ])
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={"clicks": model.clicks + stmt.excluded.clicks}
+        )
+    )
+
+
+async def _adjust_owner_stats(session, rows: list[dict]):
+    if not rows:
+        return
+
+    stmt = pg_insert(OwnerStats).values(sorted(rows, key=lambda row: row["owner_id"]))
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["owner_id"],
+            set_={
+                column: getattr(OwnerStats, column) + getattr(stmt.excluded, column)
+                for column in ("total_urls", "active_urls", "total_clicks")
+            }
+        )
+    )
+
+
+def owner_totals(owners: Counter) -> Counter:
+    """Sum per (owner_id, day) counts into per-owner totals"""
+    totals = Counter()
+    for (owner_id, _), clicks in owners.items():
+        totals[owner_id] += clicks
+    return totals
+
+
+async def apply_rollups(session, records: list[dict]):
+    """Fold a batch of click records into the rollup tables; caller commits"""
+    hourly, daily = bucket_counts(records)
+    await _upsert(session, ClickRollupHourly, ("url_id", "bucket"), hourly)
+    await apply_daily_rollups(session, daily, owner_counts(records))
+
+
+async def apply_daily_rollups(session, daily: Counter, owners: Counter):
+    """Add per (url_id, day) and (owner_id, day) counts to the daily rollups
+    and the owners' click totals; caller commits"""
+    await _upsert(session, ClickRollupDaily, ("url_id", "day"), daily)
+    await _upsert(session, OwnerClickRollupDaily, ("owner_id", "day"), owners)
+    await _adjust_owner_stats(session, [
+        {"owner_id": owner_id, "total_urls": 0, "active_urls": 0, "total_clicks": clicks}
+        for owner_id, clicks in owner_totals(owners).items()
+    ])
+
+
+async def adjust_owner_urls(session, owner_id: int, total: int = 0, active: int = 0):
+    """Apply a change in an owner's URL counts; caller commits with the URL write"""
+    if total or active:
+        await _adjust_owner_stats(session, [
+            {"owner_id": owner_id, "total_urls": total, "active_urls": active, "total_clicks": 0}
+        ])
+
+
+def daily_clicks_query(url_id: int, since: date):
+    return (
+        select(ClickRollupDaily.day, ClickRollupDaily.clicks)
+        .where(ClickRollupDaily.url_id == url_id, ClickRollupDaily.day >= since)
+    )
+
+
+async def daily_clicks(db, url_id: int, since: date) -> dict[date, int]:
+    """Clicks per day for one URL from `since` (inclusive) onwards"""
+    result = await db.execute(daily_clicks_query(url_id, since))
+    return dict(result.all())
+
+
+async def remove_url_clicks(session, owner_id: int, url_id: int):
+    """Take a URL's clicks out of its owner's rollups; call before deleting it"""
+    daily = await daily_clicks(session, url_id, date.min)
+    if not daily:
+        return
+
+    owner_daily = OwnerClickRollupDaily.__table__
+    connection = await session.connection()
+    await connection.execute(
+        update(owner_daily)
+        .where(owner_daily.c.owner_id == owner_id, owner_daily.c.day == bindparam("rollup_day"))
+        .values(clicks=owner_daily.c.clicks - bindparam("removed")),
+        [{"rollup_day": day, "removed": clicks} for day, clicks in sorted(daily.items())]
+    )
+    await _adjust_owner_stats(session, [
+        {"owner_id": owner_id, "total_urls": 0, "active_urls": 0, "total_clicks": -sum(daily.values())}
+    ])
+
+
+def owner_daily_clicks_query(owner_id: int, since: date):
+    return (
+        select(OwnerClickRollupDaily.day, OwnerClickRollupDaily.clicks)
+        .where(OwnerClickRollupDaily.owner_id == owner_id, OwnerClickRollupDaily.day >= since)
+    )
+
+
+async def owner_daily_clicks(db, owner_id: int, since: date) -> dict[date, int]:
+    """Clicks per day across all of an owner's URLs from `since` (inclusive) onwards"""
+    result = await db.execute(owner_daily_clicks_query(owner_id, since))
+    return dict(result.all())
+
+
+def owner_top_urls_query(owner_id: int, since: datetime, limit: int):
+    """Hourly buckets when `since` is not midnight, daily ones otherwise"""
+    if since.time() == datetime.min.time():
+        model, bucket, start = ClickRollupDaily, ClickRollupDaily.day, since.date()
+    else:
+        model, bucket, start = ClickRollupHourly, ClickRollupHourly.bucket, since
+    return (
+        select(model.url_id, func.sum(model.clicks).label("clicks"))
+        .join(URL, URL.id == model.url_id)
+        .where(URL.owner_id == owner_id, bucket >= start)
+        .group_by(model.url_id)
+        .order_by(func.sum(model.clicks).desc())
+        .limit(limit)
+    )
+
+
+async def owner_top_urls(db, owner_id: int, since: datetime, limit: int) -> list[tuple[int, int]]:
+    """(url_id, clicks) for an owner's most clicked URLs from `since` onwards"""
+    result = await db.execute(owner_top_urls_query(owner_id, since, limit))
+    return [(url_id, int(clicks)) for url_id, clicks in result]
+
+
+def first_whole_day(since: datetime, today: date) -> date:
+    """First day clicks_by_day_since reads from the daily table: the day after
+    `since`, or that day itself once retention may have removed its hours"""
+    kept_days = settings.HOURLY_ROLLUP_RETENTION_DAYS
+    if kept_days and since.date() < today - timedelta(days=kept_days):
+        return since.date()
+    return since.date() + timedelta(days=1)
+
+
+def hourly_clicks_query(url_id: int, start: datetime, end: datetime):
+    """Total clicks for one URL in the hourly buckets from start to before end"""
+    return (
+        select(func.coalesce(func.sum(ClickRollupHourly.clicks), 0))
+        .where(
+            ClickRollupHourly.url_id == url_id,
+            ClickRollupHourly.bucket >= start,
+            ClickRollupHourly.bucket < end,
+        )
+    )
+
+
+async def clicks_by_day_since(db, url_id: int, since: datetime) -> dict[date, int]:
+    """Clicks per day from the hour of `since` onwards: whole days from the
+    daily table, the partial first day from the hourly one while it is kept"""
+    first_day = first_whole_day(since, datetime.utcnow().date())
+    counts = await daily_clicks(db, url_id, first_day)
+    if first_day <= since.date():
+        return counts
+
+    hours = await db.scalar(hourly_clicks_query(
+        url_id, since.replace(minute=0, second=0, microsecond=0), datetime.combine(first_day, datetime.min.time())
+    ))
+    if hours:
+        counts[since.date()] = int(hours)
+    return counts
+
+
+def daily_series(counts: dict[date, int], start: date, end: date) -> list[dict]:
+    """Zero-filled [{"date", "count"}] from start to end inclusive"""
+    series = []
+    day = start
+    while day <= end:
+        series.append({"date": day.isoformat(), "count": counts.get(day, 0)})
+        day += timedelta(days=1)
+    return series
@@ -1,22 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, distinct, cast, Date, desc
+from sqlalchemy import select, func, and_, desc
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional
 
 from app.database import get_async_db
-from app.models import User, URL, Click
+from app.models import URL, Click
 from app.schemas import (
     ClickResponse,
     AnalyticsSummary,
     EnhancedAnalytics,
     TopURLResponse,
-    DailyClickStats
+    DailyClickStats,
+    DashboardStats
 )
-from app.dependencies import get_current_active_user
-from app.cache import cache
+from app.dependencies import get_current_active_client
+from app.principals import Principal
+from app.counters import click_counters
+from app.rollups import clicks_by_day_since, daily_clicks, daily_series, owner_top_urls
+from app.uniques import unique_visitors
+from app.topk import top_urls, window_start, MAX_WINDOW_DAYS
+from app.dashboard import get_dashboard
+from app.pagination import paginate, next_cursor, NEXT_CURSOR_HEADER
 from app.config import settings
 
+def url_clicks_query(url_id: int):
+    # The upper bound lets the first page skip future partitions too
+    return select(Click).where(Click.url_id == url_id, Click.clicked_at <= func.now())
+
+
+def top_urls_all_time_query(owner_id: int, limit: int):
+    return select(URL).where(URL.owner_id == owner_id).order_by(desc(URL.click_count)).limit(limit)
+
+
 # ✅ FIXED PREFIX
 router = APIRouter(
     prefix="/api/v1/analytics",
@@ -27,11 +43,14 @@ router = APIRouter(
 @router.get("/{short_code}/clicks", response_model=list[ClickResponse])
 async def get_url_clicks(
     short_code: str,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_async_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_client)
 ):
+    """Newest clicks first; follow X-Next-Cursor with `cursor` for deep pages"""
     url = await db.scalar(
         select(URL).where(and_(
             URL.short_code == short_code,
@@ -42,15 +61,22 @@ async def get_url_clicks(
     if not url:
         raise HTTPException(status_code=404, detail="URL not found")
 
-    result = await db.execute(
-        select(Click)
-        .where(Click.url_id == url.id)
-        .order_by(Click.clicked_at.desc())
-        .offset(skip)
-        .limit(limit)
-    )
+    try:
+        query = paginate(
+            url_clicks_query(url.id),
+            Click.clicked_at, Click.id, cursor, skip, limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    result = await db.execute(query)
+    clicks = result.scalars().all()
 
-    return result.scalars().all()
+    cursor = next_cursor(clicks, limit, "clicked_at")
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+
+    return clicks
 
 
 @router.get("/{short_code}/summary", response_model=AnalyticsSummary)
@@ -58,7 +84,7 @@ async def get_url_analytics_summary(
     short_code: str,
     days: int = Query(default=30, ge=1, le=365),
     db: AsyncSession = Depends(get_async_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_client)
 ):
     url = await db.scalar(
         select(URL).where(and_(
@@ -72,25 +98,18 @@ async def get_url_analytics_summary(
 
     start_date = datetime.utcnow() - timedelta(days=days)
 
-    total_clicks = await db.scalar(
-        select(func.count(Click.id)).where(
-            and_(Click.url_id == url.id, Click.clicked_at >= start_date)
-        )
-    ) or 0
+    # Rollups: O(days) rows however many clicks the link has. The total is
+    # the sum of the series, so both cover exactly the same window
+    daily = await clicks_by_day_since(db, url.id, start_date)
+    total_clicks = sum(daily.values())
 
-    total_clicks += await cache.get_click_count(short_code)
-
-    unique_ips = await db.scalar(
-        select(func.count(distinct(Click.ip_address))).where(
-            and_(Click.url_id == url.id, Click.clicked_at >= start_date)
-        )
-    ) or 0
+    unique_ips = await unique_visitors.count_days(url.id, start_date.date(), datetime.utcnow().date())
 
     return AnalyticsSummary(
         total_clicks=total_clicks,
         unique_ips=unique_ips,
         top_referrers=[],
-        clicks_by_date=[],
+        clicks_by_date=daily_series(daily, start_date.date(), datetime.utcnow().date()),
         clicks_by_country=[]
     )
 
@@ -99,7 +118,7 @@ async def get_url_analytics_summary(
 async def get_enhanced_analytics(
     short_code: str,
     db: AsyncSession = Depends(get_async_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_client)
 ):
     url = await db.scalar(
         select(URL).where(and_(
@@ -111,25 +130,25 @@ async def get_enhanced_analytics(
     if not url:
         raise HTTPException(status_code=404, detail="URL not found")
 
-    total_clicks = await db.scalar(
-        select(func.count(Click.id)).where(Click.url_id == url.id)
-    ) or 0
+    pending = await click_counters.pending([url.id])
+    total_clicks = url.click_count + pending.get(url.id, 0)
 
-    cached = await cache.get_click_count(short_code)
-    total_clicks += cached
+    # Calendar days in UTC, today included
+    today = datetime.utcnow().date()
+    month_start = today - timedelta(days=29)
+    daily = await daily_clicks(db, url.id, month_start)
+    clicks_this_week = sum(c for day, c in daily.items() if day > today - timedelta(days=7))
 
-    unique_visitors = await db.scalar(
-        select(func.count(distinct(Click.ip_address))).where(Click.url_id == url.id)
-    ) or 0
+    visitors = await unique_visitors.count(url.id)
 
     return EnhancedAnalytics(
         short_code=short_code,
         total_clicks=total_clicks,
-        unique_visitors=unique_visitors,
-        clicks_today=cached,
-        clicks_this_week=total_clicks,
-        clicks_this_month=total_clicks,
-        clicks_daily=[],
+        unique_visitors=visitors,
+        clicks_today=daily.get(today, 0),
+        clicks_this_week=clicks_this_week,
+        clicks_this_month=sum(daily.values()),
+        clicks_daily=[DailyClickStats(**d) for d in daily_series(daily, month_start, today)],
         top_referrers=[],
         avg_clicks_per_day=round(
             total_clicks / max((datetime.now(url.created_at.tzinfo) - url.created_at).days, 1), 2
@@ -138,20 +157,40 @@ async def get_enhanced_analytics(
     )
 
 
+@router.get("/dashboard", response_model=DashboardStats)
+async def get_dashboard_stats(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_client)
+):
+    """Totals and a 30 day click series across all of the user's URLs"""
+    return await get_dashboard(db, current_user.id)
+
+
 @router.get("/top", response_model=List[TopURLResponse])
 async def get_top_urls(
     limit: int = Query(default=10, ge=1, le=50),
+    days: Optional[int] = Query(default=None, ge=1, le=365),
     db: AsyncSession = Depends(get_async_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_client)
 ):
-    result = await db.execute(
-        select(URL, func.count(Click.id))
-        .outerjoin(Click, Click.url_id == URL.id)
-        .where(URL.owner_id == current_user.id)
-        .group_by(URL.id)
-        .order_by(desc(func.count(Click.id)))
-        .limit(limit)
-    )
+    """Most clicked URLs, all time or over the last `days` days (days=1 is the last 24h)"""
+    if days is None:
+        result = await db.execute(top_urls_all_time_query(current_user.id, limit))
+        urls = result.scalars().all()
+        pending = await click_counters.pending(url.id for url in urls)
+        ranked = [(url, url.click_count + pending.get(url.id, 0)) for url in urls]
+    else:
+        if days <= MAX_WINDOW_DAYS and await top_urls.covers(days):
+            scores = await top_urls.top(current_user.id, days, limit)
+        else:
+            # Beyond the sorted set windows, or before they fill, rank from the rollups
+            scores = await owner_top_urls(db, current_user.id, window_start(days, datetime.utcnow()), limit)
+
+        result = await db.execute(
+            select(URL).where(URL.id.in_([url_id for url_id, _ in scores]), URL.owner_id == current_user.id)
+        )
+        urls = {url.id: url for url in result.scalars()}
+        ranked = [(urls[url_id], clicks) for url_id, clicks in scores if url_id in urls]
 
     return [
         TopURLResponse(
@@ -160,8 +199,8 @@ async def get_top_urls(
             short_url=f"{settings.BASE_URL}/{url.short_code}",
             title=url.title,
             original_url=url.original_url,
-            total_clicks=(count or 0) + await cache.get_click_count(url.short_code),
+            total_clicks=clicks,
             created_at=url.created_at
         )
-        for url, count in result
+        for url, clicks in ranked
     ]
@@ -1,19 +1,31 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, func
 from datetime import timedelta
+from typing import List
 
 from app.database import get_async_db
-from app.models import User
-from app.schemas import UserCreate, UserResponse, Token
-from app.dependencies import get_current_active_user
-from app.utils import verify_password, get_password_hash, create_access_token
+from app.models import User, ApiKey
+from app.schemas import UserCreate, UserResponse, PasswordChange, Token, ApiKeyCreate, ApiKeyResponse, ApiKeyCreated
+from app.dependencies import get_current_active_user, get_current_active_client
+from app.principals import Principal, invalidate_principal
+from app.utils import create_access_token
+from app.hashing import password_hasher, HashingBusy
+from app.api_keys import generate_key, api_key_verifier
 from app.config import settings
 
 router = APIRouter(prefix="/api/v1/auth", tags=["Authentication"])
 
 
+def hashing_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-in requests, try again shortly",
+        headers={"Retry-After": "1"},
+    )
+
+
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new user"""
@@ -33,16 +45,23 @@ async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_d
             detail="Email already registered"
         )
     
+    try:
+        hashed_password = await password_hasher.hash(user_data.password)
+    except HashingBusy:
+        raise hashing_busy()
+
     # Create user
     db_user = User(
         username=user_data.username,
         email=user_data.email,
-        hashed_password=get_password_hash(user_data.password)
+        hashed_password=hashed_password
     )
     
     db.add(db_user)
     await db.commit()
     await db.refresh(db_user)
+    # The username may have belonged to a deleted user still cached somewhere
+    await invalidate_principal(db_user.username)
     
     return UserResponse(
         id=db_user.id,
@@ -62,7 +81,18 @@ async def login(
     result = await db.execute(select(User).where(User.username == form_data.username))
     user = result.scalar_one_or_none()
     
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    valid = False
+    if user:
+        try:
+            valid, new_hash = await password_hasher.verify_and_update(form_data.password, user.hashed_password)
+        except HashingBusy:
+            raise hashing_busy()
+        if valid and new_hash:
+            # BCRYPT_ROUNDS changed since this hash was made
+            user.hashed_password = new_hash
+            await db.commit()
+
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -79,7 +109,7 @@ async def login(
 
 @router.get("/me", response_model=UserResponse)
 async def get_current_user(
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_client)
 ):
     """Get current user info"""
     return UserResponse(
@@ -88,4 +118,105 @@ async def get_current_user(
         email=current_user.email,
         is_active=current_user.is_active,
         created_at=current_user.created_at
-    )
\ No newline at end of file
+    )
+
+
+@router.put("/me/password", status_code=status.HTTP_204_NO_CONTENT)
+async def change_password(
+    password_data: PasswordChange,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
+):
+    """Change the current user's password"""
+    user = await db.get(User, current_user.id)
+    try:
+        valid, _ = await password_hasher.verify_and_update(password_data.current_password, user.hashed_password)
+        if valid:
+            user.hashed_password = await password_hasher.hash(password_data.new_password)
+    except HashingBusy:
+        raise hashing_busy()
+    if not valid:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Incorrect password")
+
+    await db.commit()
+    await invalidate_principal(user.username)
+
+
+@router.post("/me/deactivate", status_code=status.HTTP_204_NO_CONTENT)
+async def deactivate_account(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
+):
+    """Deactivate the current user; takes effect on every worker immediately"""
+    user = await db.get(User, current_user.id)
+    user.is_active = False
+    await db.commit()
+    await invalidate_principal(user.username)
+
+
+# API keys are managed with a login token, so a leaked key can't mint more
+@router.post("/api-keys", response_model=ApiKeyCreated, status_code=status.HTTP_201_CREATED)
+async def create_api_key(
+    key_data: ApiKeyCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
+):
+    """Create an API key; the key itself is only returned here"""
+    active_keys = await db.scalar(
+        select(func.count()).select_from(ApiKey)
+        .where(ApiKey.user_id == current_user.id, ApiKey.is_active.is_(True))
+    )
+    if active_keys >= settings.API_KEY_MAX_PER_USER:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.API_KEY_MAX_PER_USER} active API keys per user"
+        )
+
+    new_key = generate_key()
+    api_key = ApiKey(
+        user_id=current_user.id,
+        name=key_data.name,
+        prefix=new_key.prefix,
+        key_hash=new_key.key_hash
+    )
+    db.add(api_key)
+    await db.commit()
+    await db.refresh(api_key)
+
+    return ApiKeyCreated(
+        id=api_key.id,
+        name=api_key.name,
+        prefix=api_key.prefix,
+        is_active=api_key.is_active,
+        created_at=api_key.created_at,
+        key=new_key.key
+    )
+
+
+@router.get("/api-keys", response_model=List[ApiKeyResponse])
+async def list_api_keys(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
+):
+    result = await db.execute(
+        select(ApiKey).where(ApiKey.user_id == current_user.id).order_by(ApiKey.id)
+    )
+    return result.scalars().all()
+
+
+@router.delete("/api-keys/{key_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_api_key(
+    key_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
+):
+    """Revoke an API key; takes effect on every worker immediately"""
+    api_key = await db.scalar(
+        select(ApiKey).where(ApiKey.id == key_id, ApiKey.user_id == current_user.id)
+    )
+    if not api_key:
+        raise HTTPException(status_code=404, detail="API key not found")
+
+    api_key.is_active = False
+    await db.commit()
+    await api_key_verifier.revoke(api_key.key_hash)
@@ -1,21 +1,65 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, UploadFile, File, Query
 from fastapi.responses import RedirectResponse
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_
-from datetime import datetime, timezone
-
-from app.database import get_async_db
-from app.models import User, URL, Click
-from app.schemas import URLCreate, URLResponse, URLUpdate
-from app.dependencies import get_current_active_user
-from app.utils import generate_short_code, is_valid_short_code
+from sqlalchemy import select, and_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from datetime import datetime
+from typing import Optional
+
+from app.database import get_async_db, AsyncSessionLocal
+from app.models import URL
+from app.schemas import (
+    URLCreate,
+    URLResponse,
+    URLUpdate,
+    URLBatchCreate,
+    URLBatchItemResult,
+    URLBatchResponse,
+    ImportReport
+)
+from app.dependencies import get_current_active_client
+from app.principals import Principal
+from app.utils import is_valid_short_code
 from app.config import settings
-from app.cache import cache
+from app.cache import cache, CachedURL, Tombstone
+from app.clicks import click_pipeline, build_click_record, encode_stream_fields
+from app.bloom import short_code_bloom
+from app.allocator import allocate_short_code
+from app.importer import URLImporter, read_rows
+from app.singleflight import SingleFlight
+from app.counters import click_counters
+from app.uniques import unique_visitors
+from app.topk import top_urls
+from app.rollups import adjust_owner_urls, remove_url_clicks
+from app.dashboard import invalidate_dashboard
+from app.pagination import paginate, next_cursor, NEXT_CURSOR_HEADER
 
 # ✅ Two separate routers
 api_router = APIRouter(prefix="/api/v1", tags=["URLs"])
 redirect_router = APIRouter(tags=["Redirect"])
 
+MAX_CREATE_ATTEMPTS = 10
+
+# Coalesces concurrent redirect cache misses per short code
+url_lookups = SingleFlight()
+
+# Everything CachedURL needs, and exactly what ix_urls_active_short_code covers
+REDIRECT_COLUMNS = (URL.id, URL.original_url, URL.expires_at, URL.is_active, URL.owner_id)
+
+
+def owner_urls_query(owner_id: int):
+    return select(URL).where(URL.owner_id == owner_id)
+
+
+def owner_url_query(owner_id: int, short_code: str):
+    return select(URL).where(and_(URL.short_code == short_code, URL.owner_id == owner_id))
+
+
+def redirect_query(short_code: str, active_only: bool = True):
+    query = select(*REDIRECT_COLUMNS).where(URL.short_code == short_code)
+    return query.where(URL.is_active.is_(True)) if active_only else query
+
 
 # -------------------------
 # CREATE SHORT URL
@@ -24,109 +68,224 @@ redirect_router = APIRouter(tags=["Redirect"])
 async def create_short_url(
     url_data: URLCreate,
     db: AsyncSession = Depends(get_async_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_client)
 ):
     """Create a new short URL"""
-    # Validate or generate short code
-    if url_data.custom_short_code:
-        if not is_valid_short_code(url_data.custom_short_code):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid custom short code format"
-            )
-        short_code = url_data.custom_short_code
-        
-        # Check if exists
-        result = await db.execute(
-            select(URL).where(URL.short_code == short_code)
+    if url_data.custom_short_code and not is_valid_short_code(url_data.custom_short_code):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid custom short code format"
         )
-        if result.scalar_one_or_none():
+
+    # Insert once and let the unique index arbitrate; only a real conflict
+    # costs another attempt, and a custom code gets exactly one
+    row = None
+    for _ in range(1 if url_data.custom_short_code else MAX_CREATE_ATTEMPTS):
+        if url_data.custom_short_code:
+            short_code = url_data.custom_short_code
+        else:
+            short_code = await allocate_short_code()
+
+        row = (await insert_urls(db, [url_row(short_code, url_data, current_user.id)])).get(short_code)
+        if row is not None:
+            break
+
+    if row is None:
+        if url_data.custom_short_code:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Custom short code already exists"
             )
-    else:
-        # Generate unique code
-        while True:
-            short_code = generate_short_code()
-            result = await db.execute(
-                select(URL).where(URL.short_code == short_code)
-            )
-            if not result.scalar_one_or_none():
-                break
-
-    # Create URL record
-    db_url = URL(
-        original_url=str(url_data.original_url),
-        short_code=short_code,
-        title=url_data.title,
-        owner_id=current_user.id,
-        expires_at=url_data.expires_at
-    )
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Could not allocate a short code, please retry"
+        )
 
-    db.add(db_url)
+    await adjust_owner_urls(db, current_user.id, total=1, active=1)
     await db.commit()
-    await db.refresh(db_url)
+    await invalidate_dashboard(current_user.id)
 
-    # Cache it
-    await cache.set_url(short_code, db_url.original_url, expire=86400)
+    # Cache it, set its filter bits and evict stale tombstones on every worker
+    await cache.store_new_urls([(short_code, CachedURL.from_model(row))], bloom=short_code_bloom)
 
     # ✅ Return with BASE_URL from settings
+    return url_response(row)
+
+
+async def insert_urls(db: AsyncSession, rows: list[dict]) -> dict:
+    """Multi-row INSERT ... ON CONFLICT DO NOTHING RETURNING, keyed by short code
+
+    Codes that were already taken are simply missing from the result.
+    """
+    if not rows:
+        return {}
+
+    result = await db.execute(
+        pg_insert(URL)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=[URL.short_code])
+        .returning(*URL.__table__.columns)
+    )
+    return {row.short_code: row for row in result}
+
+
+def url_row(short_code: str, url_data: URLCreate, owner_id: int) -> dict:
+    return {
+        "original_url": str(url_data.original_url),
+        "short_code": short_code,
+        "title": url_data.title,
+        "owner_id": owner_id,
+        "expires_at": url_data.expires_at,
+        "is_active": True,
+        "created_at": datetime.utcnow(),
+    }
+
+
+def url_response(row, click_count: int = 0) -> URLResponse:
     return URLResponse(
-        id=db_url.id,
-        original_url=db_url.original_url,
-        short_code=db_url.short_code,
-        short_url=f"{settings.BASE_URL}/{short_code}",  # ✅ Uses .env BASE_URL
-        title=db_url.title,
-        is_active=db_url.is_active,
-        owner_id=db_url.owner_id,
-        created_at=db_url.created_at,
-        expires_at=db_url.expires_at,
-        click_count=0
+        id=row.id,
+        original_url=row.original_url,
+        short_code=row.short_code,
+        short_url=f"{settings.BASE_URL}/{row.short_code}",
+        title=row.title,
+        is_active=row.is_active,
+        owner_id=row.owner_id,
+        created_at=row.created_at,
+        expires_at=row.expires_at,
+        click_count=click_count
     )
 
 
+# -------------------------
+# BULK CREATE SHORT URLS
+# -------------------------
+@api_router.post("/urls/batch", response_model=URLBatchResponse)
+async def create_short_urls_batch(
+    batch: URLBatchCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_client)
+):
+    """Create many short URLs with one multi-row insert and one cache pipeline"""
+    results = [URLBatchItemResult(index=i) for i in range(len(batch.items))]
+    custom: dict[str, tuple[int, URLCreate]] = {}
+    generated: list[tuple[int, URLCreate]] = []
+
+    for i, item in enumerate(batch.items):
+        try:
+            url_data = URLCreate.model_validate(item)
+        except ValidationError as e:
+            results[i].error = "; ".join(err["msg"] for err in e.errors())
+            continue
+
+        code = url_data.custom_short_code
+        if code is None:
+            generated.append((i, url_data))
+        elif not is_valid_short_code(code):
+            results[i].error = "Invalid custom short code format"
+        elif code in custom:
+            results[i].error = "Duplicate custom short code in batch"
+        else:
+            custom[code] = (i, url_data)
+
+    # Custom codes get one attempt; generated ones are re-drawn only on conflict
+    pending = dict(custom)
+    created = {}
+    for _ in range(MAX_CREATE_ATTEMPTS):
+        for i, url_data in generated:
+            code = await allocate_short_code()
+            while code in pending:
+                code = await allocate_short_code()
+            pending[code] = (i, url_data)
+        if not pending:
+            break
+
+        inserted = await insert_urls(
+            db, [url_row(code, url_data, current_user.id) for code, (_, url_data) in pending.items()]
+        )
+        created.update({code: (pending[code][0], row) for code, row in inserted.items()})
+
+        generated = [item for code, item in pending.items() if code not in inserted and code not in custom]
+        for code in custom:
+            if code in pending and code not in inserted:
+                results[custom[code][0]].error = "Custom short code already exists"
+        pending = {}
+        if not generated:
+            break
+
+    for i, _ in generated:
+        results[i].error = "Could not allocate a short code, please retry"
+
+    await adjust_owner_urls(db, current_user.id, total=len(created), active=len(created))
+    await db.commit()
+    await invalidate_dashboard(current_user.id)
+
+    await cache.store_new_urls(
+        [(code, CachedURL.from_model(row)) for code, (_, row) in created.items()],
+        bloom=short_code_bloom
+    )
+
+    for i, row in created.values():
+        results[i].url = url_response(row)
+
+    return URLBatchResponse(
+        created=len(created),
+        failed=len(results) - len(created),
+        results=results
+    )
+
+
+# -------------------------
+# STREAMING IMPORT
+# -------------------------
+@api_router.post("/urls/import", response_model=ImportReport)
+async def import_urls(
+    file: UploadFile = File(...),
+    format: str = Query(default="csv", pattern="^(csv|ndjson)$"),
+    job_id: Optional[str] = Query(default=None, max_length=64),
+    warm_cache: bool = False,
+    current_user: Principal = Depends(get_current_active_client)
+):
+    """Import URLs from a CSV/NDJSON upload; resend with the same job_id to resume"""
+    importer = URLImporter(current_user.id, job_id=job_id, warm_cache=warm_cache)
+    return await importer.run(read_rows(file.file, format))
+
+
 # -------------------------
 # LIST USER URLS
 # -------------------------
 @api_router.get("/urls/", response_model=list[URLResponse])
 async def get_user_urls(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_async_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_client)
 ):
-    """Get all URLs for current user"""
-    result = await db.execute(
-        select(URL, func.count(Click.id).label("click_count"))
-        .outerjoin(Click, Click.url_id == URL.id)
-        .where(URL.owner_id == current_user.id)
-        .group_by(URL.id)
-        .order_by(URL.created_at.desc())
-        .offset(skip)
-        .limit(limit)
-    )
+    """Get all URLs for current user, newest first
 
-    urls = []
-    for url, db_clicks in result:
-        cache_clicks = await cache.get_click_count(url.short_code)
-
-        urls.append(
-            URLResponse(
-                id=url.id,
-                original_url=url.original_url,
-                short_code=url.short_code,
-                short_url=f"{settings.BASE_URL}/{url.short_code}",  # ✅ Uses .env BASE_URL
-                title=url.title,
-                is_active=url.is_active,
-                owner_id=url.owner_id,
-                created_at=url.created_at,
-                expires_at=url.expires_at,
-                click_count=(db_clicks or 0) + cache_clicks
-            )
+    Pass the X-Next-Cursor header of one page as `cursor` to get the next;
+    `skip` still works but gets slower the deeper it goes.
+    """
+    try:
+        query = paginate(
+            owner_urls_query(current_user.id),
+            URL.created_at, URL.id, cursor, skip, limit
         )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    result = await db.execute(query)
+    urls = result.scalars().all()
 
-    return urls
+    cursor = next_cursor(urls, limit, "created_at")
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+
+    # Undrained clicks for the whole page in one Redis round trip
+    pending = await click_counters.pending(url.id for url in urls)
+
+    return [url_response(url, url.click_count + pending.get(url.id, 0)) for url in urls]
 
 
 # -------------------------
@@ -136,38 +295,22 @@ async def get_user_urls(
 async def get_url_details(
     short_code: str,
     db: AsyncSession = Depends(get_async_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_client)
 ):
     """Get details for a specific URL"""
     result = await db.execute(
-        select(URL, func.count(Click.id).label("click_count"))
-        .outerjoin(Click, Click.url_id == URL.id)
-        .where(and_(URL.short_code == short_code, URL.owner_id == current_user.id))
-        .group_by(URL.id)
+        owner_url_query(current_user.id, short_code)
     )
     
-    row = result.first()
-    if not row:
+    url = result.scalar_one_or_none()
+    if not url:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="URL not found"
         )
     
-    url, click_count = row
-    cached_clicks = await cache.get_click_count(url.short_code)
-    
-    return URLResponse(
-        id=url.id,
-        original_url=url.original_url,
-        short_code=url.short_code,
-        short_url=f"{settings.BASE_URL}/{url.short_code}",
-        title=url.title,
-        is_active=url.is_active,
-        owner_id=url.owner_id,
-        created_at=url.created_at,
-        expires_at=url.expires_at,
-        click_count=(click_count or 0) + cached_clicks
-    )
+    pending = await click_counters.pending([url.id])
+    return url_response(url, url.click_count + pending.get(url.id, 0))
 
 
 # -------------------------
@@ -178,11 +321,11 @@ async def update_url(
     short_code: str,
     url_update: URLUpdate,
     db: AsyncSession = Depends(get_async_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_client)
 ):
     """Update a URL"""
     result = await db.execute(
-        select(URL).where(and_(URL.short_code == short_code, URL.owner_id == current_user.id))
+        owner_url_query(current_user.id, short_code)
     )
     url = result.scalar_one_or_none()
     
@@ -194,32 +337,19 @@ async def update_url(
     
     if url_update.title is not None:
         url.title = url_update.title
-    if url_update.is_active is not None:
+    if url_update.is_active is not None and url_update.is_active != url.is_active:
         url.is_active = url_update.is_active
-        if not url_update.is_active:
-            await cache.delete_url(short_code)
+        await adjust_owner_urls(db, current_user.id, active=1 if url.is_active else -1)
     
     await db.commit()
     await db.refresh(url)
+    await invalidate_dashboard(current_user.id)
+
+    # Evict from Redis and every worker's local cache
+    await cache.delete_url(short_code)
     
-    click_result = await db.execute(
-        select(func.count(Click.id)).where(Click.url_id == url.id)
-    )
-    click_count = click_result.scalar() or 0
-    cached_clicks = await cache.get_click_count(url.short_code)
-    
-    return URLResponse(
-        id=url.id,
-        original_url=url.original_url,
-        short_code=url.short_code,
-        short_url=f"{settings.BASE_URL}/{url.short_code}",
-        title=url.title,
-        is_active=url.is_active,
-        owner_id=url.owner_id,
-        created_at=url.created_at,
-        expires_at=url.expires_at,
-        click_count=click_count + cached_clicks
-    )
+    pending = await click_counters.pending([url.id])
+    return url_response(url, url.click_count + pending.get(url.id, 0))
 
 
 # -------------------------
@@ -229,11 +359,11 @@ async def update_url(
 async def delete_url(
     short_code: str,
     db: AsyncSession = Depends(get_async_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_client)
 ):
     """Delete a URL"""
     result = await db.execute(
-        select(URL).where(and_(URL.short_code == short_code, URL.owner_id == current_user.id))
+        owner_url_query(current_user.id, short_code)
     )
     url = result.scalar_one_or_none()
     
@@ -243,12 +373,58 @@ async def delete_url(
             detail="URL not found"
         )
     
-    await cache.delete_url(short_code)
-    await cache.reset_click_count(short_code)
-    
+    url_id = url.id
+    await adjust_owner_urls(db, current_user.id, total=-1, active=-1 if url.is_active else 0)
+    await remove_url_clicks(db, current_user.id, url_id)
     await db.delete(url)
     await db.commit()
 
+    # Only after the commit, or a concurrent redirect could re-cache the link
+    await cache.delete_url(short_code)
+    await click_counters.discard(url_id)
+    await unique_visitors.discard(url_id)
+    await top_urls.discard(current_user.id, url_id)
+    await invalidate_dashboard(current_user.id)
+
+
+async def load_url_entry(short_code: str):
+    """Resolve a code from the DB and cache the answer, misses included
+
+    Runs on its own session because it is shared by every coalesced request.
+    With SINGLE_FLIGHT_REDIS_LOCK, workers that lose the fill lock wait for
+    the winner to populate the cache before falling back to the DB.
+    """
+    token = None
+    if settings.SINGLE_FLIGHT_REDIS_LOCK:
+        token = await cache.try_lock(f"fill:{short_code}", settings.SINGLE_FLIGHT_LOCK_TTL_MS)
+        if token is None:
+            entry = await cache.wait_for_url(
+                short_code, settings.SINGLE_FLIGHT_LOCK_TTL_MS, settings.SINGLE_FLIGHT_POLL_MS
+            )
+            if entry is not None:
+                return entry
+
+    try:
+        async with AsyncSessionLocal() as session:
+            # Live links are answered from the partial covering index alone;
+            # only missing or disabled codes need the second lookup
+            url = (await session.execute(redirect_query(short_code))).one_or_none()
+            if url is None:
+                url = (await session.execute(redirect_query(short_code, active_only=False))).one_or_none()
+
+        # Cache for next time, including codes that must not redirect,
+        # so repeated 404/410s skip the DB
+        if not url:
+            entry = Tombstone("missing")
+            await cache.set_tombstone(short_code, entry.reason)
+        else:
+            entry = CachedURL.from_model(url)
+            await cache.set_url(short_code, entry)
+        return entry
+    finally:
+        if token is not None:
+            await cache.release_lock(f"fill:{short_code}", token)
+
 
 # -------------------------
 # ✅ REDIRECT (No auth required)
@@ -256,65 +432,56 @@ async def delete_url(
 @redirect_router.get("/{short_code}")
 async def redirect_to_original_url(
     short_code: str,
-    request: Request,
-    db: AsyncSession = Depends(get_async_db)
+    request: Request
 ):
     """Redirect to original URL and track click"""
-    
-    # 1️⃣ Check cache first
-    cached_url = await cache.get_url(short_code)
-    if cached_url:
-        print(f"✅ Cache HIT: {short_code}")
-        await cache.increment_clicks(short_code)
-        
-        # Track click in background
-        click = Click(
-            url_id=None,  # We'll fix this properly below
-            ip_address=request.client.host if request.client else None,
-            user_agent=request.headers.get("user-agent"),
-            referrer=request.headers.get("referer")
+    if short_code_bloom.reject(short_code):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Short URL not found"
         )
-        # For now, skip DB insert to avoid errors
-        
-        return RedirectResponse(url=cached_url, status_code=307)
 
-    # 2️⃣ Database lookup
-    print(f"❌ Cache MISS: {short_code}")
-    result = await db.execute(
-        select(URL).where(URL.short_code == short_code)
-    )
-    url = result.scalar_one_or_none()
+    click = build_click_record(short_code, request)
+    use_stream = settings.CLICK_INGEST_MODE == "stream"
+    
+    # 1️⃣ Check cache first (stream mode records the click in the same round trip;
+    # the consumer drops records for codes that turn out not to be servable)
+    if use_stream:
+        entry = await cache.get_url_and_add_click(short_code, encode_stream_fields(click))
+    else:
+        entry = await cache.get_url(short_code)
 
-    if not url:
+    if entry:
+        print(f"✅ Cache HIT: {short_code}")
+    else:
+        # 2️⃣ Database lookup, one per code no matter how many requests miss at once
+        print(f"❌ Cache MISS: {short_code}")
+        entry = await url_lookups.do(short_code, lambda: load_url_entry(short_code))
+
+    if isinstance(entry, Tombstone) and entry.reason == "missing":
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Short URL not found"
         )
 
-    if not url.is_active:
+    # Disabled wins over expired, whether we hold the record or its tombstone
+    disabled = entry.reason == "disabled" if isinstance(entry, Tombstone) else not entry.is_active
+    if disabled:
         raise HTTPException(
             status_code=status.HTTP_410_GONE,
             detail="This URL has been disabled"
         )
 
-    if url.expires_at and url.expires_at < datetime.now(timezone.utc):
+    if isinstance(entry, Tombstone) or entry.is_expired():
         raise HTTPException(
             status_code=status.HTTP_410_GONE,
             detail="This URL has expired"
         )
 
     # 3️⃣ Track click
-    click = Click(
-        url_id=url.id,
-        ip_address=request.client.host if request.client else None,
-        user_agent=request.headers.get("user-agent"),
-        referrer=request.headers.get("referer")
-    )
-    db.add(click)
-    await db.commit()
-
-    # 4️⃣ Cache for next time
-    await cache.set_url(short_code, url.original_url, expire=86400)
-    await cache.increment_clicks(short_code)
+    if not use_stream:
+        click["url_id"] = entry.url_id
+        click["owner_id"] = entry.owner_id
+        click_pipeline.enqueue(click)
 
-    return RedirectResponse(url=url.original_url, status_code=307)
\ No newline at end of file
+    return RedirectResponse(url=entry.original_url, status_code=307)
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, EmailStr, HttpUrl, Field
 from typing import Optional, List, Dict
 from datetime import datetime
+from app.config import settings
 
 
 # -----------------------
@@ -21,6 +22,10 @@ class UserResponse(UserBase):
     class Config:
         from_attributes = True
 
+class PasswordChange(BaseModel):
+    current_password: str
+    new_password: str = Field(..., min_length=8)
+
 class UserLogin(BaseModel):
     username: str
     password: str
@@ -35,6 +40,23 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     username: Optional[str] = None
 
+class ApiKeyCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+
+class ApiKeyResponse(BaseModel):
+    id: int
+    name: str
+    prefix: str
+    is_active: bool
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class ApiKeyCreated(ApiKeyResponse):
+    # Shown once; only its hash is stored
+    key: str
+
 # -----------------------
 # URL Schemas
 # -----------------------
@@ -59,6 +81,33 @@ class URLResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class URLBatchCreate(BaseModel):
+    # Items are validated one by one so a bad row fails alone, not the batch
+    items: List[Dict] = Field(..., min_length=1, max_length=settings.URL_BATCH_MAX_ITEMS)
+
+class URLBatchItemResult(BaseModel):
+    index: int
+    url: Optional[URLResponse] = None
+    error: Optional[str] = None
+
+class URLBatchResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[URLBatchItemResult]
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportReport(BaseModel):
+    job_id: str
+    rows_read: int
+    resumed_from: int
+    imported: int
+    failed: int
+    errors: List[ImportRowError]
+    errors_truncated: bool
+
 class URLUpdate(BaseModel):
     title: Optional[str] = None
     is_active: Optional[bool] = None
@@ -0,0 +1,36 @@
+import asyncio
+from typing import Awaitable, Callable
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one in-flight call
+
+    The first caller starts the work as its own task; everyone arriving
+    while it runs awaits that same task. Running it as a task means a
+    cancelled caller (e.g. a client that disconnected) does not cancel the
+    work for the callers still waiting on it.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
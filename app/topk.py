@@ -0,0 +1,131 @@
+"""Per-owner top URLs over sliding windows
+
+Committed clicks are ZINCRBYed into one sorted set per owner per hour and
+per UTC day. A window is the union of its buckets: the last 24 hourly sets
+for days=1, otherwise the last `days` daily sets. Cost depends on how many
+distinct URLs were clicked in the window, never on the number of clicks.
+
+The sets only hold clicks scored since tracking began, recorded once in
+COVERAGE_KEY. Until a window lies entirely after that, callers rank from
+the rollups instead (see covers).
+"""
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from app.cache import cache
+
+KEY_PREFIX = "top:"
+# Unix time from which every committed click is in the sets
+COVERAGE_KEY = f"{KEY_PREFIX}since"
+MAX_WINDOW_DAYS = 30
+HOUR_KEY_TTL_SECONDS = 26 * 3600
+DAY_KEY_TTL_SECONDS = (MAX_WINDOW_DAYS + 2) * 86400
+
+
+def hour_key(owner_id: int, at: datetime) -> str:
+    return f"{KEY_PREFIX}{owner_id}:h:{at:%Y%m%d%H}"
+
+
+def day_key(owner_id: int, at: datetime) -> str:
+    return f"{KEY_PREFIX}{owner_id}:d:{at:%Y%m%d}"
+
+
+def window_keys(owner_id: int, days: int, now: datetime) -> list[str]:
+    """Bucket keys covering the last `days` days up to `now`"""
+    if days == 1:
+        return [hour_key(owner_id, now - timedelta(hours=i)) for i in range(24)]
+    return [day_key(owner_id, now - timedelta(days=i)) for i in range(days)]
+
+
+def window_start(days: int, now: datetime) -> datetime:
+    """Start of the oldest bucket in the window"""
+    if days == 1:
+        return now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=23)
+    return datetime.combine(now.date() - timedelta(days=days - 1), datetime.min.time())
+
+
+def bucket_scores(records: list[dict]) -> tuple[Counter, Counter]:
+    """Clicks per (hour key, url_id) and per (day key, url_id)"""
+    hours, days = Counter(), Counter()
+    for record in records:
+        owner_id, clicked_at = record["owner_id"], record["clicked_at"]
+        hours[hour_key(owner_id, clicked_at), record["url_id"]] += 1
+        days[day_key(owner_id, clicked_at), record["url_id"]] += 1
+    return hours, days
+
+
+class TopURLs:
+    async def add(self, records: list[dict]):
+        """Score a committed batch, one pipelined ZINCRBY per bucket and URL"""
+        hours, days = bucket_scores(records)
+        if not hours:
+            return
+        if not cache.redis_client:
+            await cache.connect()
+
+        try:
+            pipe = cache.redis_client.pipeline(transaction=False)
+            # Only the first batch sets it; after a Redis flush the next one does
+            pipe.set(COVERAGE_KEY, int(time.time()), nx=True)
+            for buckets, ttl in ((hours, HOUR_KEY_TTL_SECONDS), (days, DAY_KEY_TTL_SECONDS)):
+                for (key, url_id), clicks in buckets.items():
+                    pipe.zincrby(key, clicks, url_id)
+                for key in {key for key, _ in buckets}:
+                    pipe.expire(key, ttl)
+            await pipe.execute()
+        except Exception as e:
+            print(f"Redis ZINCRBY error: {e}")
+
+    async def covers(self, days: int) -> bool:
+        """Whether the sets hold every click of the window"""
+        if not cache.redis_client:
+            await cache.connect()
+
+        try:
+            since = await cache.redis_client.get(COVERAGE_KEY)
+        except Exception as e:
+            print(f"Redis GET top coverage error: {e}")
+            return False
+
+        if since is None:
+            return False
+        start = window_start(days, datetime.utcnow()).replace(tzinfo=timezone.utc)
+        return int(since) <= start.timestamp()
+
+    async def top(self, owner_id: int, days: int, limit: int) -> list[tuple[int, int]]:
+        """(url_id, clicks) for the owner's most clicked URLs in the window"""
+        if not cache.redis_client:
+            await cache.connect()
+
+        keys = window_keys(owner_id, days, datetime.utcnow())
+        tmp_key = f"{KEY_PREFIX}{owner_id}:w:{days}"
+        try:
+            pipe = cache.redis_client.pipeline(transaction=True)
+            pipe.zunionstore(tmp_key, keys)
+            pipe.zrevrange(tmp_key, 0, limit - 1, withscores=True)
+            pipe.delete(tmp_key)
+            _, ranked, _ = await pipe.execute()
+        except Exception as e:
+            print(f"Redis ZUNIONSTORE error: {e}")
+            return []
+
+        return [(int(url_id), int(score)) for url_id, score in ranked]
+
+    async def discard(self, owner_id: int, url_id: int):
+        """Remove a deleted URL from every live bucket"""
+        if not cache.redis_client:
+            await cache.connect()
+
+        now = datetime.utcnow()
+        try:
+            pipe = cache.redis_client.pipeline(transaction=False)
+            for key in window_keys(owner_id, 1, now) + window_keys(owner_id, MAX_WINDOW_DAYS, now):
+                pipe.zrem(key, url_id)
+            await pipe.execute()
+        except Exception as e:
+            print(f"Redis ZREM error: {e}")
+
+
+# Global top URL tracker
+top_urls = TopURLs()
@@ -1,11 +1,12 @@
 import string
-import random
+import secrets
 from passlib.context import CryptContext
 from jose import jwt
 from datetime import datetime, timedelta
 from app.config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes at any other cost are flagged by needs_update and redone at login
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -37,7 +38,7 @@ def generate_short_code(length: int = None) -> str:
         length = settings.SHORT_CODE_LENGTH
     
     characters = string.ascii_letters + string.digits
-    return ''.join(random.choice(characters) for _ in range(length))
+    return ''.join(secrets.choice(characters) for _ in range(length))
 
 
 def is_valid_short_code(code: str) -> bool:
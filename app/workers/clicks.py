@@ -0,0 +1,217 @@
+"""Redis Streams click consumer
+
+Run one or more of these next to the API when CLICK_INGEST_MODE=stream:
+
+    python -m app.workers.clicks --consumer writer-1
+
+Consumers in the same group share the stream, so throughput scales by
+starting more processes. Entries are acknowledged only after their batch is
+committed, which gives at-least-once delivery: a consumer that crashes
+replays its own pending entries on restart, and entries left pending by a
+consumer that never comes back are claimed by the others once idle.
+
+Entries that can never be written (undecodable, rows the DB rejects on
+their own, or anything redelivered CLICK_STREAM_MAX_DELIVERIES times) are
+moved to CLICK_STREAM_DEAD_LETTER_KEY with their original fields, the
+entry id and a reason, and acknowledged, so they can't stall the group.
+Re-add them with XADD once the cause is fixed.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+from typing import Optional
+import redis.asyncio as redis
+from redis.exceptions import ResponseError
+
+from app.clicks import decode_stream_fields, write_clicks, count_by_url
+from app.counters import click_counters
+from app.uniques import unique_visitors
+from app.topk import top_urls
+from app.config import settings
+
+
+class ClickStreamConsumer:
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        consumer: str,
+        group: str = settings.CLICK_STREAM_GROUP,
+        stream: str = settings.CLICK_STREAM_KEY,
+        batch_size: int = settings.CLICK_BATCH_SIZE,
+        block_ms: int = int(settings.CLICK_FLUSH_INTERVAL_SECONDS * 1000),
+        claim_idle_ms: int = settings.CLICK_STREAM_CLAIM_IDLE_MS,
+        dead_letter_stream: str = settings.CLICK_STREAM_DEAD_LETTER_KEY,
+        max_deliveries: int = settings.CLICK_STREAM_MAX_DELIVERIES,
+    ):
+        self.redis_client = redis_client
+        self.consumer = consumer
+        self.group = group
+        self.stream = stream
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.dead_letter_stream = dead_letter_stream
+        self.max_deliveries = max_deliveries
+        self.stopping = asyncio.Event()
+        self.written = 0
+        self.skipped = 0
+        self.dead_lettered = 0
+
+    async def ensure_group(self):
+        """Create the consumer group (and stream) if they do not exist yet"""
+        try:
+            await self.redis_client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def replay_pending(self):
+        """Reprocess entries this consumer read but never acknowledged"""
+        while not self.stopping.is_set():
+            response = await self.redis_client.xreadgroup(
+                self.group, self.consumer, {self.stream: "0"}, count=self.batch_size
+            )
+            entries = response[0][1] if response else []
+            if not entries:
+                return
+            await self.process(await self.drop_exhausted(entries))
+
+    async def claim_abandoned(self):
+        """Take over entries left pending by consumers that went away"""
+        start_id = "0-0"
+        while not self.stopping.is_set():
+            start_id, entries, *_ = await self.redis_client.xautoclaim(
+                self.stream, self.group, self.consumer,
+                min_idle_time=self.claim_idle_ms, start_id=start_id, count=self.batch_size
+            )
+            if entries:
+                await self.process(await self.drop_exhausted(entries))
+            if start_id == "0-0":
+                return
+
+    async def drop_exhausted(self, entries: list) -> list:
+        """Dead-letter pending entries already delivered too often; returns the rest"""
+        if not entries:
+            return entries
+
+        pending = await self.redis_client.xpending_range(
+            self.stream, self.group, min=entries[0][0], max=entries[-1][0],
+            count=len(entries), consumername=self.consumer
+        )
+        deliveries = {p["message_id"]: p["times_delivered"] for p in pending}
+        exhausted = [e for e in entries if deliveries.get(e[0], 0) >= self.max_deliveries]
+        if not exhausted:
+            return entries
+
+        await self.ack(exhausted, dead=exhausted, reason="max deliveries")
+        exhausted_ids = {entry_id for entry_id, _ in exhausted}
+        return [e for e in entries if e[0] not in exhausted_ids]
+
+    async def ack(self, entries: list, dead: list = (), reason: str = ""):
+        """Acknowledge entries, parking the `dead` ones in the dead-letter
+        stream in the same MULTI"""
+        if not entries:
+            return
+
+        pipe = self.redis_client.pipeline(transaction=True)
+        for entry_id, fields in dead:
+            pipe.xadd(
+                self.dead_letter_stream,
+                {**(fields or {}), "id": entry_id, "reason": reason},
+                maxlen=settings.CLICK_STREAM_MAXLEN,
+                approximate=True
+            )
+        pipe.xack(self.stream, self.group, *[entry_id for entry_id, _ in entries])
+        await pipe.execute()
+        self.dead_lettered += len(dead)
+
+    async def process(self, entries: list):
+        """Write a batch of stream entries to the clicks table, then ack them"""
+        if not entries:
+            return
+
+        decoded, undecodable = {}, []
+        for entry_id, fields in entries:
+            if not fields:
+                continue
+            try:
+                decoded[entry_id] = decode_stream_fields(fields)
+            except (KeyError, TypeError, ValueError):
+                undecodable.append((entry_id, fields))
+
+        records, failed = await write_clicks(list(decoded.values()))
+        await click_counters.add(count_by_url(records))
+        await unique_visitors.add(records)
+        await top_urls.add(records)
+
+        # Entries for unknown codes are acknowledged too, they can never resolve
+        failed_records = {id(r) for r in failed}
+        fields_by_id = dict(entries)
+        rejected = [
+            (entry_id, fields_by_id[entry_id])
+            for entry_id, record in decoded.items() if id(record) in failed_records
+        ]
+        await self.ack(entries, dead=undecodable + rejected, reason="rejected")
+        self.written += len(records)
+        self.skipped += len(entries) - len(records)
+
+    async def run(self):
+        # Startup work is retried like everything else, so a bad entry or a
+        # Redis hiccup can't crash-loop the worker
+        needs_replay = True
+        failures = 0
+        while not self.stopping.is_set():
+            try:
+                if needs_replay:
+                    await self.ensure_group()
+                    await self.replay_pending()
+                    await self.claim_abandoned()
+                    needs_replay = False
+
+                response = await self.redis_client.xreadgroup(
+                    self.group, self.consumer, {self.stream: ">"},
+                    count=self.batch_size, block=self.block_ms
+                )
+                if response:
+                    await self.process(response[0][1])
+                else:
+                    await self.claim_abandoned()
+                failures = 0
+            except Exception as e:
+                # Unacked entries stay pending and are retried on the next
+                # pass; back off so an outage doesn't burn their deliveries
+                print(f"Click consumer error: {e}")
+                needs_replay = True
+                failures += 1
+                await asyncio.sleep(min(2 ** failures, 60))
+
+
+async def main(consumer: Optional[str] = None):
+    redis_client = await redis.from_url(settings.REDIS_URL, decode_responses=True, encoding="utf-8")
+    worker = ClickStreamConsumer(
+        redis_client,
+        consumer=consumer or f"{socket.gethostname()}-{os.getpid()}",
+    )
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stopping.set)
+
+    print(f"✅ Click consumer {worker.consumer} reading {worker.stream} as {worker.group}")
+    try:
+        await worker.run()
+    finally:
+        await redis_client.close()
+        print(
+            f"❌ Click consumer stopped ({worker.written} written, {worker.skipped} skipped, "
+            f"{worker.dead_lettered} dead-lettered)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consume click records from the Redis Stream")
+    parser.add_argument("--consumer", help="Stable consumer name; reuse it to replay pending entries")
+    args = parser.parse_args()
+    asyncio.run(main(args.consumer))
@@ -1,8 +1,13 @@
+import os
 import pytest
 import asyncio
 from typing import Generator
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+
+# Many logins from one client IP; limits have their own tests
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
 from app.database import Base, get_async_db
 from app.main import app
 from app.config import settings
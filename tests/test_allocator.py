@@ -0,0 +1,42 @@
+import pytest
+from app.allocator import FeistelPermutation, ShortCodeAllocator, encode_base62
+
+
+def test_feistel_is_a_bijection():
+    """Test the permutation maps the domain onto itself without collisions"""
+    permutation = FeistelPermutation(b"test-key", domain=62 ** 2)
+
+    outputs = {permutation.permute(i) for i in range(62 ** 2)}
+    assert len(outputs) == 62 ** 2
+    assert max(outputs) < 62 ** 2
+    assert all(permutation.invert(permutation.permute(i)) == i for i in range(0, 62 ** 2, 97))
+
+
+def test_feistel_depends_on_key():
+    """Test different keys give different orderings"""
+    first = FeistelPermutation(b"key-one", domain=62 ** 6)
+    second = FeistelPermutation(b"key-two", domain=62 ** 6)
+
+    assert [first.permute(i) for i in range(10)] != [second.permute(i) for i in range(10)]
+
+
+def test_encode_base62_fixed_length():
+    """Test codes are padded to the configured length"""
+    assert encode_base62(0, 6) == "aaaaaa"
+    assert len(encode_base62(62 ** 6 - 1, 6)) == 6
+
+
+@pytest.mark.asyncio
+async def test_allocator_leases_blocks():
+    """Test the allocator only leases a new block when the current one runs out"""
+    allocator = ShortCodeAllocator(length=6, key=b"test-key", block_size=3, source="redis")
+    leases = iter([100, 200])
+
+    async def fake_lease():
+        return next(leases)
+
+    allocator._lease_block = fake_lease
+
+    ids = [await allocator.next_id() for _ in range(5)]
+    assert ids == [100, 101, 102, 200, 201]
+    assert allocator.blocks_leased == 2
@@ -0,0 +1,35 @@
+from app.api_keys import generate_key, hash_key, key_prefix, is_api_key, PREFIX_LENGTH
+
+
+def test_generated_key_parses_and_hashes():
+    """Test generated keys have the documented format and hash"""
+    new_key = generate_key()
+
+    assert is_api_key(new_key.key)
+    assert key_prefix(new_key.key) == new_key.prefix
+    assert len(new_key.prefix) == PREFIX_LENGTH
+    assert new_key.key_hash == hash_key(new_key.key)
+    assert len(new_key.key_hash) == 64
+
+
+def test_keys_are_unique():
+    """Test generated keys never share a prefix or a hash"""
+    keys = {generate_key() for _ in range(100)}
+
+    assert len({k.prefix for k in keys}) == 100
+    assert len({k.key_hash for k in keys}) == 100
+
+
+def test_hash_depends_on_the_secret():
+    """Test changing any character of the secret changes the hash"""
+    new_key = generate_key()
+
+    assert hash_key(new_key.key[:-1] + ("A" if new_key.key[-1] != "A" else "B")) != new_key.key_hash
+
+
+def test_malformed_keys_have_no_prefix():
+    """Test malformed keys are refused before any lookup"""
+    assert key_prefix("usk_short_secret") is None
+    assert key_prefix("abc_abcdefghijkl_secret") is None
+    assert key_prefix("usk_abcdefghijkl_") is None
+    assert not is_api_key("eyJhbGciOiJIUzI1NiJ9.e30.x")
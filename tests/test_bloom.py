@@ -0,0 +1,159 @@
+import asyncio
+import pytest
+
+from app import bloom as bloom_module
+from app.bloom import ShortCodeBloom
+
+
+def test_bloom_has_no_false_negatives():
+    """Test every added code is reported as possibly present"""
+    bloom = ShortCodeBloom(capacity=1000, error_rate=0.01)
+    bloom.ready = True
+
+    codes = [f"code{i}" for i in range(1000)]
+    for code in codes:
+        bloom.add_local(code)
+
+    assert all(bloom.might_contain(code) for code in codes)
+
+    false_positives = sum(bloom.might_contain(f"other{i}") for i in range(10000))
+    assert false_positives < 300
+
+
+def test_bloom_passes_everything_until_ready():
+    """Test an unloaded filter never rejects"""
+    bloom = ShortCodeBloom(capacity=1000, error_rate=0.01)
+
+    assert bloom.might_contain("abc123") is True
+    assert bloom.reject("abc123") is False
+
+
+def test_bloom_merge_keeps_local_bits():
+    """Test loading a snapshot keeps codes added while it loaded"""
+    bloom = ShortCodeBloom(capacity=1000, error_rate=0.01)
+    snapshot = ShortCodeBloom(capacity=1000, error_rate=0.01)
+    snapshot.add_local("fromredis")
+    bloom.add_local("fromlistener")
+
+    bloom.layers[0].merge(bytes(snapshot.layers[0].bits))
+    bloom.ready = True
+
+    assert bloom.might_contain("fromredis")
+    assert bloom.might_contain("fromlistener")
+
+
+def test_bloom_adds_layers_as_it_fills():
+    """Test a full filter grows a layer and keeps its error rate"""
+    bloom = ShortCodeBloom(capacity=1000, error_rate=0.01)
+    bloom.ready = True
+
+    codes = [f"code{i}" for i in range(5000)]
+    for code in codes:
+        bloom.add_local(code)
+
+    assert len(bloom.layers) == 3
+    assert bloom.layer_for(999) == 0
+    assert bloom.layer_for(1000) == 1
+    assert bloom.layer_for(3000) == 2
+    assert all(bloom.might_contain(code) for code in codes)
+
+    false_positives = sum(bloom.might_contain(f"other{i}") for i in range(10000))
+    assert false_positives < 300
+
+
+class FlakyPipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.codes = []
+
+    def setbit(self, key, pos, value):
+        pass
+
+    def incr(self, key):
+        pass
+
+    def publish(self, channel, message):
+        self.codes.append(message)
+
+    async def execute(self):
+        if self.redis.failures:
+            self.redis.failures -= 1
+            raise ConnectionError("redis down")
+        self.redis.published.extend(self.codes)
+
+
+class FlakyRedis:
+    def __init__(self, failures):
+        self.failures = failures
+        self.published = []
+
+    def pipeline(self, transaction=True):
+        return FlakyPipeline(self)
+
+
+@pytest.mark.asyncio
+async def test_bloom_retries_failed_writes(monkeypatch):
+    """Test codes whose Redis write failed are written once Redis is back"""
+    redis = FlakyRedis(failures=2)
+    monkeypatch.setattr(bloom_module.cache, "redis_client", object())
+    monkeypatch.setattr(bloom_module.cache, "binary_client", redis)
+    sleep = asyncio.sleep
+    monkeypatch.setattr(bloom_module.asyncio, "sleep", lambda delay: sleep(0))
+    bloom = ShortCodeBloom(capacity=1000, error_rate=0.01)
+
+    await bloom.add(["abc123", "def456"])
+    assert bloom.get_stats()["unsaved"] == 2
+
+    await bloom._retry_task
+    assert sorted(redis.published) == ["abc123", "def456"]
+    assert bloom.get_stats()["unsaved"] == 0
+    assert bloom.write_failures == 1
+
+
+class LayerRedis:
+    def __init__(self, values):
+        self.values = values
+
+    def pipeline(self, transaction=True):
+        return LayerPipeline(self)
+
+    async def exists(self, *keys):
+        return sum(key in self.values for key in keys)
+
+
+class LayerPipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    def exists(self, key):
+        self.ops.append(lambda: int(key in self.redis.values))
+
+    def get(self, key):
+        self.ops.append(lambda: self.redis.values.get(key))
+
+    async def execute(self):
+        return [op() for op in self.ops]
+
+
+@pytest.mark.asyncio
+async def test_bloom_rebuilds_when_a_layer_is_missing(monkeypatch):
+    """Test a build marker without every layer it implies counts as no build"""
+    bloom = ShortCodeBloom(capacity=1000, error_rate=0.01)
+    values = {f"{bloom.key}:built": b"1", f"{bloom.key}:count": b"5000"}
+    monkeypatch.setattr(bloom_module.cache, "binary_client", LayerRedis(values))
+
+    # Layer 2 opened at 3000 codes; layer 0 and 1 are full
+    assert await bloom._complete() is False
+
+    for index in range(3):
+        values[bloom._layer(index).key] = b"\x00"
+    assert await bloom._complete() is True
+
+    # The newest layer may not exist yet right after it opens
+    values[f"{bloom.key}:count"] = b"3500"
+    del values[bloom._layer(2).key]
+    assert await bloom._complete() is True
+
+    del values[f"{bloom.key}:built"]
+    assert await bloom._complete() is False
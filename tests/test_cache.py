@@ -1,5 +1,15 @@
 import pytest
-from app.cache import cache
+from datetime import datetime, timedelta, timezone
+from app.cache import (
+    cache,
+    LocalCache,
+    CachedURL,
+    Tombstone,
+    encode_url_entry,
+    encode_tombstone,
+    decode_url_entry
+)
+from app.counters import click_counters, ClickCounters
 
 
 @pytest.mark.asyncio
@@ -21,44 +31,234 @@ async def test_set_and_get_url():
     await cache.connect()
     
     short_code = "test123"
-    original_url = "https://www.example.com"
+    entry = CachedURL(
+        url_id=1,
+        original_url="https://www.example.com",
+        expires_at=None,
+        is_active=True,
+        owner_id=1
+    )
     
     # Set URL
-    await cache.set_url(short_code, original_url, expire=60)
+    await cache.set_url(short_code, entry, expire=60)
     
     # Get URL
-    cached_url = await cache.get_url(short_code)
-    assert cached_url == original_url
+    cached = await cache.get_url(short_code)
+    assert cached == entry
     
     # Delete URL
     await cache.delete_url(short_code)
-    cached_url = await cache.get_url(short_code)
-    assert cached_url is None
-    
+    cached = await cache.get_url(short_code)
+    assert cached is None
+
+    await cache.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_get_urls_batch():
+    """Test batched URL lookups"""
+    await cache.connect()
+
+    entry = CachedURL(
+        url_id=2,
+        original_url="https://www.example.org",
+        expires_at=None,
+        is_active=True,
+        owner_id=1
+    )
+    await cache.set_url("batch1", entry, expire=60)
+    await cache.set_tombstone("batch2", "missing")
+    await cache.delete_url("batch3")
+
+    cached = await cache.get_urls(["batch1", "batch2", "batch3"], local=False)
+    assert cached == {"batch1": entry, "batch2": Tombstone("missing"), "batch3": None}
+
+    await cache.delete_url("batch1")
+    await cache.delete_url("batch2")
     await cache.disconnect()
 
 
 @pytest.mark.asyncio
 async def test_click_count():
-    """Test click count caching"""
+    """Test pending click counters"""
     await cache.connect()
     
-    short_code = "test456"
+    url_id = 456
+    await click_counters.discard(url_id)
     
-    # Increment clicks
-    count1 = await cache.increment_click_count(short_code)
-    assert count1 == 1
+    # Record committed clicks
+    await click_counters.add({url_id: 1})
+    await click_counters.add({url_id: 2})
     
-    count2 = await cache.increment_click_count(short_code)
-    assert count2 == 2
+    # Get pending count
+    pending = await click_counters.pending([url_id])
+    assert pending[url_id] == 3
     
-    # Get count
-    count = await cache.get_click_count(short_code)
-    assert count == 2
+    # Discard count
+    await click_counters.discard(url_id)
+    pending = await click_counters.pending([url_id])
+    assert pending[url_id] == 0
     
-    # Reset count
-    await cache.reset_click_count(short_code)
-    count = await cache.get_click_count(short_code)
-    assert count == 0
-    
-    await cache.disconnect()
\ No newline at end of file
+    await cache.disconnect()
+
+
+class FlakyCounterRedis:
+    def __init__(self, failures):
+        self.failures = failures
+        self.counters = {}
+
+    def pipeline(self, transaction=True):
+        return FlakyCounterPipeline(self)
+
+
+class FlakyCounterPipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    def incrby(self, key, amount):
+        self.ops.append((key, amount))
+
+    def sadd(self, key, *members):
+        pass
+
+    async def execute(self):
+        if self.redis.failures:
+            self.redis.failures -= 1
+            raise ConnectionError("redis down")
+        for key, amount in self.ops:
+            self.redis.counters[key] = self.redis.counters.get(key, 0) + amount
+
+
+@pytest.mark.asyncio
+async def test_click_counters_resend_failed_adds(monkeypatch):
+    """Test counts Redis refused are sent with the next add"""
+    redis = FlakyCounterRedis(failures=1)
+    monkeypatch.setattr(cache, "redis_client", redis)
+    counters = ClickCounters(drain_interval=10, drain_batch=100, reconcile_interval=3600)
+
+    await counters.add({1: 2, 2: 1})
+    assert counters.get_stats()["unsent_clicks"] == 3
+
+    await counters.add({1: 1})
+    assert redis.counters == {"clicks:url:1": 3, "clicks:url:2": 1}
+    assert counters.get_stats()["unsent_clicks"] == 0
+
+
+class DrainingRedis:
+    def __init__(self, values):
+        self.values = values
+
+    def pipeline(self, transaction=True):
+        return DrainingPipeline(self.values)
+
+
+class DrainingPipeline:
+    def __init__(self, values):
+        self.values = values
+        self.ops = []
+
+    def mget(self, keys):
+        self.ops.append([self.values.get(key) for key in keys])
+
+    def hmget(self, key, fields):
+        self.ops.append([self.values.get(key, {}).get(str(field)) for field in fields])
+
+    def hget(self, key, field):
+        self.ops.append(self.values.get(key, {}).get(field))
+
+    async def execute(self):
+        return self.ops
+
+
+@pytest.mark.asyncio
+async def test_click_counters_skip_committed_drain(monkeypatch):
+    """Test a drain already in click_count is not counted again before its hash is cleared"""
+    monkeypatch.setattr(cache, "redis_client", DrainingRedis({
+        "clicks:url:1": "2",
+        "clicks:draining": {"1": "5", "drain_id": "1.2-3"},
+    }))
+    counters = ClickCounters(drain_interval=10, drain_batch=100, reconcile_interval=3600)
+
+    applied = False
+
+    async def drain_applied(drain_id):
+        return applied
+
+    monkeypatch.setattr(counters, "_drain_applied", drain_applied)
+    assert await counters.pending([1]) == {1: 7}
+
+    applied = True
+    assert await counters.pending([1]) == {1: 2}
+
+
+def test_local_cache_lru_eviction():
+    """Test local cache evicts least recently used entries"""
+    local = LocalCache(max_entries=2, max_bytes=1024, ttl=60)
+
+    local.set("a", "https://a.example.com", size=10)
+    local.set("b", "https://b.example.com", size=10)
+    assert local.get("a") == "https://a.example.com"
+
+    local.set("c", "https://c.example.com", size=10)
+    assert local.get("b") is None
+    assert local.get("a") == "https://a.example.com"
+    assert local.get("c") == "https://c.example.com"
+    assert local.evictions == 1
+
+
+def test_local_cache_byte_limit_and_ttl():
+    """Test local cache honours byte budget and expiry"""
+    local = LocalCache(max_entries=10, max_bytes=25, ttl=60)
+
+    local.set("a", "x", size=10)
+    local.set("b", "y", size=10)
+    local.set("c", "z", size=10)
+    assert local.get_stats()["bytes"] <= 25
+    assert local.get("a") is None
+
+    local.set("d", "w", size=5, ttl=0)
+    assert local.get("d") is None
+
+
+def test_url_entry_round_trip():
+    """Test packed URL records keep every field"""
+    entry = CachedURL(
+        url_id=7,
+        original_url="https://www.example.com/ünïcode",
+        expires_at=datetime(2030, 1, 1, tzinfo=timezone.utc),
+        is_active=False,
+        owner_id=3
+    )
+
+    assert decode_url_entry(encode_url_entry(entry)) == entry
+    assert decode_url_entry(b"\x01" + encode_url_entry(entry)[1:]) is None
+
+
+def test_url_entry_ttl_clamped_to_expiry():
+    """Test cache TTL never outlives the link"""
+    soon = datetime.now(timezone.utc) + timedelta(seconds=120)
+    entry = CachedURL(1, "https://www.example.com", soon, True, 1)
+
+    assert 0 < entry.ttl(86400) <= 120
+    assert entry._replace(expires_at=None).ttl(86400) == 86400
+    assert entry._replace(expires_at=soon - timedelta(days=1)).ttl(86400) == 0
+    assert entry._replace(expires_at=soon - timedelta(days=1)).is_servable() is False
+
+
+def test_tombstone_round_trip():
+    """Test negative cache entries decode to tombstones"""
+    assert decode_url_entry(encode_tombstone("missing")) == Tombstone("missing")
+    assert decode_url_entry(encode_tombstone("expired")) == Tombstone("expired")
+    assert decode_url_entry(encode_tombstone("disabled")) == Tombstone("disabled")
+    assert Tombstone("missing").is_servable() is False
+
+
+def test_expired_disabled_link_stays_disabled():
+    """Test an expired record is tombstoned as disabled when it was disabled"""
+    past = datetime.now(timezone.utc) - timedelta(hours=1)
+    entry = CachedURL(url_id=1, original_url="https://a.example.com", expires_at=past, is_active=False, owner_id=1)
+
+    assert entry.ttl() == 0
+    assert entry.gone_reason() == "disabled"
+    assert entry._replace(is_active=True).gone_reason() == "expired"
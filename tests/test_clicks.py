@@ -0,0 +1,170 @@
+import pytest
+from datetime import datetime
+from types import SimpleNamespace
+from app.workers.clicks import ClickStreamConsumer
+from app.clicks import (
+    ClickPipeline, encode_stream_fields, decode_stream_fields, build_click_record,
+    write_clicks, resolve_url_ids, HEADER_MAX_LENGTH
+)
+
+
+@pytest.mark.asyncio
+async def test_click_pipeline_drops_when_full():
+    """Test the click buffer applies backpressure by dropping"""
+    pipeline = ClickPipeline(max_queue=2, batch_size=10, flush_interval=1.0)
+
+    assert pipeline.enqueue({"short_code": "abc123"}) is True
+    assert pipeline.enqueue({"short_code": "abc123"}) is True
+    assert pipeline.enqueue({"short_code": "abc123"}) is False
+
+    stats = pipeline.get_stats()
+    assert stats["enqueued"] == 2
+    assert stats["dropped"] == 1
+    assert stats["queued"] == 2
+
+
+def test_stream_fields_round_trip():
+    """Test click records survive encoding as stream entries"""
+    record = {
+        "short_code": "abc123",
+        "url_id": 42,
+        "ip_address": "10.0.0.1",
+        "user_agent": None,
+        "referrer": "https://example.com/",
+        "clicked_at": datetime(2024, 1, 2, 3, 4, 5),
+    }
+
+    fields = encode_stream_fields(record)
+    assert "ua" not in fields
+    assert decode_stream_fields(fields) == record
+
+
+def test_click_record_truncates_long_headers():
+    """Test oversized User-Agent and Referer headers fit the VARCHAR(512) columns"""
+    request = SimpleNamespace(
+        client=SimpleNamespace(host="10.0.0.1"),
+        headers={"user-agent": "a" * 5000, "referer": "https://example.com/" + "b" * 5000},
+    )
+    record = build_click_record("abc123", request)
+
+    assert len(record["user_agent"]) == HEADER_MAX_LENGTH
+    assert len(record["referrer"]) == HEADER_MAX_LENGTH
+
+    fields = encode_stream_fields({**record, "user_agent": "c" * 5000})
+    assert len(decode_stream_fields(fields)["user_agent"]) == HEADER_MAX_LENGTH
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def begin_nested(self):
+        return FakeSession()
+
+    async def commit(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_write_clicks_isolates_bad_rows(monkeypatch):
+    """Test a row that fails the batch insert is retried alone and the rest are kept"""
+    async def resolve(session, records):
+        return records
+
+    async def insert(session, records):
+        if any(r["url_id"] == 2 for r in records):
+            raise ValueError("value too long")
+
+    async def rollups(session, records):
+        pass
+
+    monkeypatch.setattr("app.clicks.AsyncSessionLocal", FakeSession)
+    monkeypatch.setattr("app.clicks.resolve_url_ids", resolve)
+    monkeypatch.setattr("app.clicks.insert_clicks", insert)
+    monkeypatch.setattr("app.clicks.apply_rollups", rollups)
+
+    written, failed = await write_clicks([{"url_id": i} for i in range(1, 4)])
+
+    assert [r["url_id"] for r in written] == [1, 3]
+    assert [r["url_id"] for r in failed] == [2]
+
+
+class FakeStreamRedis:
+    def __init__(self, deliveries=None):
+        self.deliveries = deliveries or {}
+        self.acked = []
+        self.dead = []
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def xadd(self, stream, fields, **kwargs):
+        self.dead.append(fields)
+
+    def xack(self, stream, group, *ids):
+        self.acked.extend(ids)
+
+    async def execute(self):
+        pass
+
+    async def xpending_range(self, stream, group, min, max, count, consumername=None):
+        return [{"message_id": i, "times_delivered": n} for i, n in self.deliveries.items()]
+
+
+@pytest.mark.asyncio
+async def test_consumer_dead_letters_poison_entries(monkeypatch):
+    """Test undecodable and rejected entries are parked and every entry is acked"""
+    async def write(batch):
+        return [r for r in batch if r["url_id"] != 2], [r for r in batch if r["url_id"] == 2]
+
+    async def noop(*args):
+        pass
+
+    monkeypatch.setattr("app.workers.clicks.write_clicks", write)
+    monkeypatch.setattr("app.workers.clicks.click_counters.add", noop)
+    monkeypatch.setattr("app.workers.clicks.unique_visitors.add", noop)
+    monkeypatch.setattr("app.workers.clicks.top_urls.add", noop)
+
+    redis_client = FakeStreamRedis()
+    consumer = ClickStreamConsumer(redis_client, consumer="test")
+    await consumer.process([
+        ("1-0", {"c": "abc123", "u": "1", "t": "1700000000.000"}),
+        ("2-0", {"c": "abc124", "u": "2", "t": "1700000000.000"}),
+        ("3-0", {"c": "abc125", "u": "3"}),
+    ])
+
+    assert redis_client.acked == ["1-0", "2-0", "3-0"]
+    assert sorted((d["id"], d["reason"]) for d in redis_client.dead) == [("2-0", "rejected"), ("3-0", "rejected")]
+    assert consumer.written == 1
+    assert consumer.dead_lettered == 2
+
+
+@pytest.mark.asyncio
+async def test_consumer_dead_letters_after_max_deliveries():
+    """Test entries redelivered too often are parked instead of retried forever"""
+    redis_client = FakeStreamRedis(deliveries={"1-0": 10, "2-0": 1})
+    consumer = ClickStreamConsumer(redis_client, consumer="test", max_deliveries=10)
+
+    remaining = await consumer.drop_exhausted([("1-0", {"c": "abc123"}), ("2-0", {"c": "abc124"})])
+
+    assert [entry_id for entry_id, _ in remaining] == ["2-0"]
+    assert redis_client.acked == ["1-0"]
+    assert redis_client.dead[0]["reason"] == "max deliveries"
+
+
+@pytest.mark.asyncio
+async def test_resolve_url_ids_drops_deleted_links():
+    """Test clicks queued for a link deleted before the flush are dropped, not inserted"""
+    class Session:
+        async def scalars(self, query):
+            return [1]
+
+    records = [
+        {"short_code": "abc123", "url_id": 1, "owner_id": 7},
+        {"short_code": "gone12", "url_id": 2, "owner_id": 7},
+    ]
+
+    assert [r["url_id"] for r in await resolve_url_ids(Session(), records)] == [1]
@@ -0,0 +1,51 @@
+import asyncio
+import threading
+import pytest
+from app.hashing import PasswordHasher, HashingBusy
+
+
+@pytest.mark.asyncio
+async def test_hashing_runs_off_the_event_loop():
+    """Test work runs on a pool thread and queue time is recorded"""
+    hasher = PasswordHasher(workers=1, max_pending=4, queue_timeout=5)
+    loop_thread = threading.get_ident()
+
+    threads = await asyncio.gather(*[hasher._run(threading.get_ident) for _ in range(3)])
+
+    assert loop_thread not in threads
+    stats = hasher.get_stats()
+    assert stats["completed"] == 3
+    assert stats["in_flight"] == 0
+    assert stats["rejected"] == 0
+
+
+@pytest.mark.asyncio
+async def test_hashing_rejects_when_pool_is_full():
+    """Test callers past workers + max_pending fail fast instead of queueing"""
+    hasher = PasswordHasher(workers=1, max_pending=1, queue_timeout=5)
+    release = threading.Event()
+
+    running = [asyncio.create_task(hasher._run(release.wait)) for _ in range(2)]
+    await asyncio.sleep(0.05)
+    with pytest.raises(HashingBusy):
+        await hasher._run(release.wait)
+
+    release.set()
+    await asyncio.gather(*running)
+    assert hasher.get_stats()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_hashing_gives_up_after_queue_timeout():
+    """Test a waiter that never got a thread is cancelled, not left queued"""
+    hasher = PasswordHasher(workers=1, max_pending=4, queue_timeout=0.05)
+    release = threading.Event()
+
+    running = asyncio.create_task(hasher._run(release.wait))
+    await asyncio.sleep(0.01)
+    with pytest.raises(HashingBusy):
+        await hasher._run(release.wait)
+
+    release.set()
+    await running
+    assert hasher.get_stats()["completed"] == 1
@@ -0,0 +1,47 @@
+import io
+import pytest
+from app.importer import URLImporter, read_rows, validate_row
+
+
+def test_read_rows_csv():
+    """Test CSV rows are streamed with their line numbers"""
+    data = b"original_url,short_code,title\nhttps://a.example.com,abcd1,A\nhttps://b.example.com,,B\n"
+
+    rows = list(read_rows(io.BytesIO(data), "csv"))
+    assert [number for number, _ in rows] == [1, 2]
+    assert rows[0][1]["short_code"] == "abcd1"
+
+
+def test_read_rows_csv_with_byte_order_mark():
+    """Test a BOM-prefixed export still has an original_url column"""
+    data = "\ufefforiginal_url,title\nhttps://a.example.com,A\n".encode("utf-8")
+
+    rows = list(read_rows(io.BytesIO(data), "csv"))
+    assert rows[0][1]["original_url"] == "https://a.example.com"
+
+
+def test_read_rows_ndjson_reports_bad_lines():
+    """Test malformed NDJSON lines become per-row errors"""
+    data = b'{"original_url": "https://a.example.com"}\n\nnot json\n[1, 2]\n'
+
+    rows = list(read_rows(io.BytesIO(data), "ndjson"))
+    assert isinstance(rows[0][1], dict)
+    assert rows[1][0] == 3 and rows[1][1].startswith("Invalid JSON")
+    assert rows[2][1] == "Row must be a JSON object"
+
+
+def test_validate_row_uses_api_rules():
+    """Test imported rows follow URLCreate and short code validation"""
+    url_data = validate_row({"original_url": "https://a.example.com", "short_code": "abcd1", "title": ""})
+    assert url_data.custom_short_code == "abcd1"
+    assert url_data.title is None
+
+    with pytest.raises(ValueError):
+        validate_row({"original_url": "https://a.example.com", "short_code": "ab-cd"})
+    with pytest.raises(ValueError):
+        validate_row({"original_url": "not a url"})
+
+
+def test_import_progress_is_scoped_to_owner():
+    """Test two users resuming the same job_id never share progress"""
+    assert URLImporter(1, job_id="job").key != URLImporter(2, job_id="job").key
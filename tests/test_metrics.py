@@ -0,0 +1,17 @@
+from fastapi.testclient import TestClient
+from app.main import app
+from app.config import settings
+
+
+def test_metrics_hidden_without_token(monkeypatch):
+    """Test /metrics is not served unless METRICS_TOKEN is configured and sent"""
+    client = TestClient(app)
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "")
+    assert client.get("/metrics", headers={"X-Metrics-Token": ""}).status_code == 404
+
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "s3cret")
+    assert client.get("/metrics").status_code == 404
+    assert client.get("/metrics", headers={"X-Metrics-Token": "wrong"}).status_code == 404
+    response = client.get("/metrics", headers={"X-Metrics-Token": "s3cret"})
+    assert response.status_code == 200
+    assert "cache" in response.json()
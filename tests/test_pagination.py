@@ -0,0 +1,29 @@
+import pytest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from app.pagination import encode_cursor, decode_cursor, next_cursor
+
+
+def test_cursor_round_trip():
+    """Test a cursor decodes to the position it encoded"""
+    at = datetime(2026, 10, 17, 9, 30, 15, 123456, tzinfo=timezone.utc)
+
+    cursor = encode_cursor(at, 42)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (at, 42)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", encode_cursor(datetime(2026, 1, 1), 1)[:-3]])
+def test_invalid_cursor(cursor):
+    """Test malformed cursors are rejected"""
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_next_cursor_only_on_full_page():
+    """Test a next cursor is only issued when the page is full"""
+    rows = [SimpleNamespace(id=i, created_at=datetime(2026, 10, 17, i)) for i in (3, 2)]
+
+    assert next_cursor(rows, 3, "created_at") is None
+    assert decode_cursor(next_cursor(rows, 2, "created_at")) == (datetime(2026, 10, 17, 2), 2)
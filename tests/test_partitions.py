@@ -0,0 +1,27 @@
+from datetime import date
+from app.partitions import add_months, partition_ranges, partition_month, expired_partitions
+
+
+def test_add_months_wraps_years():
+    """Test month arithmetic across year boundaries"""
+    assert add_months(date(2026, 11, 1), 1) == date(2026, 12, 1)
+    assert add_months(date(2026, 12, 1), 1) == date(2027, 1, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+
+
+def test_partition_ranges():
+    """Test monthly partition bounds from a start date to an end date"""
+    assert partition_ranges(date(2026, 11, 17), date(2027, 1, 1)) == [
+        ("clicks_p202611", date(2026, 11, 1), date(2026, 12, 1)),
+        ("clicks_p202612", date(2026, 12, 1), date(2027, 1, 1)),
+        ("clicks_p202701", date(2027, 1, 1), date(2027, 2, 1)),
+    ]
+
+
+def test_expired_partitions_only_whole_months():
+    """Test only partitions entirely before the cutoff expire"""
+    names = ["clicks_p202607", "clicks_p202608", "clicks_p202609", "clicks_default"]
+
+    assert partition_month("clicks_default") is None
+    assert expired_partitions(names, date(2026, 9, 1)) == ["clicks_p202607", "clicks_p202608"]
+    assert expired_partitions(names, date(2026, 8, 31)) == ["clicks_p202607"]
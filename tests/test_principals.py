@@ -0,0 +1,53 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from app.cache import cache
+from app.principals import Principal, PrincipalCache, principal_key, encode_principal, decode_principal
+
+
+def test_principal_from_model_is_detached():
+    """Test principals copy the fields they need off the model"""
+    user = SimpleNamespace(
+        id=7, username="alice", email="alice@example.com", is_active=None,
+        created_at=datetime(2026, 10, 17, tzinfo=timezone.utc), hashed_password="x"
+    )
+    principal = Principal.from_model(user)
+
+    assert principal == (7, "alice", "alice@example.com", False, user.created_at)
+    assert not hasattr(principal, "hashed_password")
+
+
+def test_principal_round_trip():
+    """Test a principal survives encoding and decoding"""
+    principal = Principal(7, "alice", "alice@example.com", True, datetime(2026, 10, 17, tzinfo=timezone.utc))
+
+    assert decode_principal(encode_principal(principal)) == principal
+    assert decode_principal(encode_principal(principal._replace(created_at=None))).created_at is None
+
+
+def test_decode_principal_rejects_garbage():
+    """Test undecodable cache entries are treated as misses"""
+    assert decode_principal("not json") is None
+    assert decode_principal('{"id": 1}') is None
+
+
+def test_principal_key_never_collides_with_short_codes():
+    """Test principal keys cannot be mistaken for short codes"""
+    assert ":" in principal_key("alice")
+
+
+def test_principals_have_their_own_lru():
+    """Test principals stay out of the URL cache and drop on invalidation"""
+    principals = PrincipalCache(ttl=60, local_ttl=10, local_max_entries=10, local_max_bytes=10000)
+    principal = Principal(7, "alice", "alice@example.com", True, None)
+    try:
+        principals._cache_local(principal)
+        assert cache.local.get(principal_key("alice")) is None
+        assert principals.local.get(principal_key("alice")) == principal
+
+        # As announced by another worker on the invalidation channel
+        for hook in cache.key_invalidation_hooks:
+            hook(principal_key("alice"))
+        assert principals.local.get(principal_key("alice")) is None
+    finally:
+        cache.key_invalidation_hooks.remove(principals.local.delete)
+        cache.reconnect_hooks.remove(principals.local.clear)
@@ -0,0 +1,106 @@
+import pytest
+from app.middleware.rate_limiter import (
+    RateLimiter, RateLimiterMiddleware, LocalLeakyBucket, Policy, rate_limiter
+)
+from app.utils import create_access_token
+
+API = Policy("api", per_minute=60, burst=3, by_user=True)
+
+
+def make_scope(path="/api/v1/urls", method="GET", headers=(), client=("10.0.0.1", 1234)):
+    return {"type": "http", "method": method, "path": path, "headers": list(headers), "client": client}
+
+
+def test_local_bucket_allows_burst_then_refuses(monkeypatch):
+    """Test the local bucket allows a burst, refuses, then drains"""
+    bucket = LocalLeakyBucket(max_keys=10)
+    now = [1000.0]
+    monkeypatch.setattr("app.middleware.rate_limiter.time.monotonic", lambda: now[0])
+
+    assert [bucket.allow("k", API) for _ in range(3)] == [None, None, None]
+    refused = bucket.allow("k", API)
+    assert refused is not None and not refused.allowed
+    assert refused.retry_after_ms == 1000
+
+    # One interval later one more request fits
+    now[0] += 1.0
+    assert bucket.allow("k", API) is None
+    assert bucket.allow("k", API) is not None
+
+
+def test_local_bucket_refund_and_bound():
+    """Test refunds lower a level and the bucket keeps at most max_keys"""
+    bucket = LocalLeakyBucket(max_keys=2)
+    for _ in range(3):
+        bucket.allow("a", API)
+    bucket.refund("a")
+    assert bucket.allow("a", API) is None
+
+    bucket.allow("b", API)
+    bucket.allow("c", API)
+    assert "a" not in bucket._levels
+
+
+def test_policy_routing():
+    """Test requests are matched to the login, API or redirect policy"""
+    assert rate_limiter.policy_for("GET", "/health") is None
+    assert rate_limiter.policy_for("OPTIONS", "/api/v1/urls") is None
+    assert rate_limiter.policy_for("POST", "/api/v1/auth/login").name == "login"
+    assert rate_limiter.policy_for("GET", "/api/v1/urls").name == "api"
+    assert rate_limiter.policy_for("GET", "/abc123").name == "redirect"
+
+
+def test_identity_prefers_verified_user():
+    """Test verified users are limited by name, everyone else by IP"""
+    api = rate_limiter.policies["api"]
+    token = create_access_token({"sub": "alice"})
+
+    assert rate_limiter.identity(make_scope(headers=[(b"authorization", f"Bearer {token}".encode())]), api) == "user:alice"
+    assert rate_limiter.identity(make_scope(headers=[(b"authorization", b"Bearer forged")]), api) == "ip:10.0.0.1"
+    # Unverified API keys count against the IP
+    assert rate_limiter.identity(make_scope(headers=[(b"x-api-key", b"usk_abcdefghijkl_secret")]), api) == "ip:10.0.0.1"
+    # Redirects and logins are always per IP
+    assert rate_limiter.identity(
+        make_scope(headers=[(b"authorization", f"Bearer {token}".encode())]), rate_limiter.policies["login"]
+    ) == "ip:10.0.0.1"
+
+
+@pytest.mark.asyncio
+async def test_middleware_refuses_locally_without_redis():
+    """Test a drained local bucket answers 429 before Redis or the app is touched"""
+    limiter = RateLimiter({"api": API, "login": API, "redirect": API}, local_precheck=True, local_max_keys=10)
+    for _ in range(API.burst):
+        limiter.local.allow("api:ip:10.0.0.1", API)
+
+    async def app(scope, receive, send):
+        raise AssertionError("app should not be called")
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    await RateLimiterMiddleware(app, limiter=limiter)(make_scope(), None, send)
+
+    assert sent[0]["status"] == 429
+    headers = dict(sent[0]["headers"])
+    assert headers[b"retry-after"] == b"1"
+    assert headers[b"x-ratelimit-remaining"] == b"0"
+    assert limiter.get_stats()["local_limited"] == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_errors_counted_and_logged_once(monkeypatch, capsys):
+    """Test requests are allowed while Redis fails, with one log line per interval"""
+    limiter = RateLimiter({"api": API, "login": API, "redirect": API}, local_precheck=False, local_max_keys=10)
+
+    async def failing_script(keys, args):
+        raise ConnectionError("down")
+
+    limiter._script = failing_script
+    monkeypatch.setattr("app.middleware.rate_limiter.cache.redis_client", object())
+    for _ in range(5):
+        assert (await limiter.check("api:ip:10.0.0.1", API)).allowed
+
+    assert limiter.get_stats()["errors"] == 5
+    assert capsys.readouterr().out.count("Redis rate limit error") == 1
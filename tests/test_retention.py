@@ -0,0 +1,32 @@
+from datetime import date
+from app.retention import fold_ranges, fold_repairs, utc_midnight
+from app.rollups import owner_totals
+
+
+def test_fold_ranges_split_on_months():
+    """Test expired days are folded one month at a time"""
+    assert fold_ranges(date(2026, 7, 20), date(2026, 9, 10)) == [
+        (date(2026, 7, 20), date(2026, 8, 1)),
+        (date(2026, 8, 1), date(2026, 9, 1)),
+        (date(2026, 9, 1), date(2026, 9, 10)),
+    ]
+
+
+def test_fold_ranges_empty_when_nothing_expired():
+    """Test nothing is folded when nothing has expired"""
+    assert fold_ranges(date(2026, 9, 10), date(2026, 9, 10)) == []
+
+
+def test_utc_midnight():
+    """Test days become UTC midnight timestamps"""
+    assert utc_midnight(date(2026, 10, 17)) == "2026-10-17 00:00:00+00"
+
+
+def test_fold_repairs_reach_owner_totals():
+    """Test folded clicks are added to owner days and totals as well as URL days"""
+    day1, day2 = date(2026, 9, 1), date(2026, 9, 2)
+    daily, owners = fold_repairs([(1, 7, day1, 3), (2, 7, day1, 2), (2, 7, day2, 1), (3, 8, day2, 4)])
+    assert daily == {(1, day1): 3, (2, day1): 2, (2, day2): 1, (3, day2): 4}
+    assert owners == {(7, day1): 5, (7, day2): 1, (8, day2): 4}
+    assert owner_totals(owners) == {7: 6, 8: 4}
+    assert sum(daily.values()) == sum(owner_totals(owners).values())
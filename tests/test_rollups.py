@@ -0,0 +1,55 @@
+from datetime import date, datetime
+from app.rollups import bucket_counts, daily_series, owner_counts, first_whole_day
+
+
+def test_bucket_counts():
+    """Test clicks are counted per URL per hour and per day"""
+    records = [
+        {"url_id": 1, "clicked_at": datetime(2026, 10, 17, 9, 5)},
+        {"url_id": 1, "clicked_at": datetime(2026, 10, 17, 9, 55)},
+        {"url_id": 1, "clicked_at": datetime(2026, 10, 17, 23, 59)},
+        {"url_id": 2, "clicked_at": datetime(2026, 10, 18, 0, 1)},
+    ]
+
+    hourly, daily = bucket_counts(records)
+
+    assert hourly == {
+        (1, datetime(2026, 10, 17, 9)): 2,
+        (1, datetime(2026, 10, 17, 23)): 1,
+        (2, datetime(2026, 10, 18, 0)): 1,
+    }
+    assert daily == {(1, date(2026, 10, 17)): 3, (2, date(2026, 10, 18)): 1}
+
+
+def test_daily_series_fills_gaps():
+    """Test days without clicks appear with a zero count"""
+    series = daily_series({date(2026, 10, 16): 4}, date(2026, 10, 15), date(2026, 10, 17))
+
+    assert series == [
+        {"date": "2026-10-15", "count": 0},
+        {"date": "2026-10-16", "count": 4},
+        {"date": "2026-10-17", "count": 0},
+    ]
+
+
+def test_owner_counts():
+    """Test clicks are counted per owner per day"""
+    records = [
+        {"url_id": 1, "owner_id": 7, "clicked_at": datetime(2026, 10, 17, 9, 5)},
+        {"url_id": 2, "owner_id": 7, "clicked_at": datetime(2026, 10, 17, 10, 5)},
+        {"url_id": 3, "owner_id": 8, "clicked_at": datetime(2026, 10, 18, 0, 1)},
+    ]
+
+    assert owner_counts(records) == {(7, date(2026, 10, 17)): 2, (8, date(2026, 10, 18)): 1}
+
+
+def test_first_whole_day_falls_back_past_hourly_retention(monkeypatch):
+    """Test the partial first day comes from the daily table once its hours may be gone"""
+    since = datetime(2026, 10, 10, 15, 30)
+
+    monkeypatch.setattr("app.rollups.settings.HOURLY_ROLLUP_RETENTION_DAYS", 0)
+    assert first_whole_day(since, date(2026, 10, 17)) == date(2026, 10, 11)
+
+    monkeypatch.setattr("app.rollups.settings.HOURLY_ROLLUP_RETENTION_DAYS", 7)
+    assert first_whole_day(since, date(2026, 10, 17)) == date(2026, 10, 11)
+    assert first_whole_day(since, date(2026, 10, 18)) == date(2026, 10, 10)
@@ -0,0 +1,40 @@
+import asyncio
+import pytest
+from app.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_concurrent_calls():
+    """Test concurrent callers for one key share a single call"""
+    flight = SingleFlight()
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "https://www.example.com"
+
+    results = await asyncio.gather(*[flight.do("abc123", load) for _ in range(50)])
+
+    assert results == ["https://www.example.com"] * 50
+    assert calls == 1
+    assert flight.get_stats() == {"in_flight": 0, "leaders": 1, "coalesced": 49}
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_errors_and_forgets_key():
+    """Test a failure reaches every waiter and the next call retries"""
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("db down")
+
+    results = await asyncio.gather(*[flight.do("abc123", fail) for _ in range(3)], return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+    async def ok():
+        return 1
+
+    assert await flight.do("abc123", ok) == 1
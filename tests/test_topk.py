@@ -0,0 +1,40 @@
+from datetime import datetime
+from app.topk import bucket_scores, window_keys, window_start
+
+
+def test_bucket_scores():
+    """Test clicks are scored into hourly and daily buckets"""
+    records = [
+        {"url_id": 1, "owner_id": 7, "clicked_at": datetime(2026, 10, 17, 9, 5)},
+        {"url_id": 1, "owner_id": 7, "clicked_at": datetime(2026, 10, 17, 10, 5)},
+        {"url_id": 2, "owner_id": 7, "clicked_at": datetime(2026, 10, 17, 10, 6)},
+    ]
+
+    hours, days = bucket_scores(records)
+
+    assert hours == {
+        ("top:7:h:2026101709", 1): 1,
+        ("top:7:h:2026101710", 1): 1,
+        ("top:7:h:2026101710", 2): 1,
+    }
+    assert days == {("top:7:d:20261017", 1): 2, ("top:7:d:20261017", 2): 1}
+
+
+def test_window_keys():
+    """Test windows cover the last 24 hours or the last N days"""
+    now = datetime(2026, 10, 17, 9, 30)
+
+    last_day = window_keys(7, 1, now)
+    assert len(last_day) == 24
+    assert last_day[0] == "top:7:h:2026101709"
+    assert last_day[-1] == "top:7:h:2026101610"
+
+    assert window_keys(7, 7, now) == [f"top:7:d:202610{d}" for d in range(17, 10, -1)]
+
+
+def test_window_start():
+    """Test the window starts at its oldest bucket, matching window_keys"""
+    now = datetime(2026, 10, 17, 9, 30)
+
+    assert window_start(1, now) == datetime(2026, 10, 16, 10)
+    assert window_start(7, now) == datetime(2026, 10, 11)
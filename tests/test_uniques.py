@@ -0,0 +1,20 @@
+from datetime import datetime
+from app.uniques import visitors_by_key
+
+
+def test_visitors_by_key():
+    """Test click records are grouped into visitor sets per key"""
+    records = [
+        {"url_id": 1, "ip_address": "10.0.0.1", "clicked_at": datetime(2026, 10, 16, 23, 0)},
+        {"url_id": 1, "ip_address": "10.0.0.1", "clicked_at": datetime(2026, 10, 17, 1, 0)},
+        {"url_id": 1, "ip_address": "10.0.0.2", "clicked_at": datetime(2026, 10, 17, 2, 0)},
+        {"url_id": 2, "ip_address": None, "clicked_at": datetime(2026, 10, 17, 2, 0)},
+    ]
+
+    totals, days = visitors_by_key(records)
+
+    assert totals == {"hll:url:1": {"10.0.0.1", "10.0.0.2"}}
+    assert days == {
+        "hll:url:1:2026-10-16": {"10.0.0.1"},
+        "hll:url:1:2026-10-17": {"10.0.0.1", "10.0.0.2"},
+    }
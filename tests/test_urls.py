@@ -168,4 +168,31 @@ async def test_delete_url():
             f"/api/urls/{short_code}",
             headers={"Authorization": f"Bearer {token}"}
         )
-        assert response.status_code == 204
\ No newline at end of file
+        assert response.status_code == 204
+
+
+@pytest.mark.asyncio
+async def test_create_short_urls_batch():
+    """Test bulk URL creation reports per-item results"""
+    token = await get_auth_token()
+    
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post(
+            "/api/v1/urls/batch",
+            json={
+                "items": [
+                    {"original_url": "https://www.example.com/one"},
+                    {"original_url": "https://www.example.com/two", "custom_short_code": "batch01"},
+                    {"original_url": "not-a-url"},
+                    {"original_url": "https://www.example.com/dup", "custom_short_code": "batch01"}
+                ]
+            },
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["created"] == 2
+        assert data["failed"] == 2
+        assert data["results"][1]["url"]["short_code"] == "batch01"
+        assert data["results"][2]["error"]
+        assert data["results"][3]["error"] == "Duplicate custom short code in batch"